@@ -184,7 +184,7 @@ def restore(body: RestoreBackupBody):
             restore_backup.restore()
             backups.append(backup_dir.name)
 
-    index_everything()
+    index_everything(full=True)
     return {"msg": f"Restored successfully", "backups": backups}, 200
 
 
@@ -1,28 +1,148 @@
+import mimetypes
+import os
+import struct
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Literal
 from flask_openapi3 import Tag
 from flask_openapi3 import APIBlueprint
 from pydantic import BaseModel, Field
-from flask import send_from_directory
+from flask import Response, request, send_from_directory
+from werkzeug.http import generate_etag
 
+from app.config import UserConfig
+from app.lib.imagepack import ImagePack, get_image_dir, read_image
 from app.settings import Defaults, Paths
+from app.store.thumbnails import ThumbnailStore
 
 bp_tag = Tag(
     name="Images", description="Image filenames are constructured as '{itemhash}.webp'"
 )
 api = APIBlueprint("imgserver", __name__, url_prefix="/img", abp_tags=[bp_tag])
 
+# INFO: Images are named by hash, so browsers can keep them without asking again
+IMAGE_MAX_AGE = 60 * 60 * 24 * 30
+# INFO: The image kinds shown in grids and lists, which are kept in memory
+CACHED_KINDS = {"sm", "xsm", "artist_sm"}
+
+MAX_BATCH_SIZE = 100
+BATCH_MAGIC = b"SWIB"
+# magic, thumbnail count
+BATCH_HEADER = struct.Struct("<4sI")
+BATCH_LENGTH = struct.Struct("<I")
+
+
+class ImageCache:
+    """
+    Keeps recently served small images in memory, so that a grid of cards
+    is served without opening a file per image.
+
+    Entries are keyed by (kind, hash) and hold a version, the source mtime
+    from the thumbnail manifest, so that a replaced thumbnail is read again.
+    When the cache grows past `UserConfig.imageCacheSize`, the least
+    recently used images are evicted.
+
+    The fallback images are read once and never evicted.
+    """
+
+    # {(kind, hash): (version, data, etag)}, least recently used first
+    entries: OrderedDict[tuple[str, str], tuple[float, bytes, str]] = OrderedDict()
+    size: int = 0
+    # {filename: (data, etag)}
+    fallbacks: dict[str, tuple[bytes, str] | None] = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key: tuple[str, str], version: float = 0):
+        """
+        Returns the data and ETag of a cached image,
+        or None if it's not cached or has been replaced.
+        """
+        with cls.lock:
+            entry = cls.entries.get(key)
+
+            if entry is None or entry[0] != version:
+                return None
+
+            cls.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    @classmethod
+    def set(cls, key: tuple[str, str], data: bytes, version: float = 0):
+        """
+        Caches an image, evicting the least recently used images
+        if the cache is over its budget. Returns its data and ETag.
+        """
+        etag = generate_etag(data)
+        budget = UserConfig().imageCacheSize * 1024 * 1024
+
+        with cls.lock:
+            old = cls.entries.pop(key, None)
+
+            if old is not None:
+                cls.size -= len(old[1])
+
+            cls.entries[key] = (version, data, etag)
+            cls.size += len(data)
+
+            while cls.size > budget and cls.entries:
+                _, (_, evicted, _) = cls.entries.popitem(last=False)
+                cls.size -= len(evicted)
+
+        return data, etag
+
+    @classmethod
+    def get_fallback(cls, filename: str):
+        """
+        Returns the data and ETag of a fallback image from the assets
+        folder, or None if it doesn't exist.
+        """
+        if filename in cls.fallbacks:
+            return cls.fallbacks[filename]
+
+        try:
+            with open(os.path.join(Paths.get_assets_path(), filename), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = None
+
+        entry = None if data is None else (data, generate_etag(data))
+        cls.fallbacks[filename] = entry
+        return entry
+
+
+def image_response(data: bytes, etag: str, mimetype: str = "image/webp"):
+    """
+    Returns an image that browsers can cache,
+    or a 304 if the request's ETag matches.
+    """
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    response.cache_control.immutable = True
+
+    return response.make_conditional(request)
+
 
 def send_fallback_img(filename: str = "default.webp"):
     """
     Returns the fallback image from the assets folder.
     """
-    folder = Paths.get_assets_path()
-    img = Path(folder) / filename
+    fallback = ImageCache.get_fallback(filename)
 
-    if not img.exists():
+    if fallback is None:
         return "", 404
 
-    return send_from_directory(folder, filename)
+    data, etag = fallback
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    # INFO: The image may be saved later, so browsers need to check again
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
 
 
 def send_file_or_fallback(folder: str, filename: str, fallback: str = "default.webp"):
@@ -37,6 +157,76 @@ def send_file_or_fallback(folder: str, filename: str, fallback: str = "default.w
     return send_fallback_img(fallback)
 
 
+def get_cached_image(kind: str, hash: str, version: float = 0):
+    """
+    Returns the data and ETag of a small image from the memory cache,
+    reading and caching it if it's not cached. Returns None if it's not saved.
+    """
+    cached = ImageCache.get((kind, hash), version)
+
+    if cached is not None:
+        return cached
+
+    data = read_image(kind, hash)
+
+    if data is None:
+        return None
+
+    return ImageCache.set((kind, hash), data, version)
+
+
+def send_cached_image(kind: str, hash: str, fallback: str, version: float = 0):
+    """
+    Returns a small image from the memory cache, or the fallback image.
+    """
+    cached = get_cached_image(kind, hash, version)
+
+    if cached is None:
+        return send_fallback_img(fallback)
+
+    return image_response(*cached)
+
+
+def send_image(
+    kind: str, filename: str, fallback: str = "default.webp", version: float = 0
+):
+    """
+    Returns an image from the image pack or from its folder,
+    or the fallback image.
+    """
+    hash = filename.removesuffix(".webp")
+
+    if kind in CACHED_KINDS:
+        return send_cached_image(kind, hash, fallback, version)
+
+    packed = ImagePack.get(kind, hash)
+
+    if packed is not None:
+        return image_response(*packed)
+
+    folder = get_image_dir(kind)
+
+    if not os.path.exists(os.path.join(folder, filename)):
+        return send_fallback_img(fallback)
+
+    response = send_from_directory(folder, filename, max_age=IMAGE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
+def send_thumbnail(size: str, filename: str):
+    """
+    Returns an album thumbnail, or the fallback image if the thumbnail
+    manifest has none, without checking the disk.
+    """
+    hash = filename.removesuffix(".webp")
+
+    if not ThumbnailStore.has(hash, size):
+        return send_fallback_img()
+
+    return send_image(size, filename, version=ThumbnailStore.get_source_mtime(hash))
+
+
 class ImagePath(BaseModel):
     imgpath: str = Field(
         description="The image filename",
@@ -64,8 +254,7 @@ def send_lg_thumbnail(path: ImagePath):
     """
     Get large thumbnail (500 x 500)
     """
-    folder = Paths.get_lg_thumb_path()
-    return send_file_or_fallback(folder, path.imgpath)
+    return send_thumbnail("lg", path.imgpath)
 
 
 @api.get("/thumbnail/xsmall/<imgpath>")
@@ -73,8 +262,7 @@ def send_xsm_thumbnail(path: ImagePath):
     """
     Get extra small thumbnail (64px)
     """
-    folder = Paths.get_xsm_thumb_path()
-    return send_file_or_fallback(folder, path.imgpath)
+    return send_thumbnail("xsm", path.imgpath)
 
 
 @api.get("/thumbnail/small/<imgpath>")
@@ -82,8 +270,7 @@ def send_sm_thumbnail(path: ImagePath):
     """
     Get small thumbnail (96px)
     """
-    folder = Paths.get_sm_thumb_path()
-    return send_file_or_fallback(folder, path.imgpath)
+    return send_thumbnail("sm", path.imgpath)
 
 
 @api.get("/thumbnail/medium/<imgpath>")
@@ -91,8 +278,47 @@ def send_md_thumbnail(path: ImagePath):
     """
     Get medium thumbnail (256px)
     """
-    folder = Paths.get_md_thumb_path()
-    return send_file_or_fallback(folder, path.imgpath)
+    return send_thumbnail("md", path.imgpath)
+
+
+class ThumbnailBatchBody(BaseModel):
+    albumhashes: list[str] = Field(
+        description="The albumhashes of the thumbnails, in the order they are returned",
+        example=[Defaults.API_ALBUMHASH],
+    )
+    size: Literal["xsmall", "small"] = Field(
+        "small", description="The thumbnail size (64px or 96px)"
+    )
+
+
+@api.post("/thumbnail/batch")
+def send_thumbnail_batch(body: ThumbnailBatchBody):
+    """
+    Get many thumbnails at once
+
+    Returns the small thumbnails of many albums in one response, so that a screen of cards takes one request.
+
+    The response is binary: an 8 byte header (the bytes "SWIB" and the number of thumbnails as a little-endian uint32), followed by the thumbnails in the order of the albumhashes. Each thumbnail is its length as a little-endian uint32, then its WebP data. A length of 0 means the album has no thumbnail, and the fallback image should be shown.
+
+    NOTE: Only the first 100 albumhashes are returned.
+    """
+    kind = "xsm" if body.size == "xsmall" else "sm"
+    albumhashes = body.albumhashes[:MAX_BATCH_SIZE]
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, len(albumhashes))]
+
+    for albumhash in albumhashes:
+        thumbnail = None
+
+        if ThumbnailStore.has(albumhash, kind):
+            thumbnail = get_cached_image(
+                kind, albumhash, ThumbnailStore.get_source_mtime(albumhash)
+            )
+
+        data = b"" if thumbnail is None else thumbnail[0]
+        parts.append(BATCH_LENGTH.pack(len(data)))
+        parts.append(data)
+
+    return Response(b"".join(parts), mimetype="application/octet-stream")
 
 
 # ARTISTS
@@ -101,8 +327,7 @@ def send_lg_artist_image(path: ImagePath):
     """
     Get large artist image (500 x 500)
     """
-    folder = Paths.get_lg_artist_img_path()
-    return send_file_or_fallback(folder, path.imgpath, "artist.webp")
+    return send_image("artist_lg", path.imgpath, "artist.webp")
 
 
 @api.get("/artist/small/<imgpath>")
@@ -110,8 +335,7 @@ def send_sm_artist_image(path: ImagePath):
     """
     Get small artist image (128)
     """
-    folder = Paths.get_sm_artist_img_path()
-    return send_file_or_fallback(folder, path.imgpath, "artist.webp")
+    return send_image("artist_sm", path.imgpath, "artist.webp")
 
 
 @api.get("/artist/medium/<imgpath>")
@@ -119,8 +343,7 @@ def send_md_artist_image(path: ImagePath):
     """
     Get medium artist image (256px)
     """
-    folder = Paths.get_md_artist_img_path()
-    return send_file_or_fallback(folder, path.imgpath, "artist.webp")
+    return send_image("artist_md", path.imgpath, "artist.webp")
 
 
 # PLAYLISTS
@@ -4,7 +4,7 @@ All playlist-related routes.
 
 import json
 from datetime import datetime
-import pathlib
+from io import BytesIO
 
 from PIL import UnidentifiedImageError, Image
 from pydantic import BaseModel, Field
@@ -18,6 +18,7 @@ from app.lib import playlistlib
 from app.lib.albumslib import sort_by_track_no
 from app.lib.home.recentlyadded import get_recently_added_playlist
 from app.lib.home.recentlyplayed import get_recently_played_playlist
+from app.lib.imagepack import read_image
 from app.lib.sortlib import sort_tracks
 from app.models.playlist import Playlist
 from app.serializers.playlist import serialize_for_card
@@ -25,7 +26,6 @@ from app.serializers.track import serialize_tracks
 
 from app.store.tracks import TrackStore
 from app.utils.dates import create_new_date, date_string_to_time_passed
-from app.settings import Paths
 
 tag = Tag(name="Playlists", description="Get and manage playlists")
 api = APIBlueprint("playlists", __name__, url_prefix="/playlists", abp_tags=[tag])
@@ -227,7 +227,8 @@ def get_playlist(path: PlaylistIDPath, query: GetPlaylistQuery):
         query.limit = len(playlist.trackhashes) - 1
 
     tracks = TrackStore.get_tracks_by_trackhashes(
-        playlist.trackhashes[query.start : query.start + query.limit]
+        playlist.trackhashes[query.start : query.start + query.limit],
+        keep_duplicates=True,
     )
     duration = sum(t.duration for t in tracks)
     playlist._last_updated = date_string_to_time_passed(playlist.last_updated)
@@ -431,16 +432,10 @@ def save_item_as_playlist(body: SavePlaylistAsItemBody):
     # save image
     if itemtype != "folder" and itemtype != "tracks":
         filename = itemhash + ".webp"
+        data = read_image("artist_lg" if itemtype == "artist" else "lg", itemhash)
 
-        base_path = (
-            Paths.get_lg_artist_img_path()
-            if itemtype == "artist"
-            else Paths.get_lg_thumb_path()
-        )
-        img_path = pathlib.Path(base_path + "/" + filename)
-
-        if img_path.exists():
-            img = Image.open(img_path)
+        if data is not None:
+            img = Image.open(BytesIO(data))
             playlistlib.save_p_image(
                 img, str(playlist.id), "image/webp", filename=filename
             )
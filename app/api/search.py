@@ -2,6 +2,10 @@
 Contains all the search routes.
 """
 
+import threading
+import time
+from collections import OrderedDict
+
 from unidecode import unidecode
 from pydantic import Field
 from flask_openapi3 import Tag
@@ -10,8 +14,13 @@ from flask_openapi3 import APIBlueprint
 from app import models
 from app.api.apischemas import GenericLimitSchema
 from app.lib import searchlib
+from app.serializers.album import serialize_for_card_many
+from app.serializers.track import serialize_tracks
 from app.settings import Defaults
+from app.store.albums import AlbumStore
+from app.store.artists import ArtistStore
 from app.store.tracks import TrackStore
+from app.utils.auth import get_current_userid
 
 
 tag = Tag(name="Search", description="Search for tracks, albums and artists")
@@ -21,6 +30,65 @@ SEARCH_COUNT = 30
 """The max amount of items to return per request"""
 
 
+class SearchCache:
+    """
+    Holds the ranked result hashes of recent searches, so that paging
+    through results with `/search/loadmore` does not rescore the library.
+
+    Entries are keyed by (userid, query, type) and evicted when they are
+    older than `ttl` seconds or when the cache is over `max_entries`,
+    least recently used first.
+    """
+
+    max_entries: int = 256
+    ttl: int = 300
+    """The number of seconds a search result is kept"""
+
+    # {(userid, query, type): (timestamp, hashes)}
+    entries: OrderedDict[tuple[int, str, str], tuple[float, list[str]]] = OrderedDict()
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key: tuple[int, str, str]) -> list[str] | None:
+        """
+        Returns the cached hashes for the given key, if still fresh.
+        """
+        with cls.lock:
+            entry = cls.entries.get(key)
+
+            if entry is None:
+                return None
+
+            timestamp, hashes = entry
+
+            if time.monotonic() - timestamp > cls.ttl:
+                del cls.entries[key]
+                return None
+
+            cls.entries.move_to_end(key)
+            return hashes
+
+    @classmethod
+    def set(cls, key: tuple[int, str, str], hashes: list[str]):
+        """
+        Caches the hashes for the given key, evicting expired
+        and least recently used entries.
+        """
+        with cls.lock:
+            now = time.monotonic()
+            cls.entries[key] = (now, hashes)
+            cls.entries.move_to_end(key)
+
+            # INFO: Evict from the least recently used end
+            while cls.entries:
+                oldest_key, (timestamp, _) = next(iter(cls.entries.items()))
+
+                if len(cls.entries) <= cls.max_entries and now - timestamp <= cls.ttl:
+                    break
+
+                del cls.entries[oldest_key]
+
+
 class Search:
     def __init__(self, query: str) -> None:
         self.tracks: list[models.Track] = []
@@ -31,7 +99,6 @@ class Search:
         Calls :class:`SearchTracks` which returns the tracks that fuzzily match
         the search terms. Then adds them to the `SearchResults` store.
         """
-        self.tracks = TrackStore.get_flat_list()
         return searchlib.TopResults().search(self.query, tracks_only=True)
 
     def search_artists(self):
@@ -53,6 +120,47 @@ class Search:
         finder = searchlib.TopResults()
         return finder.search(self.query, limit=limit)
 
+    def get_hashes(self, item_type: str) -> list[str]:
+        """
+        Returns the ranked hashes of the given item type,
+        from the search cache when possible.
+        """
+        key = (get_current_userid(), self.query, item_type)
+        hashes = SearchCache.get(key)
+
+        if hashes is not None:
+            return hashes
+
+        if item_type == "tracks":
+            hashes = [t.trackhash for t in self.search_tracks()]
+        elif item_type == "albums":
+            hashes = [a.albumhash for a in self.search_albums()]
+        else:
+            hashes = [a.artisthash for a in self.search_artists()]
+
+        SearchCache.set(key, hashes)
+        return hashes
+
+    def get_page(self, item_type: str, start: int = 0):
+        """
+        Returns a page of `SEARCH_COUNT` results of the given item type.
+        """
+        hashes = self.get_hashes(item_type)
+        page = hashes[start : start + SEARCH_COUNT]
+
+        if item_type == "tracks":
+            items = serialize_tracks(TrackStore.get_tracks_by_trackhashes(page))
+        elif item_type == "albums":
+            albums = (AlbumStore.get_album_by_hash(h) for h in page)
+            items = serialize_for_card_many([a for a in albums if a is not None])
+        else:
+            items = ArtistStore.get_artists_by_hashes(page)
+
+        return {
+            item_type: items,
+            "more": len(hashes) > start + SEARCH_COUNT,
+        }
+
 
 class SearchQuery(GenericLimitSchema):
     q: str = Field(description="The search query", example=Defaults.API_ARTISTNAME)
@@ -64,12 +172,7 @@ def search_tracks(query: SearchQuery):
     """
     Search tracks
     """
-    tracks = Search(query.q).search_tracks()
-
-    return {
-        "tracks": tracks[:SEARCH_COUNT],
-        "more": len(tracks) > SEARCH_COUNT,
-    }
+    return Search(query.q).get_page("tracks")
 
 
 @api.get("/albums")
@@ -79,12 +182,7 @@ def search_albums(
     """
     Search albums.
     """
-    albums = Search(query.q).search_albums()
-
-    return {
-        "albums": albums[:SEARCH_COUNT],
-        "more": len(albums) > SEARCH_COUNT,
-    }
+    return Search(query.q).get_page("albums")
 
 
 @api.get("/artists")
@@ -95,12 +193,7 @@ def search_artists(query: SearchQuery):
     if not query.q:
         return {"error": "No query provided"}, 400
 
-    artists = Search(query.q).search_artists()
-
-    return {
-        "artists": artists[:SEARCH_COUNT],
-        "more": len(artists) > SEARCH_COUNT,
-    }
+    return Search(query.q).get_page("artists")
 
 
 class TopResultsQuery(SearchQuery):
@@ -134,32 +227,13 @@ def search_load_more(query: SearchLoadMoreQuery):
 
     Returns more songs, albums or artists from a search query.
 
-    NOTE: You must first initiate a search using the `/search` endpoint.
+    NOTE: Results are cached per user and query for a few minutes, so pages
+    after the first are sliced from the cached ranking.
     """
-    q = query.q
-    item_type = query.type
-    index = query.start
-
-    if item_type == "tracks":
-        t = Search(q).search_tracks()
-        return {
-            "tracks": t[index : index + SEARCH_COUNT],
-            "more": len(t) > index + SEARCH_COUNT,
-        }
+    if query.type not in ("tracks", "albums", "artists"):
+        return {"error": "Invalid search type"}, 400
 
-    elif item_type == "albums":
-        a = Search(q).search_albums()
-        return {
-            "albums": a[index : index + SEARCH_COUNT],
-            "more": len(a) > index + SEARCH_COUNT,
-        }
-
-    elif item_type == "artists":
-        a = Search(q).search_artists()
-        return {
-            "artists": a[index : index + SEARCH_COUNT],
-            "more": len(a) > index + SEARCH_COUNT,
-        }
+    return Search(query.q).get_page(query.type, query.start)
 
 
 # TODO: Rewrite this file using generators where possible
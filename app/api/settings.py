@@ -116,8 +116,10 @@ class SetSettingBody(BaseModel):
 def trigger_scan():
     """
     Triggers scan for new music
+
+    Every file is checked, so that tags edited in place are picked up.
     """
-    index_everything()
+    index_everything(verify=True)
     return {"msg": "Scan triggered!"}
 
 
@@ -156,7 +158,7 @@ def update_config(body: UpdateConfigBody):
     }
 
     if body.key in reset_stores_lists:
-        index_everything()
+        index_everything(full=True)
 
     return {
         "msg": "Config updated!",
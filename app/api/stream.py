@@ -3,8 +3,7 @@ Contains all the track routes.
 """
 
 import os
-import tempfile
-import time
+import uuid
 from typing import Literal
 
 from flask import send_file, request, Response
@@ -12,29 +11,29 @@ from flask_openapi3 import APIBlueprint, Tag
 from pydantic import BaseModel, Field
 from app.api.apischemas import TrackHashSchema
 from app.lib.trackslib import get_silence_paddings
-from app.lib.transcoder import start_transcoding
+from app.lib.waveform import get_waveform
+from app.lib.transcodecache import TranscodeCache
+from app.lib.transcoder import (
+    CHUNK_SIZE,
+    FORMATS,
+    PRIORITY_PLAYBACK,
+    PRIORITY_PREFETCH,
+    TranscodeJobs,
+    TranscodeStream,
+)
+from app.models import Track
 
 from app.store.tracks import TrackStore
-from app.utils.files import guess_mime_type
+from app.utils.files import guess_mime_type, warm_file
+from app.utils.threading import background
 
 bp_tag = Tag(name="File", description="Audio files")
 api = APIBlueprint("track", __name__, url_prefix="/file", abp_tags=[bp_tag])
 
-
-class TransCodeStore:
-    map: dict[str, str] = {}
-
-    @classmethod
-    def add_file(cls, trackhash: str, filepath: str):
-        cls.map[trackhash] = filepath
-
-    @classmethod
-    def remove_file(cls, trackhash: str):
-        del cls.map[trackhash]
-
-    @classmethod
-    def find(cls, trackhash: str):
-        return cls.map.get(trackhash)
+MAX_PREFETCH = 5
+WAVEFORM_MAX_AGE = 60 * 60 * 24 * 7
+# INFO: How much of an original file to read ahead when prefetching
+PREFETCH_BYTES = 4 * 1024 * 1024
 
 
 class SendTrackFileQuery(BaseModel):
@@ -51,6 +50,51 @@ class SendTrackFileQuery(BaseModel):
     )
 
 
+def find_track(trackhash: str, filepath: str | None = None) -> Track | None:
+    """
+    Returns the track with the given filepath if it exists. Otherwise, returns
+    the highest bitrate copy of the track with the given trackhash that exists.
+    """
+    if filepath:
+        tracks = TrackStore.get_tracks_by_filepaths([filepath])
+
+        if len(tracks) > 0 and os.path.exists(filepath):
+            return tracks[0]
+
+    res = TrackStore.trackhashmap.get(trackhash)
+
+    if res is None:
+        return None
+
+    for track in sorted(res.tracks, key=lambda x: x.bitrate, reverse=True):
+        if os.path.exists(track.filepath):
+            return track
+
+    return None
+
+
+def is_valid_quality(quality: str):
+    """
+    Returns whether the quality is "original" or a bitrate in kbps.
+    """
+    return quality == "original" or (quality.isdecimal() and int(quality) > 0)
+
+
+def get_transcode_bitrate(track: Track, quality: str, container: str):
+    """
+    Returns the bitrate to transcode a track to, in FFmpeg's format (eg. "320k").
+    """
+    # prevent requesting over transcoding
+    max_bitrate = track.bitrate
+    requested_bitrate = int(quality)
+
+    if container != "flac":
+        # drop to 320 for non-flac containers
+        requested_bitrate = min(320, requested_bitrate)
+
+    return f"{min(max_bitrate, requested_bitrate)}k"
+
+
 @api.get("/<trackhash>/legacy")
 def send_track_file_legacy(path: TrackHashSchema, query: SendTrackFileQuery):
     """
@@ -64,23 +108,7 @@ def send_track_file_legacy(path: TrackHashSchema, query: SendTrackFileQuery):
     filepath = query.filepath
     msg = {"msg": "File Not Found"}
 
-    track = None
-    tracks = TrackStore.get_tracks_by_filepaths([filepath])
-
-    if len(tracks) > 0 and os.path.exists(filepath):
-        track = tracks[0]
-    else:
-        res = TrackStore.trackhashmap.get(trackhash)
-
-        # When finding by trackhash, sort by bitrate
-        # and get the first track that exists
-        if res is not None:
-            tracks = sorted(res.tracks, key=lambda x: x.bitrate, reverse=True)
-
-            for t in tracks:
-                if os.path.exists(t.filepath):
-                    track = t
-                    break
+    track = find_track(trackhash, filepath)
 
     if track is not None:
         audio_type = guess_mime_type(filepath)
@@ -107,199 +135,249 @@ def send_track_file(path: TrackHashSchema, query: SendTrackFileQuery):
     trackhash = path.trackhash
     filepath = query.filepath
 
-    # If filepath is provided, try to send that
-    track = None
-    tracks = TrackStore.get_tracks_by_filepaths([filepath])
-
-    if len(tracks) > 0 and os.path.exists(filepath):
-        track = tracks[0]
-    else:
-        res = TrackStore.trackhashmap.get(trackhash)
-
-        # When finding by trackhash, sort by bitrate
-        # and get the first track that exists
-        if res is not None:
-            tracks = sorted(res.tracks, key=lambda x: x.bitrate, reverse=True)
-
-            for t in tracks:
-                if os.path.exists(t.filepath):
-                    track = t
-                    break
+    track = find_track(trackhash, filepath)
 
     if track is not None:
         if query.quality == "original":
-            return send_file_as_chunks(track.filepath)
-
-        # prevent requesting over transcoding
-        max_bitrate = track.bitrate
-        requested_bitrate = int(query.quality)
-
-        if query.container != "flac":
-            # drop to 320 for non-flac containers
-            requested_bitrate = min(320, requested_bitrate)
+            return send_file_range(track.filepath)
 
-        quality = f"{min(max_bitrate, requested_bitrate)}k"
+        quality = get_transcode_bitrate(track, query.quality, query.container)
         return transcode_and_stream(trackhash, track.filepath, quality, query.container)
 
     return {"msg": "File Not Found"}, 404
 
 
-def transcode_and_stream(trackhash: str, filepath: str, bitrate: str, container: str):
+@api.get("/<trackhash>/waveform")
+def send_track_waveform(path: TrackHashSchema):
     """
-    Initiates transcoding and returns the first chunk of the transcoded file.
+    Get a track's waveform
+
+    Returns the peaks of the track's waveform, for drawing seek bars. Waveforms are generated on the first request.
 
-    The other chunks are streamed on subsequent requests and are rerouted to `send_file_as_chunks`.
+    The response is binary: a 9 byte header (the bytes "SWWF", a version byte and the number of peaks as a little-endian uint32), followed by a signed byte for the minimum and the maximum of each peak.
     """
-    temp_file = TransCodeStore.find(trackhash)
-    if temp_file is not None:
-        return send_file_as_chunks(temp_file)
-
-    format_params = {
-        "mp3": ["-c:a", "libmp3lame"],
-        "aac": ["-c:a", "aac"],
-        "webm": ["-c:a", "libopus"],
-        "ogg": ["-c:a", "libvorbis"],
-        "flac": ["-c:a", "flac"],
-        "wav": ["-c:a", "pcm_s16le"],
-    }
-
-    # Create a temporary file
-    format = f".{container}" if container in format_params.keys() else ".flac"
-    container_args = (
-        format_params[container]
-        if container in format_params.keys()
-        else format_params["flac"]
+    track = find_track(path.trackhash)
+
+    if track is None:
+        return {"msg": "File Not Found"}, 404
+
+    waveform = get_waveform(track)
+
+    if waveform is None:
+        return {"msg": "Failed to generate the waveform"}, 500
+
+    return send_file(
+        waveform,
+        mimetype="application/octet-stream",
+        conditional=True,
+        etag=os.path.basename(waveform),
+        max_age=WAVEFORM_MAX_AGE,
     )
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=format)
-    temp_filename = temp_file.name
-    temp_file.close()
 
-    TransCodeStore.add_file(trackhash, temp_filename)
-    start_transcoding(filepath, temp_filename, bitrate, container_args)
 
-    chunk_size = 1024 * 512  # 0.5MB
-    file_size = os.path.getsize(filepath)
+def transcode_and_stream(trackhash: str, filepath: str, bitrate: str, container: str):
+    """
+    Streams a transcoded file.
 
-    def generate():
-        # Poll for the output file
-        while (
-            not os.path.exists(temp_filename)
-            or os.path.getsize(temp_filename) < chunk_size
-        ):
-            print(f"Waiting for transcoding to complete... filename: {temp_filename}")
-            time.sleep(0.1)  # Wait for 100ms before checking again
-
-        with open(temp_filename, "rb") as file:
-            file.seek(0)
-            return file.read(chunk_size)
-
-    audio_type = guess_mime_type(temp_filename)
+    Completed transcodes are served from the transcode cache, with Range support
+    and their real length. Otherwise, FFmpeg's output is streamed as a chunked
+    response while it is being encoded, and saved to the cache once it completes.
+    """
+    if container not in FORMATS:
+        container = "flac"
+
+    filename = TranscodeCache.get_filename(
+        trackhash, os.path.getmtime(filepath), bitrate, container
+    )
+    cached = TranscodeCache.find(filename)
+    if cached is not None:
+        response = send_file(
+            cached, mimetype=guess_mime_type(cached), conditional=True
+        )
+        response.headers.add("X-Transcoded-Bitrate", bitrate)
+        return response
+
+    job = start_transcode(filename, filepath, bitrate, container, attach=True)
+    audio_type = guess_mime_type(filename)
     response = Response(
-        generate(),
-        206,
+        TranscodeStream(job),
+        200,
         mimetype=audio_type,
         content_type=audio_type,
         direct_passthrough=True,
     )
-    response.headers.add("Content-Range", f"bytes {0}-{chunk_size}/{file_size}")
-    response.headers.add("Accept-Ranges", "bytes")
     response.headers.add("X-Transcoded-Bitrate", bitrate)
     return response
 
 
-def send_file_as_chunks(filepath: str) -> Response:
+def start_transcode(
+    filename: str,
+    filepath: str,
+    bitrate: str,
+    container: str,
+    priority: int = PRIORITY_PLAYBACK,
+    attach: bool = False,
+):
     """
-    Returns a Response object that streams the file in chunks.
+    Returns the job transcoding a file into the cache, starting one if needed.
+    If `attach` is True, the caller is added as a reader of the job.
     """
-    # NOTE: +1 makes sure the last byte is included in the range.
-    # NOTE: -1 is used to convert the end index to a 0-based index.
-    chunk_size = 1024 * 512  # 0.5MB
+    part_path = TranscodeCache.get_part_path(filename)
+
+    def on_done(success: bool):
+        if success:
+            return TranscodeCache.commit(filename, part_path)
+
+        TranscodeCache.discard(part_path)
+
+    return TranscodeJobs.get_or_start(
+        filename,
+        filepath,
+        part_path,
+        bitrate,
+        container,
+        on_done=on_done,
+        priority=priority,
+        attach=attach,
+    )
 
-    # Get file size
-    file_size = os.path.getsize(filepath)
-    start = 0
-    end = chunk_size
 
-    # Read range header
-    range_header = request.headers.get("Range")
-    if range_header:
-        start = get_start_range(range_header)
+def send_file_range(filepath: str) -> Response:
+    """
+    Returns the requested byte ranges of a complete file.
+
+    Single ranges (including open-ended and suffix ranges) are handled by
+    `send_file`, which streams the file through the server's file wrapper
+    instead of reading it into memory. Requests with multiple ranges get a
+    multipart/byteranges response.
+    """
+    audio_type = guess_mime_type(filepath)
+    ranges = request.range
+
+    if ranges is None or len(ranges.ranges) < 2:
+        response = send_file(filepath, mimetype=audio_type, conditional=True)
+    else:
+        response = send_multiple_ranges(filepath, audio_type, ranges.ranges)
 
-        # If start + chunk_size is greater than file_size,
-        # set end to file_size - 1
-        _end = start + chunk_size - 1
+    response.headers.add("Access-Control-Expose-Headers", "Content-Range")
+    return response
 
-        if _end > file_size:
-            end = file_size - 1
-        else:
-            end = _end
 
-    def generate_chunks():
-        with open(filepath, "rb") as file:
-            file.seek(start)
-            remaining_bytes = end - start + 1
+def send_multiple_ranges(
+    filepath: str, mimetype: str, ranges: list[tuple[int, int | None]]
+) -> Response:
+    """
+    Returns a multipart/byteranges response with the given (start, stop) ranges.
+    Stops are exclusive. A negative start without a stop is a suffix range.
+    """
+    file_size = os.path.getsize(filepath)
+    boundary = uuid.uuid4().hex
+    parts: list[tuple[bytes, int, int]] = []
 
-            retry_count = 0
-            max_retries = 10  # 5 * 100ms = 500ms total wait time
+    for start, stop in ranges:
+        if start < 0:
+            start, stop = max(file_size + start, 0), file_size
+        elif stop is None or stop > file_size:
+            stop = file_size
 
-            while remaining_bytes > 0 or retry_count < max_retries:
-                if retry_count == max_retries:
-                    print("💚 sending final chunk! ...")
+        if start >= stop:
+            continue
 
-                    pos = file.tell()
-                    chunk = file.read(os.path.getsize(filepath) - pos)
+        header = (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{file_size}\r\n\r\n"
+        ).encode()
+        parts.append((header, start, stop))
 
-                    return chunk, pos, True
+    if not parts:
+        response = Response(status=416)
+        response.headers.add("Content-Range", f"bytes */{file_size}")
+        return response
 
-                if remaining_bytes < chunk_size:
-                    time.sleep(0.25)
-                    retry_count += 1
-                    remaining_bytes = os.path.getsize(filepath) - file.tell()
-                    continue
+    closing = f"\r\n--{boundary}--\r\n".encode()
 
-                chunk = file.read(min(chunk_size, remaining_bytes))
-                if chunk:
-                    remaining_bytes -= len(chunk)
-                    return chunk, file.tell(), False
-                else:
-                    # If no data is read, wait for 100ms before retrying
-                    time.sleep(0.25)
-                    retry_count += 1
+    def generate():
+        with open(filepath, "rb") as file:
+            for header, start, stop in parts:
+                yield header
+                file.seek(start)
+                remaining = stop - start
 
-                    # update remaining bytes
-                    remaining_bytes = os.path.getsize(filepath) - file.tell()
-                    print(f"▶ Remaining bytes: {remaining_bytes}")
+                while remaining > 0:
+                    chunk = file.read(min(CHUNK_SIZE, remaining))
 
-            return None, 0, True
+                    if not chunk:
+                        return
 
-    data, position, is_final = generate_chunks()
+                    remaining -= len(chunk)
+                    yield chunk
+
+        yield closing
 
-    audio_type = guess_mime_type(filepath)
     response = Response(
-        response=data,
-        status=206,  # Partial Content status code
-        mimetype=audio_type,
-        content_type=audio_type,
+        generate(),
+        206,
+        mimetype=f"multipart/byteranges; boundary={boundary}",
         direct_passthrough=True,
     )
-
-    bytes_to_add = chunk_size if not is_final else 0
-    response.headers.add(
-        "Content-Range",
-        f"bytes {start}-{position}/{os.path.getsize(filepath) + bytes_to_add}",
+    response.content_length = (
+        sum(len(header) + stop - start for header, start, stop in parts)
+        + len(closing)
     )
-    response.headers.add("Access-Control-Expose-Headers", "Content-Range")
     response.headers.add("Accept-Ranges", "bytes")
     return response
 
 
-def get_start_range(range_header: str):
-    try:
-        range_start, range_end = range_header.strip().split("=")[1].split("-")
-        return int(range_start)
+class PrefetchBody(BaseModel):
+    trackhashes: list[str] = Field(
+        description="The trackhashes of the next tracks in the queue, in play order",
+        example=["a1b2c3d4e5"],
+    )
+    quality: str = SendTrackFileQuery.model_fields["quality"]
+    container: Literal["mp3", "aac", "flac", "webm", "ogg"] = (
+        SendTrackFileQuery.model_fields["container"]
+    )
+
+
+@api.post("/prefetch")
+def prefetch_tracks(body: PrefetchBody):
+    """
+    Prefetch the next tracks
+
+    Prepares the next tracks in the queue so that they start playing without delay.
+
+    Transcodes are queued behind the ones being played and saved to the transcode cache. For the original quality, the OS is asked to read the start of each file ahead of time, which helps with slow disks and network mounts.
+
+    NOTE: Only the first 5 trackhashes are prefetched.
+    """
+    # INFO: Checked here, as errors in the background thread don't reach the client
+    if not is_valid_quality(body.quality):
+        return {"msg": "Invalid quality"}, 400
+
+    tracks = [find_track(h) for h in body.trackhashes[:MAX_PREFETCH]]
+    tracks = [t for t in tracks if t is not None]
+
+    prefetch(tracks, body.quality, body.container)
+    return {"trackhashes": [t.trackhash for t in tracks]}
+
+
+@background
+def prefetch(tracks: list[Track], quality: str, container: str):
+    for track in tracks:
+        if quality == "original":
+            warm_file(track.filepath, PREFETCH_BYTES)
+            continue
+
+        bitrate = get_transcode_bitrate(track, quality, container)
+        filename = TranscodeCache.get_filename(
+            track.trackhash, os.path.getmtime(track.filepath), bitrate, container
+        )
 
-    except ValueError:
-        return 0
+        if TranscodeCache.find(filename) is None:
+            start_transcode(
+                filename, track.filepath, bitrate, container, PRIORITY_PREFETCH
+            )
 
 
 class GetAudioSilenceBody(BaseModel):
@@ -11,9 +11,11 @@ import PyInstaller.__main__ as bundler
 from app import settings
 from app.config import UserConfig
 from app.db.userdata import UserTable
+from app.lib.imagepack import ImagePack
 from app.logger import log
 from app.print_help import HELP_MESSAGE
 from app.setup.sqlite import setup_sqlite
+from app.store.thumbnails import ThumbnailStore
 from app.utils.auth import hash_password
 from app.utils.paths import getFlaskOpenApiPath
 from app.utils.xdg_utils import get_xdg_config_dir
@@ -34,6 +36,8 @@ class ProcessArgs:
 
         # handles that exit
         self.handle_password_recovery()
+        self.handle_rebuild_thumbnails()
+        self.handle_compact_images()
         self.handle_build()
         self.handle_help()
         self.handle_version()
@@ -238,3 +242,24 @@ class ProcessArgs:
             UserTable.update_one({"id": user.id, "password": hash_password(password)})
 
             sys.exit(0)
+
+    @staticmethod
+    def handle_rebuild_thumbnails():
+        if ALLARGS.rebuild_thumbnails in ARGS:
+            setup_sqlite()
+
+            count = ThumbnailStore.rebuild()
+            print(f"Thumbnail manifest rebuilt: {count} thumbnails found")
+
+            sys.exit(0)
+
+    @staticmethod
+    def handle_compact_images():
+        if ALLARGS.compact_images in ARGS:
+            ImagePack.load()
+            before, after, files = ImagePack.compact()
+
+            print(f"Image pack compacted: {before / 1024**2:.1f} MB -> {after / 1024**2:.1f} MB")
+            print(f"{files} image files moved into the pack")
+
+            sys.exit(0)
@@ -41,6 +41,33 @@ class UserConfig:
     cleanAlbumTitle: bool = True
     showAlbumsAsSingles: bool = False
 
+    # indexing
+    # NOTE: The number of tracks written to the database per transaction
+    indexBatchSize: int = 1000
+    # NOTE: Directories listed in parallel. Raise it for network filesystems
+    scanThreads: int = 1
+
+    # streaming
+    # NOTE: The maximum size of the transcoded files cache, in MB
+    transcodeCacheSize: int = 2048
+    # NOTE: The maximum number of FFmpeg processes running at once
+    transcodeWorkers: int = 2
+
+    # analysis
+    # NOTE: Measures the loudness of each track for volume normalization
+    enableLoudnessAnalysis: bool = True
+    # NOTE: Generates seek bar waveforms after indexing, instead of on first request
+    generateWaveforms: bool = False
+    # NOTE: The number of tracks analyzed at once, at a low CPU priority
+    analysisWorkers: int = 1
+
+    # images
+    # NOTE: Saves thumbnails and artist images to one pack file instead of a file each
+    # Run with --compact-images to pack existing images and reclaim space
+    packImages: bool = False
+    # NOTE: The maximum size of the in-memory cache of small images, in MB
+    imageCacheSize: int = 32
+
     # misc
     enablePeriodicScans: bool = False
     scanInterval: int = 10
@@ -1,11 +1,13 @@
 from app.db import Base
 from app.db.utils import tracks_to_dataclasses
 from app.db.engine import DbEngine
-from sqlalchemy import JSON, Integer, String, delete, select
+from app.utils import chunk
+from sqlalchemy import JSON, Float, Integer, String, delete, select
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Mapped, mapped_column
 
 
-from typing import Any, Optional
+from typing import Any, Iterable, Optional
 
 
 # def create_all():
@@ -132,14 +134,48 @@ class TrackTable(Base):
             return tracks_to_dataclasses(result.fetchall())
 
     @classmethod
-    def get_tracks_by_filepaths(cls, filepaths: list[str]):
+    def get_scan_info(cls):
+        """
+        Returns the filepath, last_mod and trackhash of all tracks,
+        without loading the full rows.
+        """
         with DbEngine.manager() as conn:
             result = conn.execute(
-                select(TrackTable)
-                .where(TrackTable.filepath.in_(filepaths))
-                .order_by(TrackTable.last_mod)
+                select(TrackTable.filepath, TrackTable.last_mod, TrackTable.trackhash)
             )
-            return tracks_to_dataclasses(result.fetchall())
+            return result.fetchall()
+
+    @classmethod
+    def get_tracks_by_filepaths(cls, filepaths: Iterable[str]):
+        """
+        Returns the tracks of the given filepaths, ordered by last_mod.
+        """
+        tracks = []
+
+        with DbEngine.manager() as conn:
+            # INFO: Keep each statement under SQLite's variable limit
+            for filepaths_chunk in chunk(filepaths, 1000):
+                result = conn.execute(
+                    select(TrackTable).where(TrackTable.filepath.in_(filepaths_chunk))
+                )
+                tracks.extend(tracks_to_dataclasses(result.fetchall()))
+
+        tracks.sort(key=lambda t: t.last_mod)
+        return tracks
+
+    @classmethod
+    def get_extra(cls, filepath: str) -> dict[str, Any] | None:
+        """
+        Returns the extra tags read when the file was indexed,
+        or None if it's not indexed.
+        """
+        with DbEngine.manager() as conn:
+            result = conn.execute(
+                select(TrackTable.extra).where(TrackTable.filepath == filepath)
+            )
+            row = result.fetchone()
+
+        return None if row is None else row[0] or {}
 
     # @classmethod
     # def get_tracks_by_albumhash(cls, albumhash: str):
@@ -230,9 +266,13 @@ class TrackTable(Base):
     #     return tracks_to_dataclasses(result.fetchall())
 
     @classmethod
-    def remove_tracks_by_filepaths(cls, filepaths: set[str]):
+    def remove_tracks_by_filepaths(cls, filepaths: Iterable[str]):
         with DbEngine.manager(commit=True) as conn:
-            conn.execute(delete(TrackTable).where(TrackTable.filepath.in_(filepaths)))
+            # INFO: Keep each statement under SQLite's variable limit
+            for filepaths_chunk in chunk(filepaths, 1000):
+                conn.execute(
+                    delete(TrackTable).where(TrackTable.filepath.in_(filepaths_chunk))
+                )
 
     # @classmethod
     # def increment_playcount(cls, trackhash: str, duration: int, timestamp: int):
@@ -254,6 +294,128 @@ class TrackTable(Base):
     #             )
 
 
+class AnalysisTable(Base):
+    """
+    Results of audio analysis, like silence paddings, keyed by filepath.
+
+    Results are stored with the file's mtime, and are ignored once
+    the file has been modified.
+    """
+
+    __tablename__ = "analysis"
+
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    filepath: Mapped[str] = mapped_column(String(), index=True, unique=True)
+    last_mod: Mapped[float] = mapped_column(Float())
+    data: Mapped[dict[str, Any]] = mapped_column(JSON(), default_factory=dict)
+
+    @classmethod
+    def get_results(cls, filepath: str, last_mod: float) -> dict[str, Any]:
+        """
+        Returns the results for a file, or an empty dict if there are none
+        for its current mtime.
+        """
+        with DbEngine.manager() as conn:
+            result = conn.execute(
+                select(cls.last_mod, cls.data).where(cls.filepath == filepath)
+            ).first()
+
+        if result is None or result.last_mod != last_mod:
+            return {}
+
+        return result.data
+
+    @classmethod
+    def get_all_results(cls, filepaths: list[str] | None = None):
+        """
+        Returns {filepath: (last_mod, results)} for all files, or the given ones.
+        """
+        stmt = select(cls.filepath, cls.last_mod, cls.data)
+
+        if filepaths is None:
+            stmts = [stmt]
+        else:
+            # INFO: Keep each statement under SQLite's variable limit
+            stmts = (
+                stmt.where(cls.filepath.in_(filepaths_chunk))
+                for filepaths_chunk in chunk(filepaths, 1000)
+            )
+
+        with DbEngine.manager() as conn:
+            return {
+                row.filepath: (row.last_mod, row.data)
+                for stmt in stmts
+                for row in conn.execute(stmt)
+            }
+
+    @classmethod
+    def set_results(cls, filepath: str, last_mod: float, results: dict[str, Any]):
+        """
+        Adds results for a file, replacing any computed for an older mtime.
+        """
+        with DbEngine.manager(commit=True) as conn:
+            existing = conn.execute(
+                select(cls.last_mod, cls.data).where(cls.filepath == filepath)
+            ).first()
+
+            if existing is not None and existing.last_mod == last_mod:
+                results = {**existing.data, **results}
+
+            stmt = insert(cls).values(
+                filepath=filepath, last_mod=last_mod, data=results
+            )
+            conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[cls.filepath],
+                    set_={"last_mod": last_mod, "data": results},
+                )
+            )
+
+
+class ThumbnailTable(Base):
+    """
+    The album thumbnails that have been saved, with the sizes saved and
+    the mtime of the file the art was read from. See `ThumbnailStore`.
+    """
+
+    __tablename__ = "thumbnail"
+
+    id: Mapped[int] = mapped_column(init=False, primary_key=True)
+    hash: Mapped[str] = mapped_column(String(), index=True, unique=True)
+    sizes: Mapped[list[str]] = mapped_column(JSON())
+    source_mtime: Mapped[float] = mapped_column(Float())
+
+    @classmethod
+    def get_all(cls):
+        with DbEngine.manager() as conn:
+            result = conn.execute(select(cls.hash, cls.sizes, cls.source_mtime))
+            return result.fetchall()
+
+    @classmethod
+    def set_many(cls, entries: dict[str, tuple[list[str], float]]):
+        """
+        Adds or replaces the entries of the given hashes.
+        """
+        with DbEngine.manager(commit=True) as conn:
+            # INFO: Keep each statement under SQLite's variable limit
+            for entries_chunk in chunk(entries.items(), 1000):
+                stmt = insert(cls).values(
+                    [
+                        {"hash": hash, "sizes": sizes, "source_mtime": source_mtime}
+                        for hash, (sizes, source_mtime) in entries_chunk
+                    ]
+                )
+                conn.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[cls.hash],
+                        set_={
+                            "sizes": stmt.excluded.sizes,
+                            "source_mtime": stmt.excluded.source_mtime,
+                        },
+                    )
+                )
+
+
 # class AlbumTable(Base):
 #     __tablename__ = "album"
 
@@ -1,5 +1,5 @@
 import datetime
-from typing import Any, Literal
+from typing import Any, Iterable, Literal
 from sqlalchemy import (
     JSON,
     Boolean,
@@ -30,6 +30,7 @@ from app.db.utils import (
 )
 
 from app.db import Base
+from app.utils import chunk
 from app.utils.auth import get_current_userid, hash_password
 
 
@@ -188,6 +189,21 @@ class FavoritesTable(Base):
             result = conn.execute(select(cls))
             return favorites_to_dataclass(result.fetchall())
 
+    @classmethod
+    def get_by_hashes(cls, hashes: Iterable[str]):
+        """
+        Returns the favorites of the given item hashes.
+        """
+        favorites = []
+
+        with DbEngine.manager() as conn:
+            # INFO: Keep each statement under SQLite's variable limit
+            for hashes_chunk in chunk(hashes, 1000):
+                result = conn.execute(select(cls).where(cls.hash.in_(hashes_chunk)))
+                favorites.extend(favorites_to_dataclass(result.fetchall()))
+
+        return favorites
+
     @classmethod
     def insert_item(cls, item: dict[str, Any]):
         item["timestamp"] = int(datetime.datetime.now().timestamp())
@@ -281,6 +297,26 @@ class ScrobbleTable(Base):
 
         return tracklog_to_dataclasses(result.fetchall())
 
+    @classmethod
+    def get_by_trackhashes(cls, trackhashes: Iterable[str]):
+        """
+        Returns the current user's scrobbles of the given tracks.
+        """
+        userid = get_current_userid()
+        records = []
+
+        with DbEngine.manager() as conn:
+            # INFO: Keep each statement under SQLite's variable limit
+            for trackhashes_chunk in chunk(trackhashes, 1000):
+                result = conn.execute(
+                    select(cls).where(
+                        (cls.userid == userid) & cls.trackhash.in_(trackhashes_chunk)
+                    )
+                )
+                records.extend(tracklog_to_dataclasses(result.fetchall()))
+
+        return records
+
 
 class PlaylistTable(Base):
     __tablename__ = "playlist"
@@ -425,3 +461,24 @@ class LibDataTable(Base):
             select(cls.itemhash, cls.color).where(cls.itemtype == type)
         )
         return [{"itemhash": r[0], "color": r[1]} for r in result.fetchall()]
+
+    @classmethod
+    def get_colors_by_hashes(
+        cls, type: str, itemhashes: Iterable[str]
+    ) -> list[dict[str, str]]:
+        """
+        Returns the colors of the given items.
+        """
+        colors = []
+
+        with DbEngine.manager() as conn:
+            # INFO: Keep each statement under SQLite's variable limit
+            for itemhashes_chunk in chunk(itemhashes, 1000):
+                result = conn.execute(
+                    select(cls.itemhash, cls.color).where(
+                        (cls.itemtype == type) & cls.itemhash.in_(itemhashes_chunk)
+                    )
+                )
+                colors.extend({"itemhash": r[0], "color": r[1]} for r in result)
+
+        return colors
@@ -11,6 +11,7 @@ from requests.exceptions import ConnectionError as RequestConnectionError
 from requests.exceptions import ReadTimeout
 
 from app import settings
+from app.lib.imagepack import ImagePack, get_image_dir, image_exists
 from app.models.artist import Artist
 from app.store.artists import ArtistStore
 
@@ -95,17 +96,13 @@ class DownloadImage:
         if img is None:
             return
 
-        sm_path = Path(settings.Paths.get_sm_artist_img_path()) / name
-        lg_path = Path(settings.Paths.get_lg_artist_img_path()) / name
-        md_path = Path(settings.Paths.get_md_artist_img_path()) / name
-
         entries = [
-            (lg_path, None),  # save in the original size
-            (sm_path, settings.Defaults.SM_ARTIST_IMG_SIZE),
-            (md_path, settings.Defaults.MD_ARTIST_IMG_SIZE),
+            ("artist_lg", None),  # save in the original size
+            ("artist_sm", settings.Defaults.SM_ARTIST_IMG_SIZE),
+            ("artist_md", settings.Defaults.MD_ARTIST_IMG_SIZE),
         ]
 
-        self.save_img(img, entries)
+        self.save_img(img, name, entries)
 
     @staticmethod
     def download(url: str) -> Image.Image | None:
@@ -126,21 +123,32 @@ class DownloadImage:
                 return None
 
     @staticmethod
-    def save_img(img: Image.Image, entries: list[tuple[Path, int | None]]):
+    def save_img(img: Image.Image, name: str, entries: list[tuple[str, int | None]]):
         """
-        Saves the image to the destinations.
+        Saves the image in the given image kinds and sizes,
+        to the image pack if packing is enabled.
         """
         ratio = img.width / img.height
-        for entry in entries:
-            path, size = entry
+        packed: dict[str, bytes] = {}
 
-            if size is None:
-                img.save(path, format="webp")
-                continue
+        for kind, size in entries:
+            if size is not None:
+                resized = img.resize((size, int(size / ratio)), Image.LANCZOS)
+            else:
+                resized = img
 
-            img.resize((size, int(size / ratio)), Image.ANTIALIAS).save(
-                path, format="webp"
-            )
+            if ImagePack.enabled():
+                buffer = BytesIO()
+                resized.save(buffer, format="webp")
+                packed[kind] = buffer.getvalue()
+            else:
+                resized.save(Path(get_image_dir(kind)) / name, format="webp")
+
+        if packed:
+            ImagePack.append(name.removesuffix(".webp"), packed)
+        else:
+            # INFO: Older packed copies would be served instead of the files
+            ImagePack.remove(name.removesuffix(".webp"), [kind for kind, _ in entries])
 
 
 class CheckArtistImages:
@@ -150,7 +158,8 @@ class CheckArtistImages:
 
         # read all files in the artist image folder
         path = settings.Paths.get_sm_artist_img_path()
-        processed = [path.replace(".webp", "") for path in os.listdir(path)]
+        processed = {name.removesuffix(".webp") for name in os.listdir(path)}
+        processed.update(ImagePack.get_hashes("artist_sm"))
 
         unprocessed = [
             a for a in ArtistStore.get_flat_list() if a.artisthash not in processed
@@ -181,11 +190,7 @@ class CheckArtistImages:
         if CHECK_ARTIST_IMAGES_KEY != instance_key:
             return
 
-        img_path = (
-            Path(settings.Paths.get_sm_artist_img_path()) / f"{artist.artisthash}.webp"
-        )
-
-        if img_path.exists():
+        if image_exists("artist_sm", artist.artisthash):
             return
 
         url = get_artist_image_link(artist.name)
@@ -2,15 +2,16 @@
 Contains everything that deals with image color extraction.
 """
 
-from pathlib import Path
+from io import BytesIO
+from typing import BinaryIO
 
 import colorgram
 
-from app import settings
 
 from app.db.userdata import LibDataTable
 from app.logger import log
 from app.lib.errors import PopulateCancelledError
+from app.lib.imagepack import read_image
 from app.store.albums import AlbumStore
 from app.store.artists import ArtistStore
 from app.utils.progressbar import tqdm
@@ -19,7 +20,7 @@ PROCESS_ALBUM_COLORS_KEY = ""
 PROCESS_ARTIST_COLORS_KEY = ""
 
 
-def get_image_colors(image: str, count=1) -> list[str]:
+def get_image_colors(image: str | BinaryIO, count=1) -> list[str]:
     """Extracts n number of the most dominant colors from an image."""
     try:
         colors = sorted(colorgram.extract(image, count), key=lambda c: c.hsl.h)
@@ -36,17 +37,12 @@ def get_image_colors(image: str, count=1) -> list[str]:
 
 
 def process_color(item_hash: str, is_album=True):
-    path = (
-        settings.Paths.get_sm_thumb_path()
-        if is_album
-        else settings.Paths.get_sm_artist_img_path()
-    )
-    path = Path(path) / (item_hash + ".webp")
-
-    if not path.exists():
+    data = read_image("sm" if is_album else "artist_sm", item_hash)
+
+    if data is None:
         return
 
-    return get_image_colors(str(path))
+    return get_image_colors(BytesIO(data))
 
 
 class ProcessAlbumColors:
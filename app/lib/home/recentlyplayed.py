@@ -151,11 +151,11 @@ def get_recently_played(limit=7):
             if playlist is None:
                 continue
 
-            tracks = TrackStore.get_tracks_by_trackhashes(playlist.trackhashes)
+            trackhashes = playlist.trackhashes
             playlist.clear_lists()
 
             if not playlist.has_image:
-                images = get_first_4_images(tracks)
+                images = get_first_4_images(trackhashes=trackhashes)
                 images = [i["image"] for i in images]
                 playlist.images = images
 
@@ -0,0 +1,336 @@
+"""
+This library contains the image pack, which stores thumbnails and artist
+images in one file instead of a file per image and size.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterable
+
+from app.config import UserConfig
+from app.logger import log
+from app.settings import Paths
+
+# INFO: Misses rescan the pack for images added by other processes at most this often
+MISS_SCAN_INTERVAL = 1
+
+MAGIC = b"SWIP"
+# magic, kind length, hash length, data length
+HEADER = struct.Struct("<4sBBI")
+
+# {kind: directory of the unpacked images}
+IMAGE_DIRS = {
+    "lg": Paths.get_lg_thumb_path,
+    "md": Paths.get_md_thumb_path,
+    "sm": Paths.get_sm_thumb_path,
+    "xsm": Paths.get_xsm_thumb_path,
+    "artist_lg": Paths.get_lg_artist_img_path,
+    "artist_md": Paths.get_md_artist_img_path,
+    "artist_sm": Paths.get_sm_artist_img_path,
+}
+
+
+def get_image_dir(kind: str):
+    """
+    Returns the directory an image kind is saved to when it's not packed.
+    """
+    return IMAGE_DIRS[kind]()
+
+
+def encode_record(kind: str, hash: str, data: bytes = b""):
+    kind_bytes = kind.encode()
+    hash_bytes = hash.encode()
+
+    return (
+        HEADER.pack(MAGIC, len(kind_bytes), len(hash_bytes), len(data))
+        + kind_bytes
+        + hash_bytes
+        + data
+    )
+
+
+class ImagePack:
+    """
+    An append-only file of images, with an in-memory index of where each
+    one is. Images are read by slicing the memory-mapped file, which copies
+    the image without opening the file or seeking.
+
+    Each record is a header, the image kind (eg. "sm"), its hash and the
+    WebP data. A later record for the same image replaces the earlier one,
+    and a record without data removes it. `compact` drops the records that
+    were replaced or removed.
+
+    Records are appended with a single O_APPEND write, so worker processes
+    can add images while the server reads. The index is built by scanning
+    the record headers, and the scan picks up from where it stopped when
+    the file grows. Images saved as files remove their packed copies, so
+    that a pack left over from before packing was disabled doesn't shadow
+    them.
+    """
+
+    # {(kind, hash): (offset, length)}
+    index: dict[tuple[str, str], tuple[int, int]] = {}
+    end: int = 0
+    buffer: mmap.mmap | None = None
+    last_miss_scan: float = 0
+    lock = threading.Lock()
+
+    @staticmethod
+    def enabled():
+        return UserConfig().packImages
+
+    @classmethod
+    def load(cls):
+        """
+        Indexes the pack file. A record left incomplete by an interrupted
+        write is cut off, so that the records appended after it are found.
+        """
+        with cls.lock:
+            cls.index = {}
+            cls.end = 0
+            cls.close()
+
+            path = Paths.get_image_pack_path()
+
+            if not os.path.exists(path):
+                return
+
+            # INFO: An existing pack is read even if packing was disabled
+            cls.scan(force=True)
+
+            if os.path.getsize(path) > cls.end:
+                log.warning("Removing an incomplete record from the image pack")
+                os.truncate(path, cls.end)
+
+    @classmethod
+    def close(cls):
+        if cls.buffer is not None:
+            cls.buffer.close()
+            cls.buffer = None
+
+    @classmethod
+    def scan(cls, force: bool = False):
+        """
+        Maps the file and indexes the records after `end`. Does nothing
+        if packing is disabled and no pack was loaded, unless forced.
+        Call with the lock held.
+        """
+        if not force and cls.buffer is None and not cls.enabled():
+            return
+
+        path = Paths.get_image_pack_path()
+
+        try:
+            # INFO: Only open the file and remap it if it has grown
+            if os.stat(path).st_size <= cls.end:
+                return
+
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                cls.close()
+                cls.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return
+
+        offset = cls.end
+
+        while offset + HEADER.size <= size:
+            magic, kind_len, hash_len, data_len = HEADER.unpack_from(cls.buffer, offset)
+            data_offset = offset + HEADER.size + kind_len + hash_len
+
+            # INFO: Stop at a record that's still being written
+            if magic != MAGIC or data_offset + data_len > size:
+                break
+
+            key_offset = offset + HEADER.size
+            kind = cls.buffer[key_offset : key_offset + kind_len].decode()
+            hash = cls.buffer[key_offset + kind_len : data_offset].decode()
+
+            if data_len:
+                cls.index[(kind, hash)] = (data_offset, data_len)
+            else:
+                cls.index.pop((kind, hash), None)
+
+            offset = data_offset + data_len
+
+        cls.end = offset
+
+    @classmethod
+    def append(cls, hash: str, images: dict[str, bytes]):
+        """
+        Adds the images of a hash, as {kind: data}.
+        """
+        data = b"".join(encode_record(kind, hash, img) for kind, img in images.items())
+        fd = os.open(
+            Paths.get_image_pack_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+
+        try:
+            if os.write(fd, data) != len(data):
+                raise OSError("Incomplete write to the image pack")
+        finally:
+            os.close(fd)
+
+        # INFO: Index the record now, so that a replaced image is not served
+        cls.refresh()
+
+    @classmethod
+    def remove(cls, hash: str, kinds: Iterable[str]):
+        """
+        Removes the packed images of a hash, if it has any.
+        """
+        kinds = [kind for kind in kinds if cls.has(kind, hash)]
+
+        if kinds:
+            cls.append(hash, {kind: b"" for kind in kinds})
+
+    @classmethod
+    def scan_on_miss(cls):
+        """
+        Rescans for images appended by other processes, at most once
+        every `MISS_SCAN_INTERVAL` seconds. Call with the lock held.
+        """
+        now = time.monotonic()
+
+        if now - cls.last_miss_scan < MISS_SCAN_INTERVAL:
+            return
+
+        cls.last_miss_scan = now
+        cls.scan()
+
+    @classmethod
+    def refresh(cls):
+        """
+        Indexes the records appended since the last scan,
+        including those appended by other processes.
+        """
+        with cls.lock:
+            cls.scan()
+
+    @classmethod
+    def get(cls, kind: str, hash: str):
+        """
+        Returns the data of an image and an ETag for it,
+        or None if it's not packed.
+        """
+        with cls.lock:
+            entry = cls.index.get((kind, hash))
+
+            if entry is None:
+                # INFO: It may have been added by another process
+                cls.scan_on_miss()
+                entry = cls.index.get((kind, hash))
+
+            if entry is None or cls.buffer is None:
+                return None
+
+            offset, length = entry
+            return cls.buffer[offset : offset + length], f"{offset:x}-{length:x}"
+
+    @classmethod
+    def has(cls, kind: str, hash: str):
+        with cls.lock:
+            if (kind, hash) not in cls.index:
+                cls.scan_on_miss()
+
+            return (kind, hash) in cls.index
+
+    @classmethod
+    def get_hashes(cls, kind: str):
+        """
+        Returns the hashes of the packed images of a kind.
+        """
+        with cls.lock:
+            cls.scan()
+            return {hash for k, hash in cls.index if k == kind}
+
+    @classmethod
+    def compact(cls):
+        """
+        Rewrites the pack without replaced and removed records. When packing
+        is enabled, images saved as files are moved into the pack.
+
+        Run it while the server is stopped. Returns the pack's size before
+        and after, and the number of image files that were removed.
+        """
+        path = Paths.get_image_pack_path()
+        temp_path = path + ".tmp"
+        packed_files: list[str] = []
+
+        if not cls.enabled() and not os.path.exists(path):
+            return 0, 0, 0
+
+        with cls.lock:
+            cls.scan(force=True)
+            before = cls.end
+            records = sorted(cls.index.items(), key=lambda item: item[1][0])
+
+            with open(temp_path, "wb") as f:
+                for (kind, hash), (offset, length) in records:
+                    data = cls.buffer[offset : offset + length]
+                    f.write(encode_record(kind, hash, data))
+
+                if cls.enabled():
+                    for kind in IMAGE_DIRS:
+                        folder = get_image_dir(kind)
+
+                        try:
+                            names = os.listdir(folder)
+                        except OSError:
+                            continue
+
+                        for name in names:
+                            hash = name.removesuffix(".webp")
+
+                            if hash == name:
+                                continue
+
+                            filepath = os.path.join(folder, name)
+                            packed_files.append(filepath)
+
+                            # INFO: The packed copy is newer than the file, as
+                            # saving a file removes the packed copy
+                            if (kind, hash) in cls.index:
+                                continue
+
+                            with open(filepath, "rb") as img:
+                                f.write(encode_record(kind, hash, img.read()))
+
+            cls.close()
+            os.replace(temp_path, path)
+
+            cls.index = {}
+            cls.end = 0
+            cls.scan(force=True)
+
+        # INFO: Delete the files once the pack that holds them is in place
+        for filepath in packed_files:
+            os.remove(filepath)
+
+        return before, cls.end, len(packed_files)
+
+
+def read_image(kind: str, hash: str):
+    """
+    Returns an image's data from the pack or from its file,
+    or None if it's not saved.
+    """
+    packed = ImagePack.get(kind, hash)
+
+    if packed is not None:
+        return packed[0]
+
+    try:
+        with open(os.path.join(get_image_dir(kind), hash + ".webp"), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def image_exists(kind: str, hash: str):
+    return ImagePack.has(kind, hash) or os.path.exists(
+        os.path.join(get_image_dir(kind), hash + ".webp")
+    )
@@ -1,29 +1,56 @@
 import gc
 from time import time
+from app.db.libdata import TrackTable
 from app.lib.mapstuff import (
     map_album_colors,
     map_artist_colors,
     map_favorites,
+    map_loudness,
     map_scrobble_data,
 )
 from app.lib.populate import CordinateMedia
 from app.lib.tagger import IndexTracks
+from app.models import Track
 from app.store.albums import AlbumStore
 from app.store.artists import ArtistStore
 from app.store.folder import FolderStore
+from app.store.search import SearchStore
 from app.store.tracks import TrackStore
 from app.utils.threading import background
 
 
 class IndexEverything:
-    def __init__(self) -> None:
-        IndexTracks(instance_key=time())
+    def __init__(self, full: bool = False, verify: bool = False) -> None:
+        """
+        Scans the root directories and updates the stores.
 
-        key = str(time())
+        Only the tracks, albums and artists affected by the scan are
+        updated, unless `full` is set (eg. when the config changes),
+        in which case all the stores are rebuilt.
+
+        Files edited in place are only found when `verify` or `full`
+        is set, as unchanged directories are otherwise not re-read.
+        """
+        IndexTracks(instance_key=time(), verify=full or verify)
+
+        if full or len(TrackStore.trackhashmap) == 0:
+            self.load_all(str(time()))
+        else:
+            sync_stores()
+
+        CordinateMedia(instance_key=str(time()))
+        gc.collect()
+
+    @staticmethod
+    def load_all(key: str):
+        """
+        Rebuilds all the stores from the database.
+        """
         TrackStore.load_all_tracks(key)
         AlbumStore.load_albums(key)
         ArtistStore.load_artists(key)
         FolderStore.load_filepaths()
+        SearchStore.load_index(key)
 
         # map colors
         map_album_colors()
@@ -31,11 +58,107 @@ class IndexEverything:
 
         map_scrobble_data()
         map_favorites()
+        map_loudness()
 
-        CordinateMedia(instance_key=str(time()))
-        gc.collect()
+
+def sync_stores():
+    """
+    Applies the tracks added, modified and removed in the database
+    since the stores were loaded.
+    """
+    indexed = {filepath: last_mod for filepath, last_mod, _ in TrackTable.get_scan_info()}
+    loaded = dict(TrackStore.filepathmap)
+
+    removed = [t for path, t in loaded.items() if indexed.get(path) != t.last_mod]
+    added_paths = [
+        path
+        for path, last_mod in indexed.items()
+        if path not in loaded or loaded[path].last_mod != last_mod
+    ]
+
+    added = TrackTable.get_tracks_by_filepaths(added_paths) if added_paths else []
+    update_stores(added, removed)
+
+
+def update_stores(added: list[Track], removed: list[Track]):
+    """
+    Adds and removes tracks from the stores, then updates only the
+    albums, artists and search entries they belong to.
+    """
+    if not added and not removed:
+        return
+
+    # INFO: New copies of known tracks take over their play data and favorites
+    known: dict[str, Track] = {t.trackhash: t for t in removed}
+
+    for track in added:
+        group = TrackStore.trackhashmap.get(track.trackhash)
+
+        if group is not None and track.trackhash not in known:
+            known[track.trackhash] = group.tracks[0]
+
+    TrackStore.remove_tracks_by_filepaths(t.filepath for t in removed)
+    FolderStore.remove_filepaths(t.filepath for t in removed)
+
+    new_trackhashes: set[str] = set()
+
+    for track in added:
+        source = known.get(track.trackhash)
+
+        if source is None:
+            new_trackhashes.add(track.trackhash)
+            continue
+
+        track.playcount = source.playcount
+        track.playduration = source.playduration
+        track.lastplayed = source.lastplayed
+        track.fav_userids = list(source.fav_userids)
+
+    TrackStore.add_tracks(added)
+    FolderStore.add_tracks(added)
+
+    if new_trackhashes:
+        map_scrobble_data(new_trackhashes)
+
+    if added:
+        map_loudness([t.filepath for t in added])
+
+    changed = [*added, *removed]
+    albumhashes = {t.albumhash for t in changed}
+    artisthashes = {
+        a["artisthash"] for t in changed for a in (*t.artists, *t.albumartists)
+    }
+
+    new_albums = AlbumStore.update_albums(albumhashes)
+    new_artists = ArtistStore.update_artists(artisthashes)
+
+    if new_trackhashes or new_albums or new_artists:
+        map_favorites(new_trackhashes | new_albums | new_artists)
+
+    if new_albums:
+        map_album_colors(new_albums)
+
+    if new_artists:
+        map_artist_colors(new_artists)
+
+    # SECTION: Search index
+    trackhashes = {t.trackhash for t in changed}
+    SearchStore.tracks.add({t.trackhash: t.og_title for t in added})
+    SearchStore.tracks.remove(
+        h for h in trackhashes if h not in TrackStore.trackhashmap
+    )
+
+    albums = [AlbumStore.albummap.get(h) for h in albumhashes]
+    SearchStore.albums.add({a.album.albumhash: a.album.og_title for a in albums if a})
+    SearchStore.albums.remove(h for h in albumhashes if h not in AlbumStore.albummap)
+
+    artists = [ArtistStore.artistmap.get(h) for h in artisthashes]
+    SearchStore.artists.add({a.artist.artisthash: a.artist.name for a in artists if a})
+    SearchStore.artists.remove(
+        h for h in artisthashes if h not in ArtistStore.artistmap
+    )
 
 
 @background
-def index_everything():
-    return IndexEverything()
+def index_everything(full: bool = False, verify: bool = False):
+    return IndexEverything(full=full, verify=verify)
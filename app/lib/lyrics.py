@@ -1,6 +1,7 @@
 from pathlib import Path
 from tinytag import TinyTag
 
+from app.db.libdata import TrackTable
 from app.store.tracks import TrackStore
 
 
@@ -142,15 +143,19 @@ def test_is_synced(lyrics: list[str]):
 def get_extras(filepath: str, keys: list[str]):
     """
     Get extra tags from an audio file.
+
+    The tags saved when the file was indexed are used,
+    the file is only read if it's not indexed.
     """
-    try:
-        tags = TinyTag.get(filepath)
-    except Exception:
-        return [""] * len(keys)
+    extras = TrackTable.get_extra(filepath)
 
-    extras = tags.extra
+    if extras is None:
+        try:
+            extras = TinyTag.get(filepath).extra
+        except Exception:
+            return [""] * len(keys)
 
-    return [extras.get(key, "").strip() for key in keys]
+    return [(extras.get(key) or "").strip() for key in keys]
 
 
 def get_lyrics_from_tags(filepath: str, just_check: bool = False):
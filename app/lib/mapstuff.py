@@ -1,3 +1,4 @@
+from app.db.libdata import AnalysisTable
 from app.db.userdata import LibDataTable, FavoritesTable, ScrobbleTable
 from app.store.albums import AlbumStore
 from app.store.artists import ArtistStore
@@ -7,14 +8,19 @@ from app.store.tracks import TrackStore
 from typing import Any
 
 
-def map_scrobble_data():
+def map_scrobble_data(trackhashes: set[str] | None = None):
     """
     Maps scrobble data to the in-memory stores.
 
     The scrobble data is loaded from the database and grouped by trackhash.
     The album and artist scrobble data (for those tracks) are then incremented based on the data.
+
+    If trackhashes are given, only the scrobbles of those tracks are mapped.
     """
-    records = ScrobbleTable.get_all(0, None)
+    if trackhashes is None:
+        records = ScrobbleTable.get_all(0, None)
+    else:
+        records = ScrobbleTable.get_by_trackhashes(trackhashes)
 
     # group records by trackhash
     grouped: dict[str, dict[str, Any]] = {}
@@ -45,11 +51,16 @@ def map_scrobble_data():
                 artist.increment_playcount(data["playduration"], data["lastplayed"], data["playcount"])
 
 
-def map_favorites():
+def map_favorites(hashes: set[str] | None = None):
     """
     Maps favorites data to the in-memory stores.
+
+    If hashes are given, only the favorites of those items are mapped.
     """
-    favorites = FavoritesTable.get_all()
+    if hashes is None:
+        favorites = FavoritesTable.get_all()
+    else:
+        favorites = FavoritesTable.get_by_hashes(hashes)
 
     for entry in favorites:
         if entry.type == "album":
@@ -68,8 +79,11 @@ def map_favorites():
                 track.toggle_favorite_user(entry.userid)
 
 
-def map_artist_colors():
-    colors = LibDataTable.get_all_colors(type="artist")
+def map_artist_colors(artisthashes: set[str] | None = None):
+    if artisthashes is None:
+        colors = LibDataTable.get_all_colors(type="artist")
+    else:
+        colors = LibDataTable.get_colors_by_hashes("artist", artisthashes)
 
     for color in colors:
         artist = ArtistStore.artistmap.get(color["itemhash"])
@@ -78,11 +92,30 @@ def map_artist_colors():
             artist.set_color(color["color"])
 
 
-def map_album_colors():
-    colors = LibDataTable.get_all_colors(type="album")
+def map_album_colors(albumhashes: set[str] | None = None):
+    if albumhashes is None:
+        colors = LibDataTable.get_all_colors(type="album")
+    else:
+        colors = LibDataTable.get_colors_by_hashes("album", albumhashes)
 
     for color in colors:
         album = AlbumStore.albummap.get(color["itemhash"])
 
         if album:
             album.set_color(color["color"])
+
+
+def map_loudness(filepaths: list[str] | None = None):
+    """
+    Maps the measured loudness of tracks to the in-memory stores.
+
+    Results measured before a file was last modified are skipped.
+    If filepaths are given, only those tracks are mapped.
+    """
+    results = AnalysisTable.get_all_results(filepaths)
+
+    for filepath, (last_mod, data) in results.items():
+        track = TrackStore.filepathmap.get(filepath)
+
+        if track is not None and track.last_mod == last_mod:
+            track.loudness = data.get("loudness")
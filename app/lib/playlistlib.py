@@ -5,7 +5,7 @@ This library contains all the functions related to playlists.
 import os
 import random
 import string
-from typing import Any
+from typing import Any, Iterable
 
 from PIL import Image, ImageSequence
 
@@ -29,7 +29,7 @@ def create_thumbnail(image: Any, img_path: str) -> str:
 
     new_w = round(250 * aspect_ratio)
 
-    thumb = image.resize((new_w, 250), Image.ANTIALIAS)
+    thumb = image.resize((new_w, 250), Image.LANCZOS)
     thumb.save(full_thumb_path, "webp")
 
     return thumb_path
@@ -51,7 +51,7 @@ def create_gif_thumbnail(image: Any, img_path: str):
 
         new_w = round(250 * aspect_ratio)
 
-        thumb = frame.resize((new_w, 250), Image.ANTIALIAS)
+        thumb = frame.resize((new_w, 250), Image.LANCZOS)
         frames.append(thumb)
 
     frames[0].save(full_thumb_path, save_all=True, append_images=frames[1:])
@@ -103,16 +103,16 @@ def duplicate_images(images: list):
 
 
 def get_first_4_images(
-    tracks: list[Track] = [], trackhashes: list[str] = []
+    tracks: Iterable[Track] = [], trackhashes: list[str] = []
 ) -> list[dict["str", str]]:
     """
     Returns images of the first 4 albums that appear in the track list.
 
     When tracks are not passed, trackhashes need to be passed.
-    Tracks are then resolved from the store.
+    Tracks are then lazily resolved from the store, stopping at the 4th album.
     """
     if len(trackhashes) > 0:
-        tracks = TrackStore.get_tracks_by_trackhashes(trackhashes)
+        tracks = TrackStore.iter_tracks_by_trackhashes(trackhashes)
 
     albums = []
 
@@ -1,6 +1,8 @@
+from collections import deque
 from dataclasses import asdict
+import itertools
 import os
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 from requests import ConnectionError as RequestConnectionError
 from requests import ReadTimeout
@@ -10,16 +12,24 @@ from app.lib.artistlib import CheckArtistImages
 from app.lib.colorlib import ProcessAlbumColors, ProcessArtistColors
 from app.lib.errors import PopulateCancelledError
 from app.lib.taglib import extract_thumb
+from app.lib.trackslib import get_loudness
+from app.lib.waveform import FAILED_KEY, get_waveform_path, save_waveform
 from app.logger import log
-from app.models import Album, Artist
+from app.models import Artist, Track
 from app.models.lastfm import SimilarArtist
 from app.requests.artists import fetch_similar_artists
 from app.store.albums import AlbumStore
 from app.store.artists import ArtistStore
+from app.store.thumbnails import ThumbnailStore
+from app.utils import chunk
 from app.utils.network import has_connection
 from app.utils.progressbar import tqdm
+from app.utils.threading import get_cpu_count, get_process_pool
 
+from app.config import UserConfig
+from app.db.libdata import AnalysisTable
 from app.db.userdata import SimilarArtistTable
+from app.store.tracks import TrackStore
 
 
 POPULATE_KEY = ""
@@ -68,39 +78,36 @@ class CordinateMedia:
                 log.warn(e)
                 return
 
+        try:
+            ProcessTrackLoudness(instance_key)
+            ProcessTrackWaveforms(instance_key)
+        except PopulateCancelledError as e:
+            log.warn(e)
+            return
 
-def get_image(_map: tuple[str, Album]):
-    """
-    The function retrieves an image from an album by iterating through its tracks and extracting the thumbnail from the first track that has one.
 
-    :param album: An instance of the `Album` class representing the album to retrieve the image from.
-    :type album: Album
-    :return: None
+def extract_album_thumbs(albums: list[tuple[str, list[str]]]):
     """
+    Extracts the thumbnails of a chunk of albums, trying each album's
+    tracks until one has art. Runs in the worker processes.
 
-    instance_key, album = _map
-
-    if POPULATE_KEY != instance_key:
-        raise PopulateCancelledError("'ProcessTrackThumbnails': Populate key changed")
-
-    matching_tracks = AlbumStore.get_album_tracks(album.albumhash)
-
-    for track in matching_tracks:
-        if extract_thumb(track.filepath, track.image):
-            break
-
-
-def get_cpu_count():
-    """
-    Returns the number of CPUs on the machine.
+    Takes a list of (image filename, track filepaths), and returns
+    the thumbnail manifest entries of the saved thumbnails.
     """
-    cpu_count = os.cpu_count() or 0
-    return cpu_count // 2 if cpu_count > 2 else cpu_count
+    for image, filepaths in albums:
+        for filepath in filepaths:
+            if extract_thumb(filepath, image):
+                break
+
+    return ThumbnailStore.collect()
 
 
 class ProcessTrackThumbnails:
     """
     Extracts the album art from all albums in album store.
+
+    Albums are sent to a process pool in chunks, where the art is decoded,
+    resized and encoded, so that it's not bound to one core by the GIL.
     """
 
     def __init__(self, instance_key: str) -> None:
@@ -108,30 +115,47 @@ class ProcessTrackThumbnails:
         Filters out albums that already have thumbnails and
         extracts the thumbnail for the other albums.
         """
-        path = settings.Paths.get_sm_thumb_path()
+        albums = [
+            (
+                album.image,
+                [t.filepath for t in AlbumStore.get_album_tracks(album.albumhash)],
+            )
+            for album in AlbumStore.get_flat_list()
+            if not ThumbnailStore.has(album.albumhash)
+        ]
 
-        # read all the files in the thumbnail directory
-        processed = "".join(os.listdir(path)).replace("webp", "")
+        if not albums:
+            return
 
-        # filter out albums that already have thumbnails
-        albums = filter(
-            lambda album: album.albumhash not in processed, AlbumStore.get_flat_list()
-        )
-        albums = list(albums)
+        pending: deque[tuple[int, Future]] = deque()
+        max_pending = (get_cpu_count() or 1) * 4
+        progress = tqdm(total=len(albums), desc="Extracting track images")
 
-        # process the rest
-        key_album_map = ((instance_key, album) for album in albums)
+        with get_process_pool() as executor:
 
-        with ThreadPoolExecutor(max_workers=get_cpu_count()) as executor:
-            results = list(
-                tqdm(
-                    executor.map(get_image, key_album_map),
-                    total=len(albums),
-                    desc="Extracting track images",
-                )
-            )
+            def wait_for_next():
+                count, future = pending.popleft()
+                ThumbnailStore.merge(future.result())
+                ThumbnailStore.save()
+                progress.update(count)
+
+                if POPULATE_KEY != instance_key:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise PopulateCancelledError(
+                        "'ProcessTrackThumbnails': Populate key changed"
+                    )
+
+            for albums_chunk in chunk(albums, 16):
+                future = executor.submit(extract_album_thumbs, albums_chunk)
+                pending.append((len(albums_chunk), future))
 
-            list(results)
+                if len(pending) >= max_pending:
+                    wait_for_next()
+
+            while pending:
+                wait_for_next()
+
+        progress.close()
 
 
 def save_similar_artists(_map: tuple[str, Artist]):
@@ -199,3 +223,122 @@ class FetchSimilarArtistsLastFM:
             except Exception as e:
                 log.warn(e)
                 return
+
+
+def process_tracks(
+    instance_key: str, name: str, tracks: list[Track], func, desc: str
+):
+    """
+    Runs `func` on each track in a thread pool of `UserConfig.analysisWorkers`
+    threads, stopping when the populate key changes.
+    """
+    workers = max(1, UserConfig().analysisWorkers)
+    total = len(tracks)
+    tracks_iter = iter(tracks)
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # INFO: Only submit a few tracks ahead, so a cancelled
+        # run doesn't leave a long queue behind.
+        def submit(count: int):
+            for track in itertools.islice(tracks_iter, count):
+                pending.add(executor.submit(func, track))
+
+        submit(workers * 2)
+        progress = tqdm(total=total, desc=desc)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            pending.difference_update(done)
+            progress.update(len(done))
+
+            if POPULATE_KEY != instance_key:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise PopulateCancelledError(f"'{name}': Populate key changed")
+
+            submit(len(done))
+
+        progress.close()
+
+
+class ProcessTrackLoudness:
+    """
+    Measures the loudness of the tracks that have not been analyzed since
+    they were last modified, and saves the results to the analysis table.
+
+    FFmpeg does the decoding, so the workers are FFmpeg processes
+    (at a low CPU priority) run from a thread pool.
+    """
+
+    def __init__(self, instance_key: str) -> None:
+        if not UserConfig().enableLoudnessAnalysis:
+            return
+
+        results = AnalysisTable.get_all_results()
+        tracks = [
+            track
+            for track in TrackStore.get_flat_list()
+            if not self.is_analyzed(track.last_mod, results.get(track.filepath))
+        ]
+
+        if tracks:
+            process_tracks(
+                instance_key,
+                "ProcessTrackLoudness",
+                tracks,
+                analyze_track,
+                "Measuring track loudness",
+            )
+
+    @staticmethod
+    def is_analyzed(last_mod: int, result: tuple[float, dict] | None):
+        return result is not None and result[0] == last_mod and "loudness" in result[1]
+
+
+def analyze_track(track: Track):
+    """
+    Measures and saves the loudness of a track, and sets it on the track.
+    """
+    loudness = get_loudness(track.filepath)
+
+    # INFO: Failures are saved as None so they are not retried
+    # until the file changes.
+    AnalysisTable.set_results(track.filepath, track.last_mod, {"loudness": loudness})
+    track.loudness = loudness
+
+
+class ProcessTrackWaveforms:
+    """
+    Generates the seek bar waveforms of the tracks that don't have one,
+    so that they don't have to be generated when first requested.
+    Tracks whose waveform failed are skipped until the file changes.
+    """
+
+    def __init__(self, instance_key: str) -> None:
+        if not UserConfig().generateWaveforms:
+            return
+
+        saved = set(os.listdir(settings.Paths.get_waveforms_path()))
+        results = AnalysisTable.get_all_results()
+
+        # INFO: The waveform endpoint serves one file per trackhash
+        tracks = [group.get_best() for group in TrackStore.trackhashmap.values()]
+        tracks = [
+            t
+            for t in tracks
+            if os.path.basename(get_waveform_path(t)) not in saved
+            and not self.has_failed(t.last_mod, results.get(t.filepath))
+        ]
+
+        if tracks:
+            process_tracks(
+                instance_key,
+                "ProcessTrackWaveforms",
+                tracks,
+                save_waveform,
+                "Generating waveforms",
+            )
+
+    @staticmethod
+    def has_failed(last_mod: int, result: tuple[float, dict] | None):
+        return result is not None and result[0] == last_mod and FAILED_KEY in result[1]
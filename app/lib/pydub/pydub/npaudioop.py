@@ -0,0 +1,416 @@
+"""
+A NumPy implementation of the audioop functions used by pydub.
+
+The stdlib audioop module is deprecated and removed in Python 3.13, and
+the pure Python fallback (pyaudioop) works one sample at a time. These
+functions work on whole buffers and follow audioop's rounding and
+clipping, so results match the stdlib module.
+"""
+import math
+
+import numpy as np
+
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
+
+class error(Exception):
+    pass
+
+
+_DTYPES = {1: np.int8, 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+
+def _check_size(size):
+    if size not in (1, 2, 3, 4):
+        raise error("Size should be 1, 2, 3 or 4")
+
+
+def _check_params(length, size):
+    _check_size(size)
+    if length % size != 0:
+        raise error("not a whole number of frames")
+
+
+def _get_minval(size):
+    return -(1 << (size * 8 - 1))
+
+
+def _get_maxval(size):
+    return (1 << (size * 8 - 1)) - 1
+
+
+def _samples(cp, size):
+    """
+    Returns the samples in a buffer as an int64 array.
+    """
+    if size == 3:
+        data = np.frombuffer(cp, dtype=np.uint8).reshape(-1, 3).astype(np.int64)
+        samples = data[:, 0] | (data[:, 1] << 8) | (data[:, 2] << 16)
+        return np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+
+    return np.frombuffer(cp, dtype=_DTYPES[size]).astype(np.int64)
+
+
+def _to_bytes(samples, size):
+    """
+    Packs an array of in-range samples into a buffer.
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+
+    if size == 3:
+        data = samples & 0xFFFFFF
+        packed = np.stack([data & 0xFF, (data >> 8) & 0xFF, data >> 16], axis=1)
+        return packed.astype(np.uint8).tobytes()
+
+    return samples.astype(_DTYPES[size]).tobytes()
+
+
+def _clip(samples, size):
+    return np.clip(samples, _get_minval(size), _get_maxval(size))
+
+
+def _wrap(samples, size):
+    """
+    Wraps samples around on overflow, like C integer arithmetic.
+    """
+    bits = size * 8
+    offset = 1 << (bits - 1)
+    return ((samples + offset) % (1 << bits)) - offset
+
+
+def _floor_clip(values, size):
+    """
+    Clips float results to the sample range and rounds them down.
+    """
+    return np.floor(_clip(values, size)).astype(np.int64)
+
+
+def getsample(cp, size, i):
+    _check_params(len(cp), size)
+    if not (0 <= i < len(cp) // size):
+        raise error("Index out of range")
+    return int(_samples(cp[i * size:(i + 1) * size], size)[0])
+
+
+def max(cp, size):
+    _check_params(len(cp), size)
+    if len(cp) == 0:
+        return 0
+    return int(np.abs(_samples(cp, size)).max())
+
+
+def minmax(cp, size):
+    _check_params(len(cp), size)
+    if len(cp) == 0:
+        return _get_maxval(4), _get_minval(4)
+    samples = _samples(cp, size)
+    return int(samples.min()), int(samples.max())
+
+
+def avg(cp, size):
+    _check_params(len(cp), size)
+    if len(cp) == 0:
+        return 0
+    samples = _samples(cp, size)
+    return int(math.floor(samples.sum() / len(samples)))
+
+
+def rms(cp, size):
+    _check_params(len(cp), size)
+    if len(cp) == 0:
+        return 0
+    samples = _samples(cp, size).astype(np.float64)
+    return int(math.sqrt(np.dot(samples, samples) / len(samples)))
+
+
+def _sum2(a, b):
+    return float(np.dot(a.astype(np.float64), b.astype(np.float64)))
+
+
+def findfit(cp1, cp2):
+    if len(cp1) % 2 != 0 or len(cp2) % 2 != 0:
+        raise error("Strings should be even-sized")
+
+    if len(cp1) < len(cp2):
+        raise error("First sample should be longer")
+
+    a = _samples(cp1, 2).astype(np.float64)
+    r = _samples(cp2, 2).astype(np.float64)
+    len2 = len(r)
+
+    sum_ri_2 = _sum2(r, r)
+    squares = np.concatenate(([0.0], np.cumsum(a * a)))
+    sum_aij_2 = squares[len2:] - squares[:len(squares) - len2]
+    sum_aij_ri = np.correlate(a, r, mode="valid")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        results = (sum_ri_2 * sum_aij_2 - sum_aij_ri * sum_aij_ri) / sum_aij_2
+
+    best_i = int(np.nanargmin(results)) if len(results) else 0
+    factor = sum_aij_ri[best_i] / sum_ri_2
+
+    return best_i, factor
+
+
+def findfactor(cp1, cp2):
+    if len(cp1) % 2 != 0:
+        raise error("Strings should be even-sized")
+
+    if len(cp1) != len(cp2):
+        raise error("Samples should be same size")
+
+    a = _samples(cp1, 2)
+    r = _samples(cp2, 2)
+
+    return _sum2(a, r) / _sum2(r, r)
+
+
+def findmax(cp, len2):
+    if len(cp) % 2 != 0:
+        raise error("Strings should be even-sized")
+
+    samples = _samples(cp, 2).astype(np.float64)
+
+    if len2 < 0 or len(samples) < len2:
+        raise error("Input sample should be longer")
+
+    if len(samples) == 0:
+        return 0
+
+    squares = np.concatenate(([0.0], np.cumsum(samples * samples)))
+    windows = squares[len2:] - squares[:len(squares) - len2]
+
+    return int(np.argmax(windows))
+
+
+def _extremes(cp, size):
+    """
+    Returns the values at the peaks and troughs of the signal,
+    skipping flat stretches, as avgpp and maxpp see them.
+    """
+    samples = _samples(cp, size)
+
+    if len(samples) < 2:
+        return samples[:0]
+
+    diffs = np.sign(np.diff(samples))
+
+    # INFO: The direction of the last change before each one
+    nonzero = np.where(diffs != 0, np.arange(len(diffs)), 0)
+    last_nonzero = np.maximum.accumulate(nonzero)
+    prevdiffs = diffs[np.concatenate(([0], last_nonzero[:-1]))]
+
+    turns = np.nonzero(diffs * prevdiffs < 0)[0]
+    return samples[turns]
+
+
+def avgpp(cp, size):
+    _check_params(len(cp), size)
+    extremes = _extremes(cp, size)
+
+    if len(extremes) < 2:
+        return 0
+
+    return int(np.abs(np.diff(extremes)).mean())
+
+
+def maxpp(cp, size):
+    _check_params(len(cp), size)
+    extremes = _extremes(cp, size)
+
+    if len(extremes) < 2:
+        return 0
+
+    return int(np.abs(np.diff(extremes)).max())
+
+
+def cross(cp, size):
+    _check_params(len(cp), size)
+    signs = _samples(cp, size) < 0
+
+    if len(signs) == 0:
+        return -1
+
+    return int(np.count_nonzero(signs[1:] != signs[:-1]))
+
+
+def mul(cp, size, factor):
+    _check_params(len(cp), size)
+    samples = _samples(cp, size) * float(factor)
+    return _to_bytes(_floor_clip(samples, size), size)
+
+
+def tomono(cp, size, fac1, fac2):
+    _check_params(len(cp), size)
+    samples = _samples(cp, size)
+
+    if len(samples) % 2:
+        samples = samples[:-1]
+
+    mixed = samples[0::2] * float(fac1) + samples[1::2] * float(fac2)
+    return _to_bytes(_floor_clip(mixed, size), size)
+
+
+def tostereo(cp, size, fac1, fac2):
+    _check_params(len(cp), size)
+    samples = _samples(cp, size)
+
+    stereo = np.empty(len(samples) * 2, dtype=np.int64)
+    stereo[0::2] = _floor_clip(samples * float(fac1), size)
+    stereo[1::2] = _floor_clip(samples * float(fac2), size)
+
+    return _to_bytes(stereo, size)
+
+
+def add(cp1, cp2, size):
+    _check_params(len(cp1), size)
+
+    if len(cp1) != len(cp2):
+        raise error("Lengths should be the same")
+
+    samples = _samples(cp1, size) + _samples(cp2, size)
+    return _to_bytes(_clip(samples, size), size)
+
+
+def bias(cp, size, bias):
+    _check_params(len(cp), size)
+    samples = _samples(cp, size) + int(bias)
+    return _to_bytes(_wrap(samples, size), size)
+
+
+def reverse(cp, size):
+    _check_params(len(cp), size)
+    return _to_bytes(_samples(cp, size)[::-1], size)
+
+
+def byteswap(cp, size):
+    _check_params(len(cp), size)
+    data = np.frombuffer(cp, dtype=np.uint8).reshape(-1, size)
+    return data[:, ::-1].tobytes()
+
+
+def lin2lin(cp, size, size2):
+    _check_params(len(cp), size)
+    _check_size(size2)
+
+    if size == size2:
+        return cp
+
+    # INFO: Scale to 32 bits, then down to the new width, as audioop does
+    samples = _samples(cp, size) << (32 - size * 8)
+    return _to_bytes(samples >> (32 - size2 * 8), size2)
+
+
+def ratecv(cp, size, nchannels, inrate, outrate, state, weightA=1, weightB=0):
+    _check_size(size)
+    if nchannels < 1:
+        raise error("# of channels should be >= 1")
+
+    bytes_per_frame = size * nchannels
+
+    if weightA < 1 or weightB < 0:
+        raise error("weightA should be >= 1, weightB should be >= 0")
+
+    if len(cp) % bytes_per_frame != 0:
+        raise error("not a whole number of frames")
+
+    if inrate <= 0 or outrate <= 0:
+        raise error("sampling rate not > 0")
+
+    d = gcd(inrate, outrate)
+    inrate //= d
+    outrate //= d
+
+    if state is None:
+        d = -outrate
+        prev_i = np.zeros(nchannels, dtype=np.int64)
+        cur_i = np.zeros(nchannels, dtype=np.int64)
+    else:
+        d, samps = state
+
+        if len(samps) != nchannels:
+            raise error("illegal state argument")
+
+        prev_i = np.array([s[0] for s in samps], dtype=np.int64)
+        cur_i = np.array([s[1] for s in samps], dtype=np.int64)
+
+    # INFO: Interpolate between samples scaled to 32 bits, as audioop does
+    frames = (_samples(cp, size) << (32 - size * 8)).reshape(-1, nchannels)
+    frame_count = len(frames)
+
+    if weightB:
+        # INFO: A one-pole filter, which depends on its previous output
+        filtered = np.empty_like(frames)
+        last = cur_i
+
+        for j in range(frame_count):
+            last = np.trunc(
+                (weightA * frames[j] + weightB * last) / (weightA + weightB)
+            ).astype(np.int64)
+            filtered[j] = last
+
+        frames = filtered
+
+    # INFO: The inputs the interpolation runs over, after the state's samples
+    inputs = np.concatenate((prev_i[None, :], cur_i[None, :], frames))
+
+    # INFO: Frame j is read when d is negative, then d grows by outrate, and
+    # each output takes inrate off d. So the nth output is made after reading
+    # the first frame j where d + (j + 1) * outrate - n * inrate >= 0.
+    end = d + frame_count * outrate
+    out_count = 0 if end < 0 else end // inrate + 1
+
+    if frame_count == 0 or out_count == 0:
+        new_d = end
+        out = np.empty((0, nchannels), dtype=np.int64)
+        last_prev = inputs[-2]
+        last_cur = inputs[-1]
+    else:
+        n = np.arange(out_count, dtype=np.int64)
+        # INFO: ceil((n * inrate - d) / outrate) - 1
+        j = -((d - n * inrate + outrate) // outrate)
+        weights = (d + (j + 1) * outrate - n * inrate).astype(np.float64)
+
+        prev = inputs[j + 1].astype(np.float64)
+        cur = inputs[j + 2].astype(np.float64)
+
+        values = (
+            prev * weights[:, None] + cur * (outrate - weights)[:, None]
+        ) / outrate
+        out = np.trunc(values).astype(np.int64)
+
+        new_d = end - out_count * inrate
+        last_prev = inputs[-2]
+        last_cur = inputs[-1]
+
+    data = _to_bytes(out.reshape(-1) >> (32 - size * 8), size)
+    samps = tuple((int(p), int(c)) for p, c in zip(last_prev, last_cur))
+
+    return data, (int(new_d), samps)
+
+
+def lin2ulaw(cp, size):
+    raise NotImplementedError()
+
+
+def ulaw2lin(cp, size):
+    raise NotImplementedError()
+
+
+def lin2alaw(cp, size):
+    raise NotImplementedError()
+
+
+def alaw2lin(cp, size):
+    raise NotImplementedError()
+
+
+def lin2adpcm(cp, size, state):
+    raise NotImplementedError()
+
+
+def adpcm2lin(cp, size, state):
+    raise NotImplementedError()
@@ -3,9 +3,73 @@ Various functions for finding/manipulating silence in AudioSegments
 """
 import itertools
 
+import numpy as np
+
+from .npaudioop import _DTYPES, _samples
 from .utils import db_to_float
 
 
+def windowed_rms(audio_segment, starts, ends):
+    """
+    Returns the rms of audio_segment[start:end] for each start and end
+    (in milliseconds), like AudioSegment.rms, in one pass over the audio
+    the windows cover.
+
+    audio_segment - the segment to measure
+    starts - array of window starts in ms
+    ends - array of window ends in ms
+    """
+    seg_len = len(audio_segment)
+    channels = audio_segment.channels
+    sample_width = audio_segment.sample_width
+    frame_ms = audio_segment.frame_rate / 1000.0
+
+    # same rounding as AudioSegment slicing
+    start_frames = (np.minimum(starts, seg_len) * frame_ms).astype(np.int64)
+    end_frames = (np.minimum(ends, seg_len) * frame_ms).astype(np.int64)
+    counts = (end_frames - start_frames) * channels
+
+    if len(counts) == 0:
+        return np.zeros(0)
+
+    # only read the frames the windows cover
+    data = audio_segment.raw_data
+    frame_count = len(data) // audio_segment.frame_width
+    first = min(int(start_frames.min()), frame_count)
+    last = min(int(end_frames.max()), frame_count)
+    data = data[first * audio_segment.frame_width:last * audio_segment.frame_width]
+
+    if sample_width <= 2:
+        # squares of 8 and 16 bit samples fit in an int32
+        samples = np.frombuffer(data, dtype=_DTYPES[sample_width]).astype(np.int32)
+    else:
+        samples = _samples(data, sample_width).astype(np.float64)
+
+    np.square(samples, out=samples)
+
+    # slices past the end are padded with silence, which counts towards
+    # the sample count but not the energy
+    start_index = (np.clip(start_frames, first, last) - first) * channels
+    end_index = (np.clip(end_frames, first, last) - first) * channels
+
+    # sum the energy between consecutive window edges, then add those up,
+    # so that only the edges are kept rather than a running sum per sample
+    edges = np.unique(np.concatenate((start_index, end_index, [len(samples)])))
+    energy = np.zeros(len(edges))
+
+    if len(samples):
+        blocks = np.add.reduceat(samples, edges[:-1], dtype=np.float64)
+        energy[1:] = np.cumsum(blocks)
+
+    sums = (energy[np.searchsorted(edges, end_index)]
+            - energy[np.searchsorted(edges, start_index)])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rms = np.floor(np.sqrt(sums / counts))
+
+    return np.where(counts > 0, rms, 0)
+
+
 def detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-16, seek_step=1):
     """
     Returns a list of all silent sections [start, end] in milliseconds of audio_segment.
@@ -26,22 +90,19 @@ def detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-16, seek
     silence_thresh = db_to_float(silence_thresh) * audio_segment.max_possible_amplitude
 
     # find silence and add start and end indicies to the to_cut list
-    silence_starts = []
-
     # check successive (1 sec by default) chunk of sound for silence
     # try a chunk at every "seek step" (or every chunk for a seek step == 1)
     last_slice_start = seg_len - min_silence_len
-    slice_starts = range(0, last_slice_start + 1, seek_step)
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step)
 
     # guarantee last_slice_start is included in the range
     # to make sure the last portion of the audio is searched
     if last_slice_start % seek_step:
-        slice_starts = itertools.chain(slice_starts, [last_slice_start])
+        slice_starts = np.append(slice_starts, last_slice_start)
 
-    for i in slice_starts:
-        audio_slice = audio_segment[i:i + min_silence_len]
-        if audio_slice.rms <= silence_thresh:
-            silence_starts.append(i)
+    # the rms of every slice, computed in one pass
+    rms = windowed_rms(audio_segment, slice_starts, slice_starts + min_silence_len)
+    silence_starts = slice_starts[rms <= silence_thresh].tolist()
 
     # short circuit when there is no silence
     if not silence_starts:
@@ -171,12 +232,28 @@ def detect_leading_silence(sound, silence_threshold=-50.0, chunk_size=10):
     silence_threshold - the upper bound for how quiet is silent in dFBS
     chunk_size - chunk size for interating over the segment in ms
     """
-    trim_ms = 0 # ms
     assert chunk_size > 0 # to avoid infinite loop
-    while sound[trim_ms:trim_ms+chunk_size].dBFS < silence_threshold and trim_ms < len(sound):
-        trim_ms += chunk_size
+    seg_len = len(sound)
+
+    # check a block of chunks at a time, so that a short leading
+    # silence doesn't need the whole segment to be read
+    block_size = chunk_size * 500
+
+    for block_start in range(0, seg_len, block_size):
+        chunk_starts = np.arange(
+            block_start, min(block_start + block_size, seg_len), chunk_size
+        )
+
+        rms = windowed_rms(sound, chunk_starts, chunk_starts + chunk_size)
+        with np.errstate(divide="ignore"):
+            dbfs = 20 * np.log10(rms / sound.max_possible_amplitude)
+
+        loud = np.nonzero(dbfs >= silence_threshold)[0]
+
+        if len(loud):
+            return min(int(chunk_starts[loud[0]]), seg_len)
 
     # if there is no end it should return the length of the segment
-    return min(trim_ms, len(sound))
+    return seg_len
 
 
@@ -14,7 +14,8 @@ from functools import wraps
 try:
     import audioop
 except ImportError:
-    import pyaudioop as audioop
+    # INFO: audioop was removed from the stdlib in Python 3.13
+    from . import npaudioop as audioop
 
 if sys.version_info >= (3, 0):
     basestring = str
@@ -0,0 +1,165 @@
+"""
+This library contains the scan manifest, a persisted snapshot of the
+music directories used to skip unchanged directories when rescanning.
+"""
+
+import json
+import os
+from typing import Iterable, Iterator
+
+from app.logger import log
+from app.settings import DbPaths
+from app.utils.filesystem import list_dir, walk_files
+
+MANIFEST_VERSION = 1
+
+# (size, mtime, inode)
+FileStat = tuple[int, float, int]
+
+
+def stat_to_tuple(stat: os.stat_result) -> FileStat:
+    return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+class ScanManifest:
+    """
+    Records the mtime and listing of every scanned directory, and the
+    (size, mtime, inode) of every supported file.
+
+    A directory's mtime changes when entries are added, removed or renamed
+    in it. When it hasn't changed since the last scan, its listing and file
+    stats are read from the manifest instead of the filesystem. Its
+    subdirectories are still checked, one stat each.
+
+    NOTE: Files edited in place (without being rewritten through a rename)
+    don't change their directory's mtime. They are only picked up when
+    `verify` is set, which re-stats the files of unchanged directories
+    while still reusing their listings.
+    """
+
+    def __init__(
+        self,
+        dirs: dict | None = None,
+        files: dict | None = None,
+        verify: bool = False,
+    ) -> None:
+        # {'dirpath': {'mtime': float, 'files': [filepath], 'subdirs': [dirpath]}}
+        self.dirs: dict[str, dict] = dirs or {}
+        # {'filepath': (size, mtime, inode)}
+        self.files: dict[str, FileStat] = files or {}
+        self.verify = verify
+
+        # INFO: The state seen by the current scan. Replaces the above on save.
+        self.new_dirs: dict[str, dict] = {}
+        self.new_files: dict[str, FileStat] = {}
+
+    @classmethod
+    def load(cls, path: str | None = None, verify: bool = False):
+        """
+        Reads the manifest file. Returns an empty manifest if there's none
+        or it can't be read, which results in a full scan.
+        """
+        path = path or DbPaths.get_scan_manifest_path()
+
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(verify=verify)
+        except (OSError, ValueError) as e:
+            log.warning("Failed to read the scan manifest: %s", e)
+            return cls(verify=verify)
+
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(verify=verify)
+
+        files = {path: tuple(stat) for path, stat in data["files"].items()}
+        return cls(dirs=data["dirs"], files=files, verify=verify)
+
+    def save(self, path: str | None = None):
+        """
+        Writes the state seen by the last scan to the manifest file.
+        """
+        path = path or DbPaths.get_scan_manifest_path()
+        temp_path = path + ".tmp"
+
+        data = {
+            "version": MANIFEST_VERSION,
+            "dirs": self.new_dirs,
+            "files": self.new_files,
+        }
+
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+
+        # INFO: Replace atomically, so an interrupted write doesn't corrupt it
+        os.replace(temp_path, path)
+
+    def read_dir(self, dirpath: str, mtime: float):
+        """
+        Lists a directory that changed since the last scan,
+        stating all its supported files.
+        """
+        files, subdirs = list_dir(dirpath)
+        listed = []
+
+        for filepath in files:
+            try:
+                self.new_files[filepath] = stat_to_tuple(os.stat(filepath))
+                listed.append(filepath)
+            except OSError:
+                continue
+
+        self.new_dirs[dirpath] = {"mtime": mtime, "files": listed, "subdirs": subdirs}
+
+    def reuse_dir(self, dirpath: str, entry: dict):
+        """
+        Copies the record of an unchanged directory from the last scan.
+        When verifying, its files are stat'ed again.
+        """
+        for filepath in entry["files"]:
+            if self.verify:
+                try:
+                    self.new_files[filepath] = stat_to_tuple(os.stat(filepath))
+                except OSError:
+                    pass
+
+                continue
+
+            stat = self.files.get(filepath)
+
+            if stat is not None:
+                self.new_files[filepath] = stat
+
+        self.new_dirs[dirpath] = entry
+
+    def visit(self, dirpath: str, stat: os.stat_result):
+        """
+        Returns the files and subdirectories of a directory, listing it
+        only if its mtime has changed since the last scan.
+        """
+        if dirpath not in self.new_dirs:
+            entry = self.dirs.get(dirpath)
+
+            if entry is not None and entry["mtime"] == stat.st_mtime:
+                self.reuse_dir(dirpath, entry)
+            else:
+                self.read_dir(dirpath, stat.st_mtime)
+
+        entry = self.new_dirs[dirpath]
+        files = [f for f in entry["files"] if f in self.new_files]
+
+        return files, entry["subdirs"]
+
+    def scan(
+        self, root: str, exclude_dirs: Iterable[str] = (), workers: int = 1
+    ) -> Iterator[tuple[str, FileStat]]:
+        """
+        Walks the given root directory, listing only the directories
+        that changed since the last scan.
+
+        Yields the path and stats of each supported file under the root
+        as it is found.
+        """
+        for filepath in walk_files(root, exclude_dirs, workers, visit=self.visit):
+            yield filepath, self.new_files[filepath]
@@ -2,10 +2,9 @@
 This library contains all the functions related to the search functionality.
 """
 
-from typing import Any, Generator, List, TypeVar
+from typing import List
 
 from rapidfuzz import process, utils
-from unidecode import unidecode
 
 from app import models
 from app.config import UserConfig
@@ -22,9 +21,9 @@ from app.serializers.track import serialize_track, serialize_tracks
 
 from app.store.albums import AlbumStore
 from app.store.artists import ArtistStore
+from app.store.search import SearchStore
 from app.store.tracks import TrackStore
 
-from app.utils.remove_duplicates import remove_duplicates
 
 # ratio = fuzz.ratio
 # wratio = fuzz.WRatio
@@ -55,69 +54,50 @@ class Limit:
 class SearchTracks:
     def __init__(self, query: str) -> None:
         self.query = query
-        self.tracks = TrackStore.get_flat_list()
 
     def __call__(self) -> List[models.Track]:
         """
         Gets all songs with a given title.
         """
-
-        track_titles = [unidecode(track.og_title).lower() for track in self.tracks]
-        results = process.extract(
-            self.query,
-            track_titles,
-            score_cutoff=Cutoff.tracks,
-            limit=Limit.tracks,
-            processor=utils.default_process,
+        trackhashes = SearchStore.tracks.search(
+            self.query, score_cutoff=Cutoff.tracks, limit=Limit.tracks
         )
 
-        tracks = [self.tracks[i[2]] for i in results]
-        return remove_duplicates(tracks)
+        return TrackStore.get_tracks_by_trackhashes(trackhashes)
 
 
 class SearchArtists:
     def __init__(self, query: str) -> None:
         self.query = query
-        self.artists = ArtistStore.get_flat_list()
 
     def __call__(self):
         """
         Gets all artists with a given name.
         """
-        artists = [unidecode(a.name).lower() for a in self.artists]
-
-        results = process.extract(
-            self.query,
-            artists,
-            score_cutoff=Cutoff.artists,
-            limit=Limit.artists,
-            processor=utils.default_process,
+        artisthashes = SearchStore.artists.search(
+            self.query, score_cutoff=Cutoff.artists, limit=Limit.artists
         )
 
-        return [self.artists[i[2]] for i in results]
+        return ArtistStore.get_artists_by_hashes(artisthashes)
 
 
 class SearchAlbums:
     def __init__(self, query: str) -> None:
         self.query = query
-        self.albums = AlbumStore.get_flat_list()
 
     def __call__(self) -> List[models.Album]:
         """
         Gets all albums with a given title.
         """
-
-        albums = [unidecode(a.og_title).lower() for a in self.albums]
-
-        results = process.extract(
-            self.query,
-            albums,
-            score_cutoff=Cutoff.albums,
-            limit=Limit.albums,
-            processor=utils.default_process,
+        albumhashes = SearchStore.albums.search(
+            self.query, score_cutoff=Cutoff.albums, limit=Limit.albums
         )
 
-        return [self.albums[i[2]] for i in results]
+        return [
+            album
+            for album in (AlbumStore.get_album_by_hash(h) for h in albumhashes)
+            if album is not None
+        ]
 
 
 class SearchPlaylists:
@@ -139,49 +119,28 @@ class SearchPlaylists:
 
 
 _type = models.Track | models.Album | models.Artist
-_S2 = TypeVar("_S2")
-_ResultType = int | float
-
-
-def get_titles(items: list[_type]):
-    for item in items:
-        if isinstance(item, models.Track):
-            text = item.og_title
-        elif isinstance(item, models.Album):
-            text = item.title
-        elif isinstance(item, models.Artist):
-            text = item.name
-        else:
-            text = None
-
-        yield text
 
 
 class TopResults:
     """
-    Joins all tracks, albums and artists
-    then fuzzy searches them as a single unit.
+    Scores all tracks, albums and artists as a single unit,
+    then fans the ranked results out to each section.
     """
 
     @staticmethod
-    def collect_all():
-        all_items: list[_type] = []
-
-        all_items.extend(ArtistStore.get_flat_list())
-        all_items.extend(TrackStore.get_flat_list())
-        all_items.extend(TrackStore.get_flat_list())
-
-        return all_items, get_titles(all_items)
-
-    @staticmethod
-    def get_results(items: Generator[str, Any, None], query: str):
-        items = list(items)
+    def get_item(itemtype: str, itemhash: str) -> _type | None:
+        """
+        Resolves a (type, hash) search result to its store item.
+        """
+        if itemtype == "tracks":
+            tracks = TrackStore.get_tracks_by_trackhashes([itemhash])
+            return tracks[0] if tracks else None
 
-        results = process.extract(
-            query=query, choices=items, score_cutoff=Cutoff.tracks, limit=1
-        )
+        if itemtype == "albums":
+            return AlbumStore.get_album_by_hash(itemhash)
 
-        return results
+        if itemtype == "artists":
+            return ArtistStore.get_artist_by_hash(itemhash)
 
     @staticmethod
     def map_with_type(item: _type):
@@ -193,7 +152,6 @@ class TopResults:
 
         if isinstance(item, models.Album):
             tracks = TrackStore.get_tracks_by_albumhash(item.albumhash)
-            tracks = remove_duplicates(tracks)
 
             try:
                 item.duration = sum((t.duration for t in tracks))
@@ -207,70 +165,48 @@ class TopResults:
             return {"type": "album", "item": item}
 
         if isinstance(item, models.Artist):
-            track_count = 0
-            duration = 0
+            return {"type": "artist", "item": item}
 
-            tracks = TrackStore.get_tracks_by_artisthash(item.artisthash)
-            tracks = remove_duplicates(tracks)
+    @staticmethod
+    def fill(items: list, more: list, key: str, limit: int):
+        """
+        Tops up `items` to `limit` with the items in `more` that are not
+        already in `items`.
+        """
+        if len(items) >= limit:
+            return items[:limit]
 
-            for track in tracks:
-                track_count += 1
-                duration += track.duration
+        seen = {getattr(i, key) for i in items}
+        items.extend(i for i in more if getattr(i, key) not in seen)
 
-            return {"type": "artist", "item": item}
+        return items[:limit]
 
     @staticmethod
-    def get_track_items(item: dict[str, _type], query: str, limit=5):
-        tracks: list[Track] = []
-
+    def get_track_items(item: dict[str, _type], ranked: list[Track], limit=5):
         if item["type"] == "track":
-            tracks.extend(SearchTracks(query)())
+            return ranked[:limit]
 
         if item["type"] == "album":
-            t = TrackStore.get_tracks_by_albumhash(item["item"].albumhash)
-            t.sort(key=lambda x: x.last_mod)
-
-            # if there are less than the limit, get more tracks
-            if len(t) < limit:
-                remainder = limit - len(t)
-                more_tracks = SearchTracks(query)()
-                t.extend(more_tracks[:remainder])
-
-            tracks.extend(t)
+            tracks = TrackStore.get_tracks_by_albumhash(item["item"].albumhash)
+            tracks.sort(key=lambda x: x.last_mod)
 
         if item["type"] == "artist":
-            # t = TrackStore.get_tracks_by_artisthash(item["item"].artisthash)
-            t = TrackStore.get_tracks_by_artisthash(item["item"].artisthash)
+            tracks = TrackStore.get_tracks_by_artisthash(item["item"].artisthash)
 
-            # if there are less than the limit, get more tracks
-            if len(t) < limit:
-                remainder = limit - len(t)
-                more_tracks = SearchTracks(query)()
-                t.extend(more_tracks[:remainder])
-
-            tracks.extend(t)
-
-        return tracks[:limit]
+        # if there are less than the limit, get more tracks
+        return TopResults.fill(tracks, ranked, "trackhash", limit)
 
     @staticmethod
-    def get_album_items(item: dict[str, _type], query: str, limit=6):
-        if item["type"] == "track":
-            return SearchAlbums(query)()[:limit]
-
-        if item["type"] == "album":
-            return SearchAlbums(query)()[:limit]
-
+    def get_album_items(
+        item: dict[str, _type], ranked: list[models.Album], limit: int = 6
+    ):
         if item["type"] == "artist":
-            # albums = AlbumStore.get_albums_by_artisthash(item["item"].artisthash)
             albums = AlbumStore.get_albums_by_artisthash(item["item"].artisthash)
 
             # if there are less than the limit, get more albums
-            if len(albums) < limit:
-                remainder = limit - len(albums)
-                more_albums = SearchAlbums(query)()
-                albums.extend(more_albums[:remainder])
+            return TopResults.fill(albums, ranked, "albumhash", limit)
 
-            return albums[:limit]
+        return ranked[:limit]
 
     @staticmethod
     def search(
@@ -279,17 +215,24 @@ class TopResults:
         albums_only=False,
         tracks_only=False,
     ):
-        items, titles = TopResults.collect_all()
-        results = TopResults.get_results(titles, query)
-
         tracks_limit = Limit.tracks if tracks_only else 4
         albums_limit = Limit.albums if albums_only else limit
         artists_limit = limit
 
-        # map results to their respective items
-        try:
-            result = [items[i[2]] for i in results][0]
-        except IndexError:
+        # INFO: Score everything once, then share the ranking between sections
+        top_result, ranked = SearchStore.search_all(
+            query,
+            score_cutoff=Cutoff.tracks,
+            limits={
+                "tracks": Limit.tracks,
+                "albums": Limit.albums,
+                "artists": Limit.artists,
+            },
+        )
+
+        result = TopResults.get_item(*top_result) if top_result else None
+
+        if result is None:
             if tracks_only:
                 return []
 
@@ -305,19 +248,30 @@ class TopResults:
 
         result = TopResults.map_with_type(result)
 
-        top_tracks = TopResults.get_track_items(result, query, limit=tracks_limit)
-        top_tracks = serialize_tracks(top_tracks)
+        ranked_tracks = TrackStore.get_tracks_by_trackhashes(ranked["tracks"])
+        top_tracks = TopResults.get_track_items(
+            result, ranked_tracks, limit=tracks_limit
+        )
 
+        # INFO: Single section searches return the unserialized items
         if tracks_only:
             return top_tracks
 
-        albums = TopResults.get_album_items(result, query, limit=albums_limit)
-        albums = serialize_albums(albums)
+        top_tracks = serialize_tracks(top_tracks)
+
+        ranked_albums = [
+            album
+            for album in (AlbumStore.get_album_by_hash(h) for h in ranked["albums"])
+            if album is not None
+        ]
+        albums = TopResults.get_album_items(result, ranked_albums, limit=albums_limit)
 
         if albums_only:
             return albums
 
-        artists = SearchArtists(query)()[:artists_limit]
+        albums = serialize_albums(albums)
+
+        artists = ArtistStore.get_artists_by_hashes(ranked["artists"][:artists_limit])
         artists = serialize_for_cards(artists)
 
         if result["type"] == "track":
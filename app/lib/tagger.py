@@ -1,18 +1,27 @@
-import os
+import itertools
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Container, Iterable
+
+from sqlalchemy.exc import SQLAlchemyError
+
 from app import settings
 from app.config import UserConfig
 from app.db.libdata import TrackTable
 
-from app.lib.taglib import extract_thumb, get_tags
+from app.lib.scanmanifest import FileStat, ScanManifest
+from app.lib.taglib import get_tags
 from app.models.album import Album
 from app.models.artist import Artist
 from app.models.track import Track
 from app.store.folder import FolderStore
+from app.store.thumbnails import ThumbnailStore
 from app.store.tracks import TrackStore
-from app.utils import flatten
-from app.utils.filesystem import run_fast_scandir
+from app.utils import chunk
 from app.utils.parsers import get_base_album_title
 from app.utils.progressbar import tqdm
+from app.utils.threading import get_cpu_count, get_process_pool
 
 from app.logger import log
 from app.utils.remove_duplicates import remove_duplicates
@@ -21,17 +30,19 @@ POPULATE_KEY: float = 0
 
 
 class IndexTracks:
-    def __init__(self, instance_key: float) -> None:
+    def __init__(self, instance_key: float, verify: bool = False) -> None:
         """
         Indexes all tracks in the database.
 
         An instance key is used to prevent multiple instances of the
-        same class from running at the same time.
+        same class from running at the same time. With `verify`, every
+        file is stat'ed, so that files edited in place are re-indexed.
         """
         global POPULATE_KEY
         POPULATE_KEY = instance_key
 
-        dirs_to_scan = UserConfig().rootDirs
+        config = UserConfig()
+        dirs_to_scan = config.rootDirs
 
         if len(dirs_to_scan) == 0:
             log.warning(
@@ -48,169 +59,321 @@ class IndexTracks:
         except IndexError:
             pass
 
-        files = set()
+        manifest = ScanManifest.load(verify=verify)
+        indexed = {
+            filepath: (last_mod, trackhash)
+            for filepath, last_mod, trackhash in TrackTable.get_scan_info()
+        }
+        modified: dict[str, str] = {}
+
+        # INFO: Files are tagged as the walk finds them
+        files = itertools.chain.from_iterable(
+            manifest.scan(_dir, config.excludeDirs, config.scanThreads)
+            for _dir in dirs_to_scan
+        )
+        untagged = self.filter_modded(files, indexed, modified)
 
-        for _dir in dirs_to_scan:
-            files = files.union(run_fast_scandir(_dir, full=True)[1])
+        self.tag_untagged(untagged, instance_key, modified)
 
-        unmodified, modified_tracks = self.filter_modded()
-        untagged = files - unmodified
+        if POPULATE_KEY != instance_key:
+            return
 
-        self.tag_untagged(untagged, instance_key)
-        self.extract_thumb_with_overwrite(modified_tracks)
+        # INFO: The walk is complete, what's left is no longer on disk
+        TrackTable.remove_tracks_by_filepaths(set(indexed))
+
+        try:
+            manifest.save()
+        except OSError as e:
+            log.warning("Failed to save the scan manifest: %s", e)
 
     @staticmethod
-    def extract_thumb_with_overwrite(tracks: list[dict[str, str]]):
+    def filter_modded(
+        files: Iterable[tuple[str, FileStat]],
+        indexed: dict[str, tuple[int, str]],
+        modified: dict[str, str],
+    ):
         """
-        Extracts the thumbnail from a list of filepaths,
-        overwriting the existing thumbnail if it exists,
-        for modified files.
+        Yields the files that need to be tagged: new files and files
+        that have been modified since they were indexed.
+
+        The modification times are read from the scanned file stats,
+        so no file is stat'ed here. Modified files are added to
+        `modified` as {filepath: trackhash}.
+
+        Seen files are popped from `indexed`, so that once the walk is
+        complete, it only holds the tracks that are no longer on disk.
         """
-        for track in tracks:
-            try:
-                extract_thumb(
-                    track["filepath"], track["trackhash"] + ".webp", overwrite=True
-                )
-            except FileNotFoundError:
+        seen = set()
+
+        for filepath, stat in files:
+            if filepath in seen:
+                continue
+
+            seen.add(filepath)
+            track = indexed.pop(filepath, None)
+
+            if track is None:
+                yield filepath
                 continue
 
+            last_mod, trackhash = track
+
+            if last_mod != round(stat[1]):
+                modified[filepath] = trackhash
+                yield filepath
+
+    def get_untagged(self):
+        tracks = TrackTable.get_all()
+
     @staticmethod
-    def filter_modded():
+    def insert_batch(batch: list[dict]):
         """
-        Removes tracks from the database that have been modified
-        since they were indexed.
+        Writes a batch of tags to the database in a single transaction.
 
-        Returns a tuple of unmodified paths and modified tracks.
-        Unmodified paths are indexed and the modified tracks are
+        If the batch fails (eg. a duplicate filepath), the tracks are
+        inserted one by one so that one bad file doesn't drop the batch.
+        """
+        if len(batch) == 0:
+            return
 
+        try:
+            TrackTable.insert_many(batch)
+        except SQLAlchemyError:
+            for tags in batch:
+                try:
+                    TrackTable.insert_one(tags)
+                except SQLAlchemyError as e:
+                    log.warning("Failed to index %s: %s", tags["filepath"], e)
+
+    def tag_untagged(
+        self, files: Iterable[str], key: float, modified: Container[str] = ()
+    ):
         """
+        Reads the tags of the given files in a process pool and writes
+        them to the database in batches of `UserConfig.indexBatchSize`.
 
-        unmodified_paths = set()
-        modified_tracks: list[dict[str, str]] = []
+        Files are read as the iterable yields them. The existing rows of
+        `modified` files are replaced when their batch is written, and
+        their album thumbnails are overwritten.
+        """
+        config = UserConfig()
+        batch_size = max(1, config.indexBatchSize)
+        batch: list[dict] = []
+        stale: set[str] = set()
+        count = 0
+        start = time.time()
 
-        to_remove = set()
+        def flush():
+            if stale:
+                TrackTable.remove_tracks_by_filepaths(stale)
+                stale.clear()
 
-        for track in TrackTable.get_all():
-            try:
-                if track.last_mod == round(os.path.getmtime(track.filepath)):
-                    unmodified_paths.add(track.filepath)
-                    continue
-            except (FileNotFoundError, OSError) as e:
-                log.warning(e)  # REVIEW More informations = good
-                to_remove.add(track.filepath)
-
-            modified_tracks.append(
-                {
-                    "filepath": track.filepath,
-                    "trackhash": track.trackhash,
-                }
-            )
+            self.insert_batch(batch)
+            batch.clear()
+            ThumbnailStore.save()
 
-        to_remove = to_remove.union(set(t["filepath"] for t in modified_tracks))
-        TrackTable.remove_tracks_by_filepaths(to_remove)
+        with get_process_pool() as executor:
+            results = read_tags_in_pool(executor, files, config, modified)
 
-        # REVIEW: Remove after testing!
-        track = TrackTable.get_tracks_by_filepaths(list(to_remove)[:1])
-        if track:
-            raise Exception("Track not removed")
-        # =============================================================
+            for filepath, tags in tqdm(results, desc="Reading files"):
+                if POPULATE_KEY != key:
+                    log.warning("'Populate.tag_untagged': Populate key changed")
+                    executor.shutdown(wait=False, cancel_futures=True)
 
-        return unmodified_paths, modified_tracks
+                    # INFO: Write what was read, as its folders and
+                    # thumbnails are already recorded
+                    flush()
+                    return
 
-    def get_untagged(self):
-        tracks = TrackTable.get_all()
+                count += 1
 
-    def tag_untagged(self, files: set[str], key: float):
-        config = UserConfig()
-        for file in tqdm(files, desc="Reading files"):
-            if POPULATE_KEY != key:
-                log.warning("'Populate.tag_untagged': Populate key changed")
-                return
+                if filepath in modified:
+                    stale.add(filepath)
 
-            tags = get_tags(file, config=config)
+                if tags is None:
+                    continue
 
-            if tags is not None:
-                TrackTable.insert_one(tags)
+                batch.append(tags)
                 FolderStore.filepaths.add(tags["filepath"])
 
-            del tags
+                if len(batch) >= batch_size:
+                    flush()
 
-        print(f"{len(files)} new files indexed")
+        flush()
+
+        elapsed = time.time() - start
+        rate = count / elapsed if elapsed else 0
+        print(f"{count} new files indexed ({rate:.0f} files/s)")
         print("Done")
 
 
+def read_tags(files: list[str], config: UserConfig, modified: Container[str] = ()):
+    """
+    Reads the tags of a chunk of files. Runs in the worker processes.
+
+    Each file is parsed once, and its embedded art is saved as the album
+    thumbnail from memory. Only the tags and the thumbnail manifest
+    entries are sent back.
+    """
+    tags = [
+        get_tags(
+            file, config=config, extract_art=True, overwrite_art=file in modified
+        )
+        for file in files
+    ]
+
+    return tags, ThumbnailStore.collect()
+
+
+def read_tags_in_pool(
+    executor: Executor,
+    files: Iterable[str],
+    config: UserConfig,
+    modified: Container[str] = (),
+):
+    """
+    Reads tags in the pool as the files are yielded, keeping a bounded
+    number of chunks in flight. Yields (filepath, tags) in input order.
+    """
+    pending: deque[tuple[list[str], Future]] = deque()
+    max_pending = (get_cpu_count() or 1) * 4
+
+    def next_results():
+        files_chunk, future = pending.popleft()
+        tags, thumbnails = future.result()
+        ThumbnailStore.merge(thumbnails)
+
+        return zip(files_chunk, tags)
+
+    for files_chunk in chunk(files, 32):
+        # INFO: Only send the chunk's modified files to the worker
+        chunk_modified = {f for f in files_chunk if f in modified}
+        future = executor.submit(read_tags, files_chunk, config, chunk_modified)
+        pending.append((files_chunk, future))
+
+        if len(pending) >= max_pending:
+            yield from next_results()
+
+    while pending:
+        yield from next_results()
+
+
+def unique_genres(genres: Iterable[dict[str, str]]) -> list[dict[str, str]]:
+    """
+    Removes duplicate genres, keeping the first of each genrehash.
+    """
+    unique: dict[str, dict[str, str]] = {}
+
+    for genre in genres:
+        unique.setdefault(genre["genrehash"], genre)
+
+    return list(unique.values())
+
+
+def create_album(tracks: list[Track]) -> tuple[Album, set[str]]:
+    """
+    Creates an album object from its tracks. The tracks should have
+    unique trackhashes.
+
+    Returns the album and the trackhashes in the album.
+    """
+    track = tracks[0]
+    genres = unique_genres(g for t in tracks if t.genres for g in t.genres)
+    trackhashes = {t.trackhash for t in tracks}
+    base_title, _ = get_base_album_title(track.og_album)
+
+    album = Album(
+        albumartists=track.albumartists,
+        artisthashes=[a["artisthash"] for a in track.albumartists],
+        albumhash=track.albumhash,
+        base_title=base_title,
+        color=None,
+        created_date=min(t.last_mod for t in tracks),
+        date=min(t.date for t in tracks),
+        duration=sum(t.duration for t in tracks),
+        genres=genres,
+        genrehashes=" ".join(g["genrehash"] for g in genres),
+        og_title=track.og_album,
+        lastplayed=max(t.lastplayed for t in tracks),
+        playcount=sum(t.playcount for t in tracks),
+        playduration=sum(t.playduration for t in tracks),
+        title=track.album,
+        trackcount=len(trackhashes),
+        extra={},
+    )
+
+    return album, trackhashes
+
+
 def create_albums(_trackhashes: list[str] = []) -> list[tuple[Album, set[str]]]:
     """
     Creates album objects using the indexed tracks. Takes in an optional
     list of trackhashes to create the albums from. If no list is provided,
     all tracks are used.
 
-    The trackhashes are passed when creating albums from the watchdogg module.
-
     Returns a list of tuples containing the album and the trackhashes in the album.
     ie:
 
     >>> list[tuple[Album, set[str]]]
     """
-    albums = dict()
+    albums: dict[str, list[Track]] = {}
 
+    # INFO: Tracks resolved by trackhash are already unique
     if _trackhashes:
         all_tracks: list[Track] = TrackStore.get_tracks_by_trackhashes(_trackhashes)
     else:
-        all_tracks: list[Track] = TrackStore.get_flat_list()
-
-    all_tracks = remove_duplicates(all_tracks)
+        all_tracks: list[Track] = remove_duplicates(TrackStore.get_flat_list())
 
     for track in all_tracks:
-        if track.albumhash not in albums:
-            albums[track.albumhash] = {
-                "albumartists": track.albumartists,
-                "artisthashes": [a["artisthash"] for a in track.albumartists],
-                "albumhash": track.albumhash,
-                "base_title": None,
-                "color": None,
-                "created_date": track.last_mod,
-                "date": track.date,
-                "duration": track.duration,
-                "genres": [*track.genres] if track.genres else [],
-                "og_title": track.og_album,
-                "lastplayed": track.lastplayed,
-                "playcount": track.playcount,
-                "playduration": track.playduration,
-                "title": track.album,
-                "tracks": {track.trackhash},
-                "extra": {},
-            }
-        else:
-            album = albums[track.albumhash]
-            album["tracks"].add(track.trackhash)
-            album["playcount"] += track.playcount
-            album["playduration"] += track.playduration
-            album["lastplayed"] = max(album["lastplayed"], track.lastplayed)
-            album["duration"] += track.duration
-            album["date"] = min(album["date"], track.date)
-            album["created_date"] = min(album["created_date"], track.last_mod)
-
-            if track.genres:
-                album["genres"].extend(track.genres)
-
-    for album in albums.values():
-        genres = []
-        for genre in album["genres"]:
-            if genre not in genres:
-                genres.append(genre)
-
-        album["genres"] = genres
-        album["genrehashes"] = " ".join([g["genrehash"] for g in genres])
-        album["base_title"], _ = get_base_album_title(album["og_title"])
-
-        del genres
-        trackhashes = album.pop("tracks")
-        album["trackcount"] = len(trackhashes)
-
-        albums[album["albumhash"]] = (Album(**album), trackhashes)
-
-    return list(albums.values())
+        albums.setdefault(track.albumhash, []).append(track)
+
+    return [create_album(tracks) for tracks in albums.values()]
+
+
+def create_artist(artisthash: str, tracks: list[Track]):
+    """
+    Creates an artist object from the tracks they appear in, either as
+    a track artist or an album artist. The tracks should have unique
+    trackhashes.
+
+    Returns the artist, the trackhashes of the tracks they appear in as
+    a track artist, and the albumhashes.
+    """
+    names: set[str] = set()
+    trackhashes: set[str] = set()
+    albumhashes: set[str] = set()
+
+    for track in tracks:
+        albumhashes.add(track.albumhash)
+
+        for artist in track.artists:
+            if artist["artisthash"] == artisthash:
+                names.add(artist["name"])
+                trackhashes.add(track.trackhash)
+
+        for artist in track.albumartists:
+            if artist["artisthash"] == artisthash:
+                names.add(artist["name"])
+
+    genres = unique_genres(g for t in tracks if t.genres for g in t.genres)
+
+    artist = Artist(
+        name=sorted(names)[0],
+        albumcount=len(albumhashes),
+        artisthash=artisthash,
+        created_date=min(t.last_mod for t in tracks),
+        date=min(t.date for t in tracks),
+        duration=sum(t.duration for t in tracks),
+        genres=genres,
+        genrehashes=" ".join(g["genrehash"] for g in genres),
+        trackcount=len(trackhashes),
+        lastplayed=max(t.lastplayed for t in tracks),
+        playcount=sum(t.playcount for t in tracks),
+        playduration=sum(t.playduration for t in tracks),
+        extra={},
+    )
+
+    return artist, trackhashes, albumhashes
 
 
 def create_artists(
@@ -228,86 +391,19 @@ def create_artists(
     >>> list[tuple[Artist, set[str], set[str]]]
     """
     if artisthashes:
-        all_tracks: list[Track] = flatten(
-            [TrackStore.get_tracks_by_artisthash(hash) for hash in artisthashes]
-        )
-    else:
-        all_tracks: list[Track] = TrackStore.get_flat_list()
+        return [
+            create_artist(hash, tracks)
+            for hash in artisthashes
+            if (tracks := TrackStore.get_unique_tracks_by_artisthash(hash))
+        ]
 
-    all_tracks = remove_duplicates(all_tracks)
-    artists = dict()
+    artists: dict[str, list[Track]] = {}
 
-    for track in all_tracks:
-        this_artists = track.artists
-
-        for a in track.albumartists:
-            if a not in this_artists:
-                a["in_track"] = False
-                this_artists.append(a)
-
-        for thisartist in this_artists:
-            if thisartist["artisthash"] not in artists:
-                artists[thisartist["artisthash"]] = {
-                    "albumcount": None,
-                    "albums": {track.albumhash},
-                    "artisthash": thisartist["artisthash"],
-                    "created_date": track.last_mod,
-                    "date": track.date,
-                    "duration": track.duration,
-                    "genres": track.genres if track.genres else [],
-                    "name": None,
-                    "names": {thisartist["name"]},
-                    "lastplayed": track.lastplayed,
-                    "playcount": track.playcount,
-                    "playduration": track.playduration,
-                    "trackcount": None,
-                    "tracks": (
-                        {track.trackhash} if thisartist.get("in_track", True) else set()
-                    ),
-                    "extra": {},
-                }
-            else:
-                artist: dict = artists[thisartist["artisthash"]]
-                artist["duration"] += track.duration
-                artist["playcount"] += track.playcount
-                artist["playduration"] += track.playduration
-                artist["albums"].add(track.albumhash)
-                artist["date"] = min(artist["date"], track.date)
-                artist["lastplayed"] = max(artist["lastplayed"], track.lastplayed)
-                artist["created_date"] = min(artist["created_date"], track.last_mod)
-                artist["names"].add(thisartist["name"])
-
-                artist.setdefault("albums", set())
-
-                if thisartist.get("in_track", True):
-                    artist["tracks"].add(track.trackhash)
-
-                if track.genres:
-                    artist["genres"].extend(track.genres)
-
-    for artist in artists.values():
-        artist["albumcount"] = len(artist["albums"])
-        artist["trackcount"] = len(artist["tracks"])
-
-        genres = []
-
-        for genre in artist["genres"]:
-            if genre not in genres:
-                genres.append(genre)
-
-        artist["genres"] = genres
-        artist["genrehashes"] = " ".join([g["genrehash"] for g in genres])
-        artist["name"] = sorted(artist["names"])[0]
-
-        # INFO: Delete temporary keys
-        del artist["names"]
-
-        tracks = artist.pop("tracks")
-        albums = artist.pop("albums")
-
-        # INFO: Delete local variables
-        del genres
-
-        artists[artist["artisthash"]] = (Artist(**artist), tracks, albums)
-
-    return list(artists.values())
+    for track in remove_duplicates(TrackStore.get_flat_list()):
+        hashes = {a["artisthash"] for a in track.artists}
+        hashes.update(a["artisthash"] for a in track.albumartists)
+
+        for hash in hashes:
+            artists.setdefault(hash, []).append(track)
+
+    return [create_artist(hash, tracks) for hash, tracks in artists.items()]
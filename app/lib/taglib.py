@@ -6,6 +6,7 @@ from pathlib import Path
 from pprint import pprint
 import re
 import sys
+import threading
 from typing import Any
 
 import pendulum
@@ -13,7 +14,9 @@ from PIL import Image, UnidentifiedImageError
 from tinytag import TinyTag
 
 from app.config import UserConfig
-from app.settings import Defaults, Paths
+from app.settings import Defaults
+from app.lib.imagepack import ImagePack, get_image_dir
+from app.store.thumbnails import THUMB_SIZES, ThumbnailStore
 from app.utils.hashing import create_hash
 from app.utils.parsers import split_artists
 from app.utils.wintools import win_replace_slash
@@ -31,55 +34,97 @@ def parse_album_art(filepath: str):
         return None
 
 
-def extract_thumb(filepath: str, webp_path: str, overwrite=False) -> bool:
+def get_thumb_sizes():
     """
-    Extracts the thumbnail from an audio file.
-    Returns the path to the thumbnail.
+    Returns the thumbnail sizes with their width,
+    from the largest to the smallest.
     """
-    lg_img_path = os.path.join(Paths.get_lg_thumb_path(), webp_path)
-    sm_img_path = os.path.join(Paths.get_sm_thumb_path(), webp_path)
-    xms_img_path = os.path.join(Paths.get_xsm_thumb_path(), webp_path)
-    md_img_path = os.path.join(Paths.get_md_thumb_path(), webp_path)
-
-    images = [
-        (lg_img_path, Defaults.LG_THUMB_SIZE),
-        (sm_img_path, Defaults.SM_THUMB_SIZE),
-        (xms_img_path, Defaults.XSM_THUMB_SIZE),
-        (md_img_path, Defaults.MD_THUMB_SIZE),
-    ]
+    sizes = {
+        "lg": Defaults.LG_THUMB_SIZE,
+        "md": Defaults.MD_THUMB_SIZE,
+        "sm": Defaults.SM_THUMB_SIZE,
+        "xsm": Defaults.XSM_THUMB_SIZE,
+    }
 
-    def save_image(img: Image.Image):
-        width, height = img.size
-        ratio = width / height
+    return [(size, sizes[size]) for size in THUMB_SIZES]
 
-        for path, size in images:
-            img.resize((size, int(size / ratio)), Image.ANTIALIAS).save(path, "webp")
 
-    if not overwrite and os.path.exists(sm_img_path):
-        img_size = os.path.getsize(sm_img_path)
+def thumb_exists(webp_path: str):
+    """
+    Checks the thumbnail manifest for a saved thumbnail.
+    """
+    return ThumbnailStore.has(webp_path.removesuffix(".webp"))
 
-        if img_size > 0:
-            return True
 
-    album_art = parse_album_art(filepath)
+def save_thumb(
+    album_art: bytes | None, webp_path: str, source_mtime: float = 0
+) -> bool:
+    """
+    Saves the thumbnails of the given album art, to the image pack if
+    packing is enabled, and adds them to the thumbnail manifest.
+    Returns whether the art could be saved.
+    """
+    if album_art is None:
+        return False
 
-    if album_art is not None:
-        try:
-            img = Image.open(BytesIO(album_art))
-        except (UnidentifiedImageError, OSError):
-            return False
+    hash = webp_path.removesuffix(".webp")
+    sizes = get_thumb_sizes()
+    packed: dict[str, bytes] = {}
 
-        try:
-            save_image(img)
-        except OSError:
-            try:
-                png = img.convert("RGB")
-                save_image(png)
-            except:  # pylint: disable=bare-except
-                return False
+    try:
+        img = Image.open(BytesIO(album_art))
+        ratio = img.width / img.height
+
+        # INFO: Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale,
+        # as long as that's still bigger than the largest thumbnail.
+        _, largest = sizes[0]
+        img.draft("RGB", (largest, int(largest / ratio)))
+
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+
+        # INFO: Each size is resized from the one before it,
+        # instead of resizing the full image every time.
+        for size, width in sizes:
+            img = img.resize((width, int(width / ratio)), Image.LANCZOS)
+
+            if ImagePack.enabled():
+                buffer = BytesIO()
+                img.save(buffer, "webp")
+                packed[size] = buffer.getvalue()
+                continue
 
+            path = os.path.join(get_image_dir(size), webp_path)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(temp_path, "webp")
+            os.replace(temp_path, path)
+
+        if packed:
+            ImagePack.append(hash, packed)
+        else:
+            # INFO: Older packed copies would be served instead of the files
+            ImagePack.remove(hash, [size for size, _ in sizes])
+    except (UnidentifiedImageError, OSError, ValueError, ZeroDivisionError):
+        return False
+
+    ThumbnailStore.add(hash, source_mtime)
+    return True
+
+
+def extract_thumb(filepath: str, webp_path: str, overwrite=False) -> bool:
+    """
+    Extracts the thumbnail from an audio file.
+    Returns whether the thumbnail exists.
+    """
+    if not overwrite and thumb_exists(webp_path):
         return True
-    return False
+
+    try:
+        source_mtime = os.path.getmtime(filepath)
+    except OSError:
+        return False
+
+    return save_thumb(parse_album_art(filepath), webp_path, source_mtime)
 
 
 def parse_date(date_str: str) -> int | None:
@@ -141,9 +186,19 @@ def extract_artist_title(filename: str, config: UserConfig):
     return ParseData(artist, title, config)
 
 
-def get_tags(filepath: str, config: UserConfig):
+def get_tags(
+    filepath: str,
+    config: UserConfig,
+    extract_art: bool = False,
+    overwrite_art: bool = False,
+):
     """
     Returns the tags for a given audio file.
+
+    With `extract_art`, the embedded art is read in the same pass and saved
+    as the album's thumbnail, if it has none or `overwrite_art` is set and
+    the thumbnail is from an older file. This saves opening the file again
+    to extract it.
     """
 
     filetype = filepath.split(".")[-1]
@@ -155,7 +210,7 @@ def get_tags(filepath: str, config: UserConfig):
         return None
 
     try:
-        tags: Any = TinyTag.get(filepath)
+        tags: Any = TinyTag.get(filepath, image=extract_art)
     except:  # noqa: E722
         return None
 
@@ -241,6 +296,14 @@ def get_tags(filepath: str, config: UserConfig):
     # create albumhash using og_album
     tags.albumhash = create_hash(tags.album or "", tags.albumartist)
 
+    if extract_art:
+        thumb_mtime = ThumbnailStore.get_source_mtime(tags.albumhash)
+
+        # INFO: A modified file only replaces a thumbnail read from an older
+        # file, so an album's thumbnail is saved once for all its tracks.
+        if thumb_mtime is None or (overwrite_art and thumb_mtime < last_mod):
+            save_thumb(tags.get_image(), tags.albumhash + ".webp", last_mod)
+
     # extract featured artists
     # if config.extractFeaturedArtists:
     #     feat, new_title = parse_feat_from_title(
@@ -3,19 +3,96 @@ This library contains all the functions related to tracks.
 """
 
 import os
+import re
+import subprocess
+from typing import Callable
 
+from tinytag import TinyTag
+
+from app.db.libdata import AnalysisTable
 from app.lib.pydub.pydub import AudioSegment
+from app.lib.pydub.pydub.exceptions import CouldntDecodeError
 from app.lib.pydub.pydub.silence import detect_leading_silence, detect_silence
 from app.utils.threading import ThreadWithReturnValue
 
+SILENCE_THRESHOLD = -40.0
+
+# INFO: Only these windows are decoded, in seconds
+LEADING_WINDOW = 10
+TRAILING_WINDOW = 30
+
+# INFO: The format audio is decoded to for analysis
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+# INFO: The ReplayGain 2.0 reference level, in LUFS
+REFERENCE_LOUDNESS = -18.0
+# INFO: EBU R128's absolute gate. Silence (-inf) is reported as this.
+MIN_LOUDNESS = -70.0
+# INFO: Niceness of the FFmpeg processes that run background analysis
+LOW_PRIORITY = 10
+
+LOUDNESS_PATTERNS = {
+    "integrated": re.compile(r"I:\s+(-?[\d.]+|-inf) LUFS"),
+    "range": re.compile(r"LRA:\s+(-?[\d.]+) LU\b"),
+    "true_peak": re.compile(r"Peak:\s+(-?[\d.]+|-inf) dBFS"),
+}
+
+
+def decode_window(filepath: str, start: float = 0, duration: float | None = None):
+    """
+    Decodes part of a file, seeking to `start` (in seconds) before decoding.
+    Decodes until the end of the file if `duration` is not given.
+    """
+    # INFO: -ss before -i seeks in the input instead of decoding up to `start`
+    command = [AudioSegment.converter, "-v", "error", "-ss", str(start), "-i", filepath]
+
+    if duration is not None:
+        command += ["-t", str(duration)]
+
+    command += [
+        "-vn",
+        "-f",
+        "s16le",
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(SAMPLE_RATE),
+        "-ac",
+        str(CHANNELS),
+        "-",
+    ]
+
+    result = subprocess.run(command, capture_output=True)
+
+    if result.returncode != 0:
+        raise CouldntDecodeError(
+            f"Decoding {filepath} failed: {result.stderr.decode(errors='ignore')}"
+        )
+
+    return AudioSegment(
+        data=result.stdout, sample_width=2, frame_rate=SAMPLE_RATE, channels=CHANNELS
+    )
+
+
+def get_duration(filepath: str) -> float | None:
+    """
+    Returns the duration of a file in seconds, read from its headers.
+    """
+    try:
+        return TinyTag.get(filepath).duration
+    except Exception:
+        return None
+
 
 def get_leading_silence_end(filepath: str):
     """
     Returns the leading silence of a track.
     """
-    format = filepath.split(".")[-1]
-    audio = AudioSegment.from_file(filepath, format=format)
-    silence = detect_leading_silence(audio, silence_threshold=-40.0, chunk_size=10)
+    audio = decode_window(filepath, duration=LEADING_WINDOW)
+    silence = detect_leading_silence(
+        audio, silence_threshold=SILENCE_THRESHOLD, chunk_size=10
+    )
 
     return silence if silence > 1000 else 0
 
@@ -24,12 +101,20 @@ def get_trailing_silence_start(filepath: str):
     """
     Returns the trailing silence of a track.
     """
-    format = filepath.split(".")[-1]
-    audio = AudioSegment.from_file(filepath, format=format)
-    duration = len(audio)
+    duration = get_duration(filepath)
+
+    if duration:
+        audio = decode_window(filepath, start=max(0, duration - TRAILING_WINDOW))
+        duration = int(duration * 1000)
+    else:
+        # INFO: The duration is unknown, so decode the whole file to get it
+        audio = decode_window(filepath)
+        duration = len(audio)
+        audio = audio[-TRAILING_WINDOW * 1000 :]
 
-    audio = audio[-30000:] if len(audio) > 30000 else audio
-    silence_groups = detect_silence(audio, silence_thresh=-40.0, seek_step=10)
+    silence_groups = detect_silence(
+        audio, silence_thresh=SILENCE_THRESHOLD, seek_step=10
+    )
 
     if len(silence_groups) == 0:
         return duration
@@ -43,6 +128,95 @@ def get_trailing_silence_start(filepath: str):
     return duration
 
 
+def run_low_priority(command: list[str], stdout: int = subprocess.DEVNULL):
+    """
+    Runs a command at a lower CPU priority than the server,
+    and returns its stdout (if piped) and stderr.
+    """
+    kwargs = {}
+
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+
+    process = subprocess.Popen(command, stdout=stdout, stderr=subprocess.PIPE, **kwargs)
+
+    if hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, process.pid, LOW_PRIORITY)
+        except OSError:
+            pass
+
+    output, stderr = process.communicate()
+
+    if process.returncode != 0:
+        raise CouldntDecodeError(stderr.decode(errors="ignore"))
+
+    return output, stderr.decode(errors="ignore")
+
+
+def get_loudness(filepath: str):
+    """
+    Measures the loudness of a file with FFmpeg's EBU R128 filter.
+
+    Returns the integrated loudness (LUFS), loudness range (LU) and true peak
+    (dBFS), with the ReplayGain-style gain (dB) and peak (linear) they give.
+    Returns None if the file can't be decoded.
+    """
+    command = [
+        AudioSegment.converter,
+        "-nostats",
+        "-hide_banner",
+        "-i",
+        filepath,
+        "-vn",
+        "-af",
+        "ebur128=peak=true",
+        "-f",
+        "null",
+        "-",
+    ]
+
+    try:
+        _, output = run_low_priority(command)
+    except (OSError, CouldntDecodeError):
+        return None
+
+    # INFO: The per-frame measurements come before the summary
+    summary = output.rsplit("Summary:", 1)[-1]
+    values: dict[str, float] = {}
+
+    for key, pattern in LOUDNESS_PATTERNS.items():
+        match = pattern.search(summary)
+
+        if match is None:
+            return None
+
+        values[key] = max(float(match.group(1)), MIN_LOUDNESS)
+
+    return {
+        **values,
+        "gain": round(REFERENCE_LOUDNESS - values["integrated"], 2),
+        "peak": round(10 ** (values["true_peak"] / 20), 6),
+    }
+
+
+def get_analysis_result(filepath: str, key: str, analyze: Callable[[str], int]):
+    """
+    Returns an analysis result saved for the file's current mtime,
+    running `analyze` and saving its result if there's none.
+    """
+    last_mod = round(os.path.getmtime(filepath))
+    results = AnalysisTable.get_results(filepath, last_mod)
+
+    if key in results:
+        return results[key]
+
+    result = analyze(filepath)
+    AnalysisTable.set_results(filepath, last_mod, {key: result})
+
+    return result
+
+
 def get_silence_paddings(ending_file: str, starting_file: str):
     """
     Returns the ending silence of a track and the starting silence of the next.
@@ -53,13 +227,15 @@ def get_silence_paddings(ending_file: str, starting_file: str):
 
     if os.path.exists(ending_file):
         ending_thread = ThreadWithReturnValue(
-            target=get_trailing_silence_start, args=(ending_file,)
+            target=get_analysis_result,
+            args=(ending_file, "trailing_silence_start", get_trailing_silence_start),
         )
         ending_thread.start()
 
     if os.path.exists(starting_file):
         starting_thread = ThreadWithReturnValue(
-            target=get_leading_silence_end, args=(starting_file,)
+            target=get_analysis_result,
+            args=(starting_file, "leading_silence_end", get_leading_silence_end),
         )
         starting_thread.start()
 
@@ -0,0 +1,162 @@
+"""
+This library contains the on-disk cache of transcoded audio files.
+"""
+
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+from app.config import UserConfig
+from app.logger import log
+from app.settings import Paths
+
+PART_PREFIX = "part-"
+
+
+class TranscodeCache:
+    """
+    Keeps transcoded files in the app directory so that repeat plays
+    skip ffmpeg, and so that they survive restarts.
+
+    Files are keyed by (trackhash, source mtime, bitrate, container), so
+    a changed source file or a different quality never hits a stale entry.
+
+    A file is written under a "part-" name while ffmpeg runs, and renamed
+    to its final name once ffmpeg succeeds. When the cache grows past
+    `UserConfig.transcodeCacheSize`, the least recently used files are
+    deleted.
+    """
+
+    # {'filename': size}, least recently used first
+    entries: OrderedDict[str, int] = OrderedDict()
+    size: int = 0
+    lock = threading.Lock()
+    loaded = False
+    part_counter = itertools.count()
+
+    @staticmethod
+    def get_filename(trackhash: str, mtime: float, bitrate: str, container: str):
+        return f"{trackhash}.{int(mtime)}.{bitrate}.{container}"
+
+    @staticmethod
+    def get_path(filename: str):
+        return os.path.join(Paths.get_transcodes_path(), filename)
+
+    @classmethod
+    def load(cls):
+        """
+        Reads the existing cache files, ordered by when they were last used.
+        Leftover part files from an interrupted transcode are deleted.
+        """
+        with cls.lock:
+            if cls.loaded:
+                return
+
+            entries: list[tuple[float, str, int]] = []
+            path = Paths.get_transcodes_path()
+            os.makedirs(path, exist_ok=True)
+
+            for entry in os.scandir(path):
+                try:
+                    if entry.name.startswith(PART_PREFIX):
+                        os.remove(entry.path)
+                        continue
+
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+                except OSError:
+                    continue
+
+            cls.entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+            cls.size = sum(cls.entries.values())
+            cls.loaded = True
+
+    @classmethod
+    def find(cls, filename: str) -> str | None:
+        """
+        Returns the path to a complete cached file, marking it as recently used.
+        """
+        cls.load()
+
+        with cls.lock:
+            if filename not in cls.entries:
+                return None
+
+            cls.entries.move_to_end(filename)
+
+        path = cls.get_path(filename)
+
+        try:
+            # INFO: The mtime is used to restore the LRU order on restart
+            os.utime(path)
+        except FileNotFoundError:
+            with cls.lock:
+                cls.size -= cls.entries.pop(filename, 0)
+
+            return None
+
+        return path
+
+    @classmethod
+    def get_part_path(cls, filename: str) -> str:
+        """
+        Returns a new path for a transcode to be written to until it completes.
+        Each call returns a different path, so that a cancelled transcode
+        that is still stopping never shares its file with a new one.
+        """
+        cls.load()
+        return cls.get_path(f"{PART_PREFIX}{next(cls.part_counter)}-{filename}")
+
+    @classmethod
+    def commit(cls, filename: str, part_path: str) -> str | None:
+        """
+        Moves a completed transcode into the cache.
+        Returns its new path, or None if it couldn't be moved.
+        """
+        path = cls.get_path(filename)
+
+        try:
+            os.replace(part_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            log.warning("Failed to cache transcoded file %s: %s", filename, e)
+            return None
+
+        with cls.lock:
+            cls.size += size - cls.entries.get(filename, 0)
+            cls.entries[filename] = size
+            cls.entries.move_to_end(filename)
+
+        cls.evict()
+        return path
+
+    @classmethod
+    def discard(cls, part_path: str):
+        """
+        Deletes the part file of a failed transcode.
+        """
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+    @classmethod
+    def evict(cls):
+        """
+        Deletes the least recently used files until the cache fits its budget.
+        """
+        budget = UserConfig().transcodeCacheSize * 1024 * 1024
+
+        while True:
+            with cls.lock:
+                if cls.size <= budget or not cls.entries:
+                    return
+
+                filename, size = cls.entries.popitem(last=False)
+                cls.size -= size
+
+            try:
+                os.remove(cls.get_path(filename))
+            except OSError:
+                pass
@@ -1,78 +1,377 @@
-from app.utils.threading import background
+import heapq
+import itertools
+import subprocess
+import threading
+from typing import Callable, Iterator
 
+from app.config import UserConfig
+from app.logger import log
 
-import subprocess
+CHUNK_SIZE = 1024 * 64
 
+# INFO: Lower values run first
+PRIORITY_PLAYBACK = 0
+PRIORITY_PREFETCH = 1
 
-@background
-def start_transcoding(
-    input_path: str, output_path: str, bitrate: str, container_args: list[str], compression_level: int = 12
-):
-    """
-    Starts a background transcoding process for an audio file.
+# {'container': (ffmpeg muxer, codec args)}
+FORMATS: dict[str, tuple[str, list[str]]] = {
+    "mp3": ("mp3", ["-c:a", "libmp3lame"]),
+    "aac": ("adts", ["-c:a", "aac"]),
+    "webm": ("webm", ["-c:a", "libopus"]),
+    "ogg": ("ogg", ["-c:a", "libvorbis"]),
+    "flac": ("flac", ["-c:a", "flac"]),
+    "wav": ("wav", ["-c:a", "pcm_s16le"]),
+}
 
-    This function uses FFmpeg to transcode an audio file from one format to another,
-    with specified bitrate and container format. It runs as a background task.
+
+def get_ffmpeg_command(
+    input_path: str, bitrate: str, container: str, compression_level: int = 12
+) -> list[str]:
+    """
+    Returns the FFmpeg command that transcodes a file and writes it to stdout.
 
     Args:
         input_path (str): The path to the input audio file.
-        output_path (str): The path where the transcoded file will be saved.
         bitrate (str): The desired bitrate for the output file (e.g., "128k").
-        container_args (list[str]): FFmpeg arguments specific to the output container format.
+        container (str): One of the keys of `FORMATS`.
         compression_level (int): Compression level (0-9, default: 6).
-
-    Returns:
-        None
-
-    Note:
-        This function is decorated with @background, which means it runs asynchronously.
-        The actual transcoding process is handled by FFmpeg in a subprocess.
-        The function will print status messages about the transcoding process.
     """
-    # Base command
-    command = [
+    muxer, codec_args = FORMATS[container]
+
+    return [
         "ffmpeg",
         "-i",
         input_path,
-        "-map_metadata", "0",  # Add this line to copy metadata
+        "-map_metadata",
+        "0",  # copy metadata
         "-b:a",
         bitrate,
         "-vn",
         "-compression_level",
         str(compression_level),
-        # REVIEW: Idk what any flag below this point does!
-        "-movflags",
-        "faststart+frag_keyframe+empty_moov",
         "-write_xing",
         "0",
         "-fflags",
         "+bitexact",
+        *codec_args,
+        "-f",
+        muxer,
+        "pipe:1",
     ]
 
-    # Add format-specific parameters
-    command.extend(container_args)
-
-    # Add output path and overwrite flag
-    command.extend([output_path, "-y"])
-
-    process = subprocess.Popen(
-        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-    )
-    print(f"Started transcoding process with PID: {process.pid}")
-
-    try:
-        # Wait for the process to complete
-        process.wait()
-        print(f"Transcoding process (PID: {process.pid}) completed")
-    except KeyboardInterrupt:
-        print(f"Transcoding interrupted. Terminating process (PID: {process.pid})")
-    finally:
-        # Ensure the process is terminated
+
+class TranscodeJob:
+    """
+    An FFmpeg process whose output is read from its stdout pipe
+    and written to `output_path` as it arrives.
+
+    Any number of readers can follow the output with `iter_chunks`,
+    without polling: they are woken up whenever a chunk is written.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        command: list[str],
+        on_done: Callable[[bool], str | None] | None = None,
+        priority: int = PRIORITY_PLAYBACK,
+    ):
+        # NOTE: `output_path` is updated when the file is moved on completion
+        self.input_path = input_path
+        self.output_path = output_path
+        self.command = command
+        self.on_done = on_done
+        self.priority = priority
+
+        # INFO: Set by the scheduler
+        self.state = "queued"
+        self.readers = 0
+        self.keep = priority == PRIORITY_PREFETCH
+
+        self.size = 0
+        self.done = False
+        self.success = False
+        self.cancelled = False
+        self.process: subprocess.Popen | None = None
+        self.condition = threading.Condition()
+
+        # INFO: Create the file up front so that readers can open it right away
+        open(self.output_path, "wb").close()
+
+    def start(self):
+        """
+        Starts FFmpeg and the thread that copies its output to the file.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
         try:
-            process.terminate()
-            process.wait(timeout=5)  # Wait up to 5 seconds for graceful termination
-        except subprocess.TimeoutExpired:
-            print(
-                f"Process (PID: {process.pid}) did not terminate gracefully. Killing..."
+            process = subprocess.Popen(
+                self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
             )
-            process.kill()
\ No newline at end of file
+        except OSError as e:
+            log.error("Failed to start FFmpeg: %s", e)
+            self.finish(False)
+            return
+
+        with self.condition:
+            self.process = process
+
+            if self.cancelled:
+                process.kill()
+
+        try:
+            with open(self.output_path, "ab") as file:
+                while chunk := process.stdout.read1(CHUNK_SIZE):
+                    file.write(chunk)
+                    file.flush()
+
+                    with self.condition:
+                        self.size += len(chunk)
+                        self.condition.notify_all()
+
+            success = process.wait() == 0 and not self.cancelled
+        except OSError as e:
+            log.error("Transcoding %s failed: %s", self.input_path, e)
+            process.kill()
+            process.wait()
+            success = False
+
+        self.finish(success)
+
+    def kill(self):
+        """
+        Stops FFmpeg. The job then finishes as failed.
+        """
+        with self.condition:
+            self.cancelled = True
+
+            if self.process is not None:
+                self.process.kill()
+
+    def finish(self, success: bool):
+        """
+        Marks the job as done. `on_done` is called with whether FFmpeg
+        succeeded, and can return the path the output was moved to.
+        """
+        with self.condition:
+            # INFO: Readers open the file under this lock, so they never
+            # see the old path after the file has been moved.
+            if self.on_done is not None:
+                self.output_path = self.on_done(success) or self.output_path
+
+            self.done = True
+            self.success = success
+            self.condition.notify_all()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """
+        Yields the output from the start as it is written,
+        until FFmpeg exits.
+        """
+        position = 0
+
+        try:
+            with self.condition:
+                file = open(self.output_path, "rb")
+        except FileNotFoundError:
+            return
+
+        with file:
+            while True:
+                with self.condition:
+                    while self.size <= position and not self.done:
+                        self.condition.wait()
+
+                    size = self.size
+
+                if position >= size:
+                    return
+
+                while position < size:
+                    chunk = file.read(min(CHUNK_SIZE, size - position))
+
+                    if not chunk:
+                        return
+
+                    position += len(chunk)
+                    yield chunk
+
+
+class TranscodeStream:
+    """
+    A response body that follows a transcode job.
+
+    The WSGI server closes it when the response ends or the client
+    disconnects, which lets the scheduler cancel jobs nobody is reading.
+
+    The job must have been returned by `TranscodeJobs.get_or_start` with
+    `attach=True`, which adds this stream as a reader.
+    """
+
+    def __init__(self, job: TranscodeJob):
+        self.job = job
+        self.chunks = job.iter_chunks()
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.chunks.close()
+        TranscodeJobs.detach(self.job)
+
+
+class TranscodeJobs:
+    """
+    Schedules transcodes, running at most `UserConfig.transcodeWorkers`
+    FFmpeg processes at a time. Queued jobs run by priority, so the track
+    being played goes before prefetched ones.
+
+    Jobs are keyed by their cache filename, so that a request for a file
+    that is already being transcoded follows the existing job instead of
+    starting FFmpeg again. Playback jobs are cancelled once all their
+    readers disconnect. Prefetch jobs run to completion to fill the cache.
+    """
+
+    jobs: dict[str, TranscodeJob] = {}
+    # (priority, order, job). Entries whose priority no longer matches
+    # their job's are stale and are skipped.
+    queue: list[tuple[int, int, TranscodeJob]] = []
+    running: int = 0
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    @classmethod
+    def get_or_start(
+        cls,
+        key: str,
+        input_path: str,
+        output_path: str,
+        bitrate: str,
+        container: str,
+        on_done: Callable[[bool], str | None] | None = None,
+        priority: int = PRIORITY_PLAYBACK,
+        attach: bool = False,
+    ) -> TranscodeJob:
+        """
+        Returns the existing job for the key, or queues a new one.
+
+        Jobs that are being cancelled are not reused, as their output ends
+        early. If `attach` is True, a reader is added to the returned job
+        under the same lock, so that it can't be cancelled in between.
+        """
+        max_workers = max(1, UserConfig().transcodeWorkers)
+
+        with cls.lock:
+            job = cls.jobs.get(key)
+
+            if job is not None and cls.is_reusable(job):
+                if priority == PRIORITY_PREFETCH:
+                    job.keep = True
+
+                if job.state == "queued" and priority < job.priority:
+                    job.priority = priority
+                    heapq.heappush(cls.queue, (priority, next(cls.counter), job))
+
+                if attach:
+                    job.readers += 1
+
+                return job
+
+            def done(success: bool):
+                # INFO: Move the output before forgetting the job, so that a new
+                # job for the same key never truncates a file still in use.
+                path = on_done(success) if on_done is not None else None
+                cls.forget(key, job)
+                return path
+
+            command = get_ffmpeg_command(input_path, bitrate, container)
+            job = TranscodeJob(input_path, output_path, command, done, priority)
+
+            if attach:
+                job.readers += 1
+
+            cls.jobs[key] = job
+            heapq.heappush(cls.queue, (priority, next(cls.counter), job))
+            cls.schedule(max_workers)
+
+        return job
+
+    @staticmethod
+    def is_reusable(job: TranscodeJob):
+        """
+        Returns whether a new reader can follow the job. Call with the lock held.
+        """
+        if job.cancelled or job.state == "cancelled":
+            return False
+
+        return not job.done or job.success
+
+    @classmethod
+    def schedule(cls, max_workers: int):
+        """
+        Starts queued jobs while there are free workers. Call with the lock held.
+        """
+        while cls.running < max_workers and cls.queue:
+            priority, _, job = heapq.heappop(cls.queue)
+
+            if job.state != "queued" or priority != job.priority:
+                continue
+
+            job.state = "running"
+            cls.running += 1
+            job.start()
+
+    @classmethod
+    def forget(cls, key: str, job: TranscodeJob):
+        """
+        Removes a finished job and starts the next queued one.
+        """
+        max_workers = max(1, UserConfig().transcodeWorkers)
+
+        with cls.lock:
+            if cls.jobs.get(key) is job:
+                del cls.jobs[key]
+
+            if job.state == "running":
+                cls.running -= 1
+
+            job.state = "done"
+            cls.schedule(max_workers)
+
+    @classmethod
+    def detach(cls, job: TranscodeJob):
+        """
+        Removes a reader, cancelling the job if it was the last one
+        and the job is not being kept for the cache.
+        """
+        with cls.lock:
+            job.readers -= 1
+
+            if job.readers > 0 or job.keep or job.done:
+                return
+
+            state = job.state
+
+            if state == "queued":
+                # INFO: Not started, so finish it here
+                job.state = "cancelled"
+            else:
+                # INFO: Set under the lock so that the job is not reused
+                # between here and the kill below
+                job.cancelled = True
+
+        if state == "queued":
+            job.finish(False)
+        elif state == "running":
+            job.kill()
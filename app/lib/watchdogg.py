@@ -16,12 +16,12 @@ from app.config import UserConfig
 from app.db.libdata import TrackTable
 from app.db.userdata import LibDataTable
 from app.lib.colorlib import process_color
-from app.lib.tagger import create_albums, create_artists
-from app.lib.taglib import extract_thumb, get_tags
+from app.lib.index import update_stores
+from app.lib.taglib import get_tags
 from app.logger import log
-from app.models import Artist, Track
+from app.models import Track
 from app.store.albums import AlbumStore
-from app.store.artists import ArtistMapEntry, ArtistStore
+from app.store.thumbnails import ThumbnailStore
 from app.store.tracks import TrackStore
 
 
@@ -154,74 +154,43 @@ def add_track(filepath: str) -> None:
     """
     Processes the audio tags for a given file ands add them to the database and store.
 
-    Then creates the folder, album and artist objects for the added track and adds them to the store.
+    Then updates the folder, album and artist objects for the added track in the store.
     """
-
-    TrackStore.remove_track_by_filepath(filepath)
+    removed = TrackStore.get_tracks_by_filepaths([filepath])
+    TrackTable.remove_tracks_by_filepaths({filepath})
 
     config = UserConfig()
-    tags = get_tags(filepath, config)
+    tags = get_tags(filepath, config, extract_art=True, overwrite_art=True)
+    ThumbnailStore.save()
 
-    # if the track is somehow invalid, return
+    # if the track is somehow invalid, only remove the old entry
     if tags is None or tags["bitrate"] == 0 or tags["duration"] == 0:
+        update_stores([], removed)
         return
 
     TrackTable.insert_one(tags)
-    extract_thumb(filepath, tags["albumhash"] + ".webp", overwrite=True)
 
     colors = handle_color(tags["albumhash"])
     track = Track(**tags)
-    TrackStore.add_track(track)
+    update_stores([track], removed)
 
-    # SECTION: Index album
     albumentry = AlbumStore.albummap.get(track.albumhash)
 
-    if albumentry is None:
-        album, trackhashes = create_albums([track.trackhash])[0]
-        AlbumStore.index_new_album(album, trackhashes)
-    else:
-        trackhash_exists = track.trackhash in albumentry.trackhashes
-
-        if not trackhash_exists:
-            albumentry.trackhashes.add(track.trackhash)
-            albumentry.album.trackcount += 1
-            albumentry.set_color(colors[0]) if colors else None
-
-    # SECTION: Index artist
-    artists = create_artists(track.artisthashes)
-
-    for artist in artists:
-        ArtistStore.artistmap[artist[0].artisthash] = ArtistMapEntry(
-            artist=artist[0],
-            albumhashes=artist[1],
-            trackhashes=artist[2],
-        )
+    if albumentry is not None and colors:
+        albumentry.set_color(colors[0])
 
 
 def remove_track(filepath: str) -> None:
     """
-    Removes a track from the music dict.
+    Removes a track from the database and the stores.
     """
-    try:
-        track = TrackStore.get_tracks_by_filepaths([filepath])[0]
-    except IndexError:
-        return
-
-    db.remove_tracks_by_filepaths(filepath)
-    TrackStore.remove_track_by_filepath(filepath)
-
-    empty_album = TrackStore.count_tracks_by_trackhash(track.albumhash) > 0
+    removed = TrackStore.get_tracks_by_filepaths([filepath])
 
-    if empty_album:
-        AlbumStore.remove_album_by_hash(track.albumhash)
-
-    artists: list[Artist] = track.artists + track.albumartists  # type: ignore
-
-    for artist in artists:
-        empty_artist = not ArtistStore.artist_has_tracks(artist.artisthash)
+    if not removed:
+        return
 
-        if empty_artist:
-            ArtistStore.remove_artist_by_hash(artist.artisthash)
+    TrackTable.remove_tracks_by_filepaths({filepath})
+    update_stores([], removed)
 
 
 class Handler(PatternMatchingEventHandler):
@@ -0,0 +1,151 @@
+"""
+This library contains the waveform peaks shown on seek bars.
+"""
+
+import glob
+import os
+import struct
+import subprocess
+import threading
+
+import numpy as np
+
+from app.db.libdata import AnalysisTable
+from app.lib.pydub.pydub import AudioSegment
+from app.lib.pydub.pydub.exceptions import CouldntDecodeError
+from app.lib.trackslib import run_low_priority
+from app.logger import log
+from app.models import Track
+from app.settings import Paths
+
+# INFO: The number of (min, max) pairs per track
+PEAK_COUNT = 1000
+# INFO: Audio is decoded to mono at this rate, which is plenty for peaks
+SAMPLE_RATE = 8000
+
+MAGIC = b"SWWF"
+VERSION = 1
+# magic, version, peak count
+HEADER = struct.Struct("<4sBI")
+
+# INFO: The analysis result saved for files whose waveform can't be generated
+FAILED_KEY = "waveform_failed"
+
+
+def get_waveform_path(track: Track):
+    """
+    Returns the cache path of a track's waveform.
+    Paths include the mtime, so a modified file never hits a stale waveform.
+    """
+    filename = f"{track.trackhash}.{track.last_mod}.waveform"
+    return os.path.join(Paths.get_waveforms_path(), filename)
+
+
+def compute_peaks(samples: np.ndarray, count: int = PEAK_COUNT):
+    """
+    Splits the samples into `count` equal buckets and returns the
+    minimum and maximum of each, interleaved, scaled to 8 bits.
+    """
+    count = min(count, len(samples))
+
+    if count == 0:
+        return np.zeros(0, dtype=np.int8)
+
+    starts = np.arange(count) * len(samples) // count
+    peaks = np.empty(count * 2, dtype=np.int16)
+    peaks[0::2] = np.minimum.reduceat(samples, starts)
+    peaks[1::2] = np.maximum.reduceat(samples, starts)
+
+    return (peaks >> 8).astype(np.int8)
+
+
+def encode_waveform(peaks: np.ndarray):
+    """
+    Packs peaks into the waveform file format: a 9 byte header (b"SWWF",
+    version, little-endian uint32 peak count), then a signed byte for the
+    min and max of each peak.
+    """
+    return HEADER.pack(MAGIC, VERSION, len(peaks) // 2) + peaks.tobytes()
+
+
+def generate_waveform(filepath: str):
+    """
+    Decodes a file and returns its encoded waveform,
+    or None if it can't be decoded.
+    """
+    command = [
+        AudioSegment.converter,
+        "-v",
+        "error",
+        "-i",
+        filepath,
+        "-vn",
+        "-f",
+        "s16le",
+        "-acodec",
+        "pcm_s16le",
+        "-ac",
+        "1",
+        "-ar",
+        str(SAMPLE_RATE),
+        "-",
+    ]
+
+    try:
+        output, _ = run_low_priority(command, stdout=subprocess.PIPE)
+    except (OSError, CouldntDecodeError) as e:
+        log.warning("Failed to generate the waveform of %s: %s", filepath, e)
+        return None
+
+    samples = np.frombuffer(output[: len(output) // 2 * 2], dtype="<i2")
+    return encode_waveform(compute_peaks(samples))
+
+
+def save_waveform(track: Track):
+    """
+    Generates and saves the waveform of a track, deleting any saved for an
+    older version of the file. Returns its path, or None if it failed.
+
+    Failures are saved to the analysis table, so that the file is not
+    decoded again until it changes.
+    """
+    data = generate_waveform(track.filepath)
+
+    if data is None:
+        AnalysisTable.set_results(track.filepath, track.last_mod, {FAILED_KEY: True})
+        return None
+
+    path = get_waveform_path(track)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+
+    for old_path in glob.glob(
+        os.path.join(
+            Paths.get_waveforms_path(), glob.escape(track.trackhash) + ".*.waveform"
+        )
+    ):
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    with open(temp_path, "wb") as f:
+        f.write(data)
+
+    os.replace(temp_path, path)
+    return path
+
+
+def get_waveform(track: Track):
+    """
+    Returns the path of a track's waveform, generating it if it's not saved.
+    Returns None if it can't be generated.
+    """
+    path = get_waveform_path(track)
+
+    if os.path.exists(path):
+        return path
+
+    if AnalysisTable.get_results(track.filepath, track.last_mod).get(FAILED_KEY):
+        return None
+
+    return save_waveform(track)
@@ -50,6 +50,8 @@ class Track:
     _ati: str = ""
     image: str = ""
     fav_userids: list[int] = field(default_factory=list)
+    # INFO: Set from the analysis table. See `get_loudness`
+    loudness: dict[str, float] | None = None
 
     @property
     def is_favorite(self):
@@ -11,6 +11,16 @@ help_args_list = [
     ["--config", "", "Set the config path"],
     ["--no-periodic-scan", "-nps", "Disable periodic scan"],
     ["--pswd", "", "Recover a password"],
+    [
+        "--rebuild-thumbnails",
+        "",
+        "Rebuild the thumbnail manifest from the thumbnails on disk",
+    ],
+    [
+        "--compact-images",
+        "",
+        "Reclaim space in the image pack, and move image files into it if packing is enabled",
+    ],
     [
         "--scan-interval",
         "-psi",
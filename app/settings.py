@@ -82,11 +82,23 @@ class Paths:
     def get_lg_thumb_path(cls):
         return join(cls.get_thumbs_path(), "large")
 
+    @classmethod
+    def get_image_pack_path(cls):
+        return join(cls.get_img_path(), "images.pack")
+
     # OTHERS
     @classmethod
     def get_playlist_img_path(cls):
         return join(cls.get_img_path(), "playlists")
 
+    @classmethod
+    def get_transcodes_path(cls):
+        return join(Paths.get_app_dir(), "transcodes")
+
+    @classmethod
+    def get_waveforms_path(cls):
+        return join(Paths.get_app_dir(), "waveforms")
+
     @classmethod
     def get_assets_path(cls):
         return join(Paths.get_app_dir(), "assets")
@@ -152,6 +164,10 @@ class DbPaths:
     def get_userdata_db_path(cls):
         return join(Paths.get_app_dir(), cls.USER_DATA_DB_NAME)
 
+    @classmethod
+    def get_scan_manifest_path(cls):
+        return join(Paths.get_app_dir(), "scan_manifest.json")
+
     @classmethod
     def get_json_config_path(cls):
         return join(Paths.get_app_dir(), "config.json")
@@ -189,6 +205,8 @@ class ALLARGS:
     config = "--config"
 
     pswd = "--pswd"
+    rebuild_thumbnails = "--rebuild-thumbnails"
+    compact_images = "--compact-images"
 
     show_feat = ("--show-feat", "-sf")
     show_prod = ("--show-prod", "-sp")
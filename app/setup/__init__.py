@@ -8,13 +8,17 @@ from app.lib.mapstuff import (
     map_album_colors,
     map_artist_colors,
     map_favorites,
+    map_loudness,
     map_scrobble_data,
 )
+from app.lib.imagepack import ImagePack
 from app.setup.files import create_config_dir
 from app.setup.sqlite import run_migrations, setup_sqlite
 from app.store.albums import AlbumStore
 from app.store.artists import ArtistStore
 from app.store.folder import FolderStore
+from app.store.search import SearchStore
+from app.store.thumbnails import ThumbnailStore
 from app.store.tracks import TrackStore
 from app.utils.generators import get_random_str
 from app.config import UserConfig
@@ -47,8 +51,12 @@ def load_into_mem():
     AlbumStore.load_albums(key)
     ArtistStore.load_artists(key)
     FolderStore.load_filepaths()
+    SearchStore.load_index(key)
+    ImagePack.load()
+    ThumbnailStore.load()
 
     map_scrobble_data()
     map_favorites()
+    map_loudness()
     map_artist_colors()
     map_album_colors()
@@ -69,6 +69,8 @@ def create_config_dir() -> None:
         md_thumb_path,
         xsm_thumb_path,
         "plugins/lyrics",
+        "transcodes",
+        "waveforms",
         playlist_img_path,
         md_artist_img_path,
         small_artist_img_path,
@@ -4,7 +4,7 @@ from pprint import pprint
 import random
 from typing import Iterable
 
-from app.lib.tagger import create_albums
+from app.lib.tagger import create_album, create_albums
 from app.models import Album, Track
 from app.store.artists import ArtistStore
 from app.utils import flatten
@@ -74,6 +74,38 @@ class AlbumStore:
         }
         print("Done!")
 
+    @classmethod
+    def update_albums(cls, albumhashes: Iterable[str]) -> set[str]:
+        """
+        Recreates the given albums from their tracks in the track store,
+        removing the ones that no longer have tracks.
+
+        Only the given albums are touched. Colors and favorites are kept.
+
+        Returns the hashes of the albums that were not in the store before.
+        """
+        new_albums: set[str] = set()
+
+        for albumhash in albumhashes:
+            tracks = TrackStore.get_tracks_by_albumhash(albumhash)
+
+            if not tracks:
+                cls.albummap.pop(albumhash, None)
+                continue
+
+            album, trackhashes = create_album(tracks)
+            entry = cls.albummap.get(albumhash)
+
+            if entry is None:
+                new_albums.add(albumhash)
+            else:
+                album.color = entry.album.color
+                album.fav_userids = entry.album.fav_userids
+
+            cls.albummap[albumhash] = AlbumMapEntry(album=album, trackhashes=trackhashes)
+
+        return new_albums
+
     @classmethod
     def index_new_album(cls, album: Album, trackhashes: set[str]):
         cls.albummap[album.albumhash] = AlbumMapEntry(
@@ -166,7 +198,7 @@ class AlbumStore:
         """
         Removes an album from the store.
         """
-        cls.albums = CustomList(a for a in cls.albums if a.albumhash != albumhash)
+        cls.albummap.pop(albumhash, None)
 
     @classmethod
     def get_albums_by_artisthash(cls, hash: str):
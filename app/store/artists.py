@@ -1,7 +1,7 @@
 import json
 from typing import Iterable
 
-from app.lib.tagger import create_artists
+from app.lib.tagger import create_artist, create_artists
 from app.models import Artist
 from app.utils.auth import get_current_userid
 from app.utils.customlist import CustomList
@@ -69,6 +69,40 @@ class ArtistStore:
 
         #     cls.map_artist_color(artist)
 
+    @classmethod
+    def update_artists(cls, artisthashes: Iterable[str]) -> set[str]:
+        """
+        Recreates the given artists from their tracks in the track store,
+        removing the ones that no longer have tracks.
+
+        Only the given artists are touched. Colors and favorites are kept.
+
+        Returns the hashes of the artists that were not in the store before.
+        """
+        new_artists: set[str] = set()
+
+        for artisthash in artisthashes:
+            tracks = TrackStore.get_unique_tracks_by_artisthash(artisthash)
+
+            if not tracks:
+                cls.artistmap.pop(artisthash, None)
+                continue
+
+            artist, trackhashes, albumhashes = create_artist(artisthash, tracks)
+            entry = cls.artistmap.get(artisthash)
+
+            if entry is None:
+                new_artists.add(artisthash)
+            else:
+                artist.color = entry.artist.color
+                artist.fav_userids = entry.artist.fav_userids
+
+            cls.artistmap[artisthash] = ArtistMapEntry(
+                artist=artist, albumhashes=albumhashes, trackhashes=trackhashes
+            )
+
+        return new_artists
+
     @classmethod
     def get_flat_list(cls):
         """
@@ -1,7 +1,9 @@
 from sortedcontainers import SortedSet
 from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
 
 from app.db.libdata import TrackTable
+from app.models import Track
 from app.store.tracks import TrackStore
 
 
@@ -28,11 +30,28 @@ class FolderStore:
         """
         cls.filepaths.clear()
 
-        tracks = TrackTable.get_all()
+        for filepath, _, trackhash in TrackTable.get_scan_info():
+            cls.filepaths.add(filepath)
+            cls.map[filepath] = trackhash
+
+    @classmethod
+    def add_tracks(cls, tracks: Iterable[Track]):
+        """
+        Adds the filepaths of the given tracks.
+        """
         for track in tracks:
             cls.filepaths.add(track.filepath)
             cls.map[track.filepath] = track.trackhash
 
+    @classmethod
+    def remove_filepaths(cls, filepaths: Iterable[str]):
+        """
+        Removes the given filepaths.
+        """
+        for filepath in filepaths:
+            cls.filepaths.discard(filepath)
+            cls.map.pop(filepath, None)
+
     @classmethod
     def get_tracks_by_filepaths(cls, filepaths: list[str]):
         for filepath in filepaths:
@@ -0,0 +1,291 @@
+"""
+Prebuilt fuzzy search choices for tracks, albums and artists.
+"""
+
+import threading
+from typing import Iterable
+
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+from unidecode import unidecode
+
+from app.store.albums import AlbumStore
+from app.store.artists import ArtistStore
+from app.store.tracks import TrackStore
+
+SEARCH_LOAD_KEY = ""
+
+
+def normalize(text: str) -> str:
+    """
+    Returns the form of a string that is used for fuzzy matching.
+
+    This is the same as running `utils.default_process` on the
+    transliterated string, so that choices can be processed once
+    instead of on every search.
+    """
+    return utils.default_process(unidecode(text or ""))
+
+
+def score(query: str, choices: list[str], score_cutoff: float) -> np.ndarray:
+    """
+    Scores the query against all the choices in a single pass,
+    spread across all CPU cores.
+
+    Scores below the cutoff are set to 0.
+    """
+    # INFO: cdist splits the work by rows, so the choices go on the row
+    # axis. With the single query there, it would all run on one core.
+    return process.cdist(
+        choices,
+        [normalize(query)],
+        scorer=fuzz.WRatio,
+        processor=None,
+        score_cutoff=score_cutoff,
+        workers=SearchStore.workers,
+    )[:, 0]
+
+
+def rank(scores: np.ndarray, score_cutoff: float, limit: int) -> np.ndarray:
+    """
+    Returns the indexes of the best `limit` scores above the cutoff,
+    best first. Equal scores keep their original order.
+    """
+    matches = np.flatnonzero(scores >= max(score_cutoff, 1))
+    order = np.argsort(-scores[matches], kind="stable")
+
+    return matches[order[:limit]]
+
+
+class SearchIndex:
+    """
+    Holds the normalized search strings of a single item type,
+    keyed by the item hash.
+
+    Writes replace the choices dict instead of mutating it, so that
+    searches running in other threads never see a dict changing size.
+    """
+
+    def __init__(self) -> None:
+        self.choices: dict[str, str] = {}
+        # {'hash': 'source text'}, used to skip re-normalizing unchanged items
+        self.sources: dict[str, str] = {}
+        self.lock = threading.Lock()
+        self._arrays: tuple[dict[str, str], list[str], list[str]] | None = None
+
+    def __len__(self):
+        return len(self.choices)
+
+    @property
+    def arrays(self) -> tuple[list[str], list[str]]:
+        """
+        Returns the hashes and normalized strings as parallel lists.
+
+        The lists are cached until the next write.
+        """
+        choices = self.choices
+        cached = self._arrays
+
+        if cached is None or cached[0] is not choices:
+            cached = (choices, list(choices.keys()), list(choices.values()))
+            self._arrays = cached
+
+        return cached[1], cached[2]
+
+    def rebuild(self, items: Iterable[tuple[str, str]]):
+        """
+        Replaces the index with the given (hash, text) pairs.
+
+        Items whose text hasn't changed since the last build reuse
+        their normalized string.
+        """
+        with self.lock:
+            choices: dict[str, str] = {}
+            sources: dict[str, str] = {}
+
+            for key, text in items:
+                if key in choices:
+                    continue
+
+                if self.sources.get(key) == text:
+                    choices[key] = self.choices[key]
+                else:
+                    choices[key] = normalize(text)
+
+                sources[key] = text
+
+            self.choices = choices
+            self.sources = sources
+
+    def add(self, items: dict[str, str]):
+        """
+        Adds or updates the given {hash: text} items.
+        """
+        with self.lock:
+            choices = dict(self.choices)
+            sources = dict(self.sources)
+
+            for key, text in items.items():
+                choices[key] = normalize(text)
+                sources[key] = text
+
+            self.choices = choices
+            self.sources = sources
+
+    def remove(self, keys: Iterable[str]):
+        """
+        Removes the items with the given hashes.
+        """
+        with self.lock:
+            choices = dict(self.choices)
+            sources = dict(self.sources)
+
+            for key in keys:
+                choices.pop(key, None)
+                sources.pop(key, None)
+
+            self.choices = choices
+            self.sources = sources
+
+    def search(self, query: str, score_cutoff: float, limit: int) -> list[str]:
+        """
+        Returns the hashes of the items that best match the query,
+        best match first.
+        """
+        keys, choices = self.arrays
+        scores = score(query, choices, score_cutoff)
+
+        return [keys[i] for i in rank(scores, score_cutoff, limit)]
+
+
+class SearchCorpus:
+    """
+    The track, album and artist choices joined into a single list,
+    so that a query can be scored against all of them in one pass.
+    """
+
+    def __init__(self, indexes: dict[str, SearchIndex]) -> None:
+        self.sources: list[dict[str, str]] = []
+        self.keys: list[str] = []
+        self.choices: list[str] = []
+        # {'type': (start, end)}
+        self.sections: dict[str, tuple[int, int]] = {}
+
+        for itemtype, index in indexes.items():
+            # INFO: Read the source first, so a concurrent write marks this stale
+            self.sources.append(index.choices)
+            keys, choices = index.arrays
+            start = len(self.keys)
+
+            self.keys.extend(keys)
+            self.choices.extend(choices)
+            self.sections[itemtype] = (start, len(self.keys))
+
+    def is_stale(self, indexes: dict[str, SearchIndex]) -> bool:
+        """
+        Whether any of the indexes has changed since the corpus was built.
+        """
+        return any(
+            index.choices is not source
+            for index, source in zip(indexes.values(), self.sources)
+        )
+
+
+class SearchStore:
+    """
+    Holds the search indexes for tracks, albums and artists.
+
+    The indexes are built when the stores are loaded and updated by the
+    watcher as tracks are added or removed.
+    """
+
+    tracks = SearchIndex()
+    albums = SearchIndex()
+    artists = SearchIndex()
+
+    workers: int = -1
+    """
+    The number of threads used to score a query. -1 uses all CPU cores.
+    """
+
+    _corpus: SearchCorpus | None = None
+
+    @classmethod
+    def get_indexes(cls):
+        # INFO: Order matters, equal scores favor the earlier type
+        return {"artists": cls.artists, "tracks": cls.tracks, "albums": cls.albums}
+
+    @classmethod
+    def get_corpus(cls):
+        """
+        Returns the combined corpus, rebuilding it if any index has changed.
+        """
+        indexes = cls.get_indexes()
+        corpus = cls._corpus
+
+        if corpus is None or corpus.is_stale(indexes):
+            corpus = SearchCorpus(indexes)
+            cls._corpus = corpus
+
+        return corpus
+
+    @classmethod
+    def search_all(
+        cls, query: str, score_cutoff: float, limits: dict[str, int]
+    ) -> tuple[tuple[str, str] | None, dict[str, list[str]]]:
+        """
+        Scores the query against all tracks, albums and artists at once.
+
+        Returns the (type, hash) of the best match overall and the ranked
+        hashes for each type, limited by `limits`.
+        """
+        corpus = cls.get_corpus()
+        scores = score(query, corpus.choices, score_cutoff)
+
+        top_result = None
+        results: dict[str, list[str]] = {}
+
+        for itemtype, (start, end) in corpus.sections.items():
+            section = scores[start:end]
+            results[itemtype] = [
+                corpus.keys[start + i]
+                for i in rank(section, score_cutoff, limits.get(itemtype, 0))
+            ]
+
+        best = rank(scores, score_cutoff, 1)
+
+        if len(best):
+            index = int(best[0])
+            itemtype = next(
+                t for t, (start, end) in corpus.sections.items() if start <= index < end
+            )
+            top_result = (itemtype, corpus.keys[index])
+
+        return top_result, results
+
+    @classmethod
+    def load_index(cls, instance_key: str):
+        """
+        Builds the search indexes from the track, album and artist stores.
+        """
+        global SEARCH_LOAD_KEY
+        SEARCH_LOAD_KEY = instance_key
+
+        print("Building search index... ", end="")
+
+        cls.tracks.rebuild(
+            (t.trackhash, t.og_title) for t in TrackStore.get_flat_list()
+        )
+
+        if instance_key != SEARCH_LOAD_KEY:
+            return
+
+        cls.albums.rebuild(
+            (a.albumhash, a.og_title) for a in AlbumStore.get_flat_list()
+        )
+
+        if instance_key != SEARCH_LOAD_KEY:
+            return
+
+        cls.artists.rebuild((a.artisthash, a.name) for a in ArtistStore.get_flat_list())
+        print("Done!")
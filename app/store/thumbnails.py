@@ -0,0 +1,130 @@
+import os
+import threading
+
+from app.db.libdata import ThumbnailTable
+from app.lib.imagepack import ImagePack, get_image_dir
+
+# INFO: From the largest to the smallest
+THUMB_SIZES = ("lg", "md", "sm", "xsm")
+
+
+class ThumbnailStore:
+    """
+    The manifest of saved album thumbnails, which lets indexing, the watcher
+    and the image server check for a thumbnail without touching the disk.
+
+    It's persisted in the thumbnail table, and rebuilt from the thumbnail
+    directories and the image pack when the table is empty.
+
+    Thumbnails saved in worker processes are recorded in the worker's copy
+    of the store. Workers send them back with `collect`, and the main
+    process adds them with `merge` and writes them with `save`.
+    """
+
+    # {albumhash: (sizes, source mtime)}
+    entries: dict[str, tuple[list[str], float]] = {}
+    # INFO: Entries added since the last save
+    pending: dict[str, tuple[list[str], float]] = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """
+        Loads the manifest from the database.
+        """
+        rows = ThumbnailTable.get_all()
+
+        if not rows:
+            cls.rebuild()
+            return
+
+        with cls.lock:
+            cls.entries = {
+                row.hash: (row.sizes, row.source_mtime) for row in rows
+            }
+            cls.pending = {}
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recreates the manifest from the thumbnails on disk and in the image
+        pack. The mtimes of the source files are unknown, so modified files
+        will replace them.
+        """
+        entries: dict[str, tuple[list[str], float]] = {}
+
+        for size in THUMB_SIZES:
+            try:
+                hashes = {
+                    name.removesuffix(".webp")
+                    for name in os.listdir(get_image_dir(size))
+                    if name.endswith(".webp")
+                }
+            except OSError:
+                hashes = set()
+
+            hashes.update(ImagePack.get_hashes(size))
+
+            for hash in hashes:
+                sizes, _ = entries.setdefault(hash, ([], 0))
+                sizes.append(size)
+
+        ThumbnailTable.remove_all()
+        ThumbnailTable.set_many(entries)
+
+        with cls.lock:
+            cls.entries = entries
+            cls.pending = {}
+
+        return len(entries)
+
+    @classmethod
+    def has(cls, albumhash: str, size: str = "sm"):
+        entry = cls.entries.get(albumhash)
+        return entry is not None and size in entry[0]
+
+    @classmethod
+    def get_source_mtime(cls, albumhash: str):
+        """
+        Returns the mtime of the file the thumbnail was read from,
+        or None if there's no thumbnail.
+        """
+        entry = cls.entries.get(albumhash)
+        return None if entry is None else entry[1]
+
+    @classmethod
+    def add(cls, albumhash: str, source_mtime: float, sizes=THUMB_SIZES):
+        entry = (list(sizes), source_mtime)
+
+        with cls.lock:
+            cls.entries[albumhash] = entry
+            cls.pending[albumhash] = entry
+
+    @classmethod
+    def collect(cls):
+        """
+        Returns and clears the entries added since the last call.
+        """
+        with cls.lock:
+            pending, cls.pending = cls.pending, {}
+
+        return pending
+
+    @classmethod
+    def merge(cls, entries: dict[str, tuple[list[str], float]]):
+        """
+        Adds entries collected from a worker.
+        """
+        if entries:
+            # INFO: The worker may have replaced packed thumbnails
+            ImagePack.refresh()
+
+        for albumhash, (sizes, source_mtime) in entries.items():
+            cls.add(albumhash, source_mtime, sizes)
+
+    @classmethod
+    def save(cls):
+        """
+        Writes the entries added since the last save to the database.
+        """
+        ThumbnailTable.set_many(cls.collect())
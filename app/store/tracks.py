@@ -1,7 +1,11 @@
 # from tqdm import tqdm
 
 import itertools
-from typing import Callable, Iterable
+import threading
+from typing import Callable, Iterable, Iterator
+
+from sortedcontainers import SortedList
+
 from app.db.libdata import TrackTable
 
 from app.models import Track
@@ -28,8 +32,11 @@ class TrackGroup:
     def remove(self, track: Track):
         """
         Removes a track from the group.
+
+        The track list is replaced instead of mutated, so that readers
+        iterating over the old list are not affected.
         """
-        self.tracks.remove(track)
+        self.tracks = [t for t in self.tracks if t.filepath != track.filepath]
 
     def increment_playcount(self, duration: int, timestamp: int, playcount: int = 1):
         """
@@ -74,6 +81,26 @@ class TrackStore:
     # {'trackhash': Track[]}
     trackhashmap: dict[str, TrackGroup] = dict()
 
+    # INFO: Secondary indexes. Each maps a key to the tracks having that key,
+    # keyed by filepath (unique per track) so that removals are O(1).
+    # {'filepath': Track}
+    filepathmap: dict[str, Track] = dict()
+    # {'albumhash': {'filepath': Track}}
+    albumhashmap: dict[str, dict[str, Track]] = dict()
+    # {'artisthash': {'filepath': Track}}
+    artisthashmap: dict[str, dict[str, Track]] = dict()
+    # {'artisthash': {'filepath': Track}}, by album artist
+    albumartisthashmap: dict[str, dict[str, Track]] = dict()
+    # {'folder': {'filepath': Track}}
+    foldermap: dict[str, dict[str, Track]] = dict()
+    # Sorted folder keys, used for prefix lookups
+    folders: SortedList = SortedList()
+
+    # INFO: Held by writers (indexer, watcher) while updating the maps. Getters
+    # that read the secondary indexes hold it only while copying the entries
+    # they need, and do the rest of their work on the copies.
+    lock = threading.RLock()
+
     @classproperty
     def tracks(cls) -> list[Track]:
         return cls.get_flat_list()
@@ -85,7 +112,7 @@ class TrackStore:
         """
         return list(
             itertools.chain.from_iterable(
-                [group.tracks for group in cls.trackhashmap.values()]
+                [group.tracks for group in list(cls.trackhashmap.values())]
             )
         )
 
@@ -100,6 +127,7 @@ class TrackStore:
         TRACKS_LOAD_KEY = instance_key
 
         cls.trackhashmap = dict()
+        cls.clear_indexes()
         tracks = TrackTable.get_all()
 
         # INFO: Load all tracks into the dict store
@@ -113,17 +141,89 @@ class TrackStore:
             else:
                 cls.trackhashmap[track.trackhash].append(track)
 
+            cls.index_track(track)
+
+    # ================================================
+    # =============== SECONDARY INDEXES ==============
+    # ================================================
+
+    @classmethod
+    def clear_indexes(cls):
+        """
+        Resets all the secondary indexes.
+        """
+        cls.filepathmap = dict()
+        cls.albumhashmap = dict()
+        cls.artisthashmap = dict()
+        cls.albumartisthashmap = dict()
+        cls.foldermap = dict()
+        cls.folders = SortedList()
+
+    @classmethod
+    def index_track(cls, track: Track):
+        """
+        Adds a track to the secondary indexes.
+        """
+        cls.filepathmap[track.filepath] = track
+        cls.albumhashmap.setdefault(track.albumhash, {})[track.filepath] = track
+
+        for artisthash in set(track.artisthashes):
+            cls.artisthashmap.setdefault(artisthash, {})[track.filepath] = track
+
+        for artisthash in {a["artisthash"] for a in track.albumartists}:
+            cls.albumartisthashmap.setdefault(artisthash, {})[track.filepath] = track
+
+        if track.folder not in cls.foldermap:
+            cls.foldermap[track.folder] = {}
+            cls.folders.add(track.folder)
+
+        cls.foldermap[track.folder][track.filepath] = track
+
+    @classmethod
+    def unindex_track(cls, track: Track):
+        """
+        Removes a track from the secondary indexes.
+        """
+        cls.filepathmap.pop(track.filepath, None)
+
+        def discard(index: dict[str, dict[str, Track]], key: str):
+            entry = index.get(key)
+
+            if entry is None:
+                return False
+
+            entry.pop(track.filepath, None)
+
+            if len(entry) == 0:
+                del index[key]
+                return True
+
+            return False
+
+        discard(cls.albumhashmap, track.albumhash)
+
+        for artisthash in set(track.artisthashes):
+            discard(cls.artisthashmap, artisthash)
+
+        for artisthash in {a["artisthash"] for a in track.albumartists}:
+            discard(cls.albumartisthashmap, artisthash)
+
+        if discard(cls.foldermap, track.folder):
+            cls.folders.discard(track.folder)
+
     @classmethod
     def add_track(cls, track: Track):
         """
         Adds a single track to the store.
         """
-        group = cls.trackhashmap.get(track.trackhash, None)
+        with cls.lock:
+            cls.index_track(track)
+            group = cls.trackhashmap.get(track.trackhash, None)
 
-        if group:
-            return group.append(track)
+            if group:
+                return group.append(track)
 
-        cls.trackhashmap[track.trackhash] = TrackGroup([track])
+            cls.trackhashmap[track.trackhash] = TrackGroup([track])
 
     @classmethod
     def add_tracks(cls, tracks: list[Track]):
@@ -139,13 +239,15 @@ class TrackStore:
         """
         Removes a single track from the store.
         """
-        group = cls.trackhashmap.get(track.trackhash, None)
+        with cls.lock:
+            group = cls.trackhashmap.get(track.trackhash, None)
+            cls.unindex_track(track)
 
-        if group:
-            group.remove(track)
+            if group:
+                group.remove(track)
 
-            if len(group) == 0:
-                del cls.trackhashmap[track.trackhash]
+                if len(group) == 0:
+                    del cls.trackhashmap[track.trackhash]
 
     @classmethod
     def remove_track_by_filepath(cls, filepath: str):
@@ -156,27 +258,19 @@ class TrackStore:
         return cls.remove_tracks_by_filepaths({filepath})
 
     @classmethod
-    def remove_tracks_by_filepaths(cls, filepaths: set[str]):
+    def remove_tracks_by_filepaths(cls, filepaths: Iterable[str]):
         """
         Removes multiple tracks from the store by their filepaths.
-        """
-
-        filecount = len(filepaths)
-
-        for trackhash in cls.trackhashmap:
-            group = cls.trackhashmap[trackhash]
 
-            for track in group.tracks:
-                if track.filepath in filepaths:
-                    group.remove(track)
-
-                    if len(group) == 0:
-                        del cls.trackhashmap[trackhash]
-
-                    filecount -= 1
+        Tracks are resolved through the filepath index, so this is O(k)
+        for k filepaths, regardless of the library size.
+        """
+        with cls.lock:
+            for filepath in filepaths:
+                track = cls.filepathmap.get(filepath)
 
-                if filecount == 0:
-                    break
+                if track is not None:
+                    cls.remove_track(track)
 
     @classmethod
     def count_tracks_by_trackhash(cls, trackhash: str) -> int:
@@ -190,48 +284,53 @@ class TrackStore:
     # ================================================
 
     @classmethod
-    def get_tracks_by_trackhashes(cls, trackhashes: Iterable[str]) -> list[Track]:
+    def iter_tracks_by_trackhashes(
+        cls, trackhashes: Iterable[str], keep_duplicates: bool = False
+    ) -> Iterator[Track]:
         """
-        Returns a list of tracks by their hashes.
+        Yields the best track for each of the given hashes, in the order
+        of the given hashes. Hashes not in the store are skipped.
+
+        Repeated hashes are yielded once, unless `keep_duplicates` is set
+        (eg. a playlist containing the same track twice).
         """
-        hash_set = set(trackhashes)
+        seen: set[str] = set()
 
-        tracks: list[Track] = []
+        for trackhash in trackhashes:
+            if not keep_duplicates:
+                if trackhash in seen:
+                    continue
+
+                seen.add(trackhash)
 
-        for trackhash in hash_set:
             group = cls.trackhashmap.get(trackhash, None)
 
             if group:
-                track = group.get_best()
-                tracks.append(track)
+                yield group.get_best()
 
-        # sort the tracks in the order of the given trackhashes
-        if type(trackhashes) == list:
-            tracks.sort(key=lambda t: trackhashes.index(t.trackhash))
+    @classmethod
+    def get_tracks_by_trackhashes(
+        cls, trackhashes: Iterable[str], keep_duplicates: bool = False
+    ) -> list[Track]:
+        """
+        Returns a list of tracks by their hashes, in the order of the given hashes.
 
-        return tracks
+        See `iter_tracks_by_trackhashes` for the details.
+        """
+        return list(cls.iter_tracks_by_trackhashes(trackhashes, keep_duplicates))
 
     @classmethod
     def get_tracks_by_filepaths(cls, paths: list[str]) -> list[Track]:
         """
         Returns all tracks matching the given paths.
         """
-        # tracks = sorted(cls.trackhashmap, key=lambda x: x.filepath)
-        # tracks = use_bisection(tracks, "filepath", paths)
-        # return [track for track in tracks if track is not None]
-        # return cls.find_tracks_by(key="filepath", value=paths)
-
         tracks: list[Track] = []
 
-        for trackhash in cls.trackhashmap:
-            group = cls.trackhashmap.get(trackhash)
-
-            if not group:
-                continue
+        for path in paths:
+            track = cls.filepathmap.get(path)
 
-            for track in group.tracks:
-                if track.filepath in paths:
-                    tracks.append(track)
+            if track is not None:
+                tracks.append(track)
 
         return tracks
 
@@ -248,12 +347,7 @@ class TrackStore:
         """
         tracks: list[Track] = []
 
-        for trackhash in cls.trackhashmap:
-            group = cls.trackhashmap.get(trackhash, None)
-
-            if not group:
-                continue
-
+        for group in list(cls.trackhashmap.values()):
             for track in group.tracks:
                 prop_value = getattr(track, key)
                 if predicate(prop_value, value):
@@ -267,35 +361,55 @@ class TrackStore:
     @classmethod
     def get_tracks_by_albumhash(cls, album_hash: str) -> list[Track]:
         """
-        Returns all tracks matching the given album hash.
+        Returns the tracks of an album, keeping the highest bitrate
+        track for each trackhash.
         """
-        return cls.find_tracks_by(key="albumhash", value=album_hash)
+        with cls.lock:
+            tracks = list(cls.albumhashmap.get(album_hash, {}).values())
+
+        return remove_duplicates(tracks)
 
     @classmethod
     def get_tracks_by_artisthash(cls, artisthash: str):
         """
         Returns all tracks matching the given artist. Duplicate tracks are removed.
         """
-        predicate = lambda artisthashes, artisthash: artisthash in artisthashes
-        return cls.find_tracks_by(
-            key="artisthashes", value=artisthash, predicate=predicate
-        )
+        with cls.lock:
+            tracks = list(cls.artisthashmap.get(artisthash, {}).values())
+
+        return remove_duplicates(tracks)
+
+    @classmethod
+    def get_unique_tracks_by_artisthash(cls, artisthash: str) -> list[Track]:
+        """
+        Returns the tracks by an artist, including the ones where they are
+        only an album artist, keeping the highest bitrate track for each
+        trackhash.
+        """
+        with cls.lock:
+            tracks = {
+                **cls.artisthashmap.get(artisthash, {}),
+                **cls.albumartisthashmap.get(artisthash, {}),
+            }
+
+        return remove_duplicates(list(tracks.values()))
 
     @classmethod
     def get_tracks_in_path(cls, path: str):
         """
         Returns all tracks in the given path.
         """
-        predicate: Callable[[str, str], bool] = (
-            lambda track_folder, path: track_folder.startswith(path)
-        )
+        tracks: list[Track] = []
 
-        return cls.find_tracks_by(
-            key="folder",
-            value=path,
-            predicate=predicate,
-            including_duplicates=True,
-        )
+        # INFO: Folders sharing the prefix are contiguous in the sorted list
+        with cls.lock:
+            for folder in cls.folders.irange(minimum=path):
+                if not folder.startswith(path):
+                    break
+
+                tracks.extend(cls.foldermap.get(folder, {}).values())
+
+        return tracks
 
     @classmethod
     def get_recently_added(cls, start: int, limit: int | None):
@@ -1,5 +1,6 @@
+import itertools
 import locale
-from typing import Iterable, TypeVar
+from typing import Iterable, Iterator, TypeVar
 
 T = TypeVar("T")
 
@@ -19,3 +20,14 @@ def flatten(list_: Iterable[list[T]]) -> list[T]:
     Flattens a list of lists into a single list.
     """
     return [item for sublist in list_ for item in sublist]
+
+
+def chunk(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """
+    Splits an iterable into lists of `size` items, without
+    reading it all into memory first. The last list may be shorter.
+    """
+    iterator = iter(iterable)
+
+    while items := list(itertools.islice(iterator, size)):
+        yield items
@@ -1,4 +1,5 @@
 import mimetypes
+import os
 
 
 def get_mime_from_ext(filename: str):
@@ -19,3 +20,26 @@ def guess_mime_type(filename: str):
         return get_mime_from_ext(filename)
 
     return type
+
+
+def warm_file(filepath: str, length: int):
+    """
+    Asks the OS to read the first `length` bytes of a file into the
+    page cache in the background.
+
+    Does nothing where `posix_fadvise` is not available (Windows and macOS).
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
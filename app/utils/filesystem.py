@@ -1,5 +1,7 @@
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 from app.settings import SUPPORTED_FILES
 from app.utils.wintools import win_replace_slash
@@ -7,36 +9,125 @@ from app.utils.wintools import win_replace_slash
 CWD = Path(__file__).parent.resolve()
 
 
-def run_fast_scandir(_dir: str, full=False) -> tuple[list[str], list[str]]:
+# (supported filepaths, subdirectory paths)
+DirListing = tuple[list[str], list[str]]
+
+
+def list_dir(dirpath: str) -> DirListing:
     """
-    Scans a directory for files with a specific extension.
-    Returns a list of files and folders in the directory.
+    Lists the supported files and the non-hidden subdirectories of a directory.
     """
+    files = []
+    subdirs = []
 
-    if _dir == "":
-        return [], []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith("."):
+                        subdirs.append(entry.path)
+                elif entry.is_file():
+                    ext = os.path.splitext(entry.name)[1].lower()
 
-    subfolders = []
-    files = []
+                    if ext in SUPPORTED_FILES:
+                        files.append(win_replace_slash(entry.path))
+            except OSError:
+                continue
+
+    return files, subdirs
+
+
+def is_excluded(path: str, exclude_dirs: Iterable[str]) -> bool:
+    """
+    Whether the path is one of the excluded directories or inside one.
+    """
+    for _dir in exclude_dirs:
+        if path == _dir or path.startswith(_dir.rstrip(os.sep) + os.sep):
+            return True
+
+    return False
+
+
+def walk_files(
+    root: str,
+    exclude_dirs: Iterable[str] = (),
+    workers: int = 1,
+    visit: Callable[[str, os.stat_result], DirListing] | None = None,
+) -> Iterator[str]:
+    """
+    Walks a directory tree without recursion, yielding the supported files
+    as they are found.
+
+    Hidden and excluded directories are skipped. Directories are identified
+    by their device and inode, so symlink loops are only walked once.
+
+    With more than one worker, directories are listed in parallel in a
+    thread pool, which helps on network filesystems where each listing
+    waits on the network. Files are then yielded in no particular order.
+
+    `visit` is called with each directory path and its stat, and returns
+    its files and subdirectories. Defaults to listing the directory.
+    """
+    if root == "":
+        return
+
+    exclude_dirs = [os.path.normpath(d) for d in exclude_dirs if d]
+    seen: set[tuple[int, int]] = set()
+
+    def read_dir(dirpath: str):
+        try:
+            stat = os.stat(dirpath)
+            listing = visit(dirpath, stat) if visit else list_dir(dirpath)
+            return (stat.st_dev, stat.st_ino), listing
+        except (OSError, ValueError):
+            return None
+
+    def expand(result):
+        """
+        Returns the files and the subdirectories to walk next,
+        or None if the directory has already been walked.
+        """
+        if result is None:
+            return None
+
+        key, (files, subdirs) = result
+
+        if key in seen:
+            return None
+
+        seen.add(key)
+        return files, [d for d in subdirs if not is_excluded(d, exclude_dirs)]
+
+    if is_excluded(os.path.normpath(root), exclude_dirs):
+        return
+
+    if workers <= 1:
+        stack = [root]
+
+        while stack:
+            listing = expand(read_dir(stack.pop()))
+
+            if listing is not None:
+                yield from listing[0]
+                stack.extend(reversed(listing[1]))
+
+        return
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {pool.submit(read_dir, root)}
 
     try:
-        for _file in os.scandir(_dir):
-            if _file.is_dir() and not _file.name.startswith("."):
-                subfolders.append(_file.path)
-            if _file.is_file():
-                ext = os.path.splitext(_file.name)[1].lower()
-                if ext in SUPPORTED_FILES:
-                    files.append(win_replace_slash(_file.path))
-
-        if full or len(files) == 0:
-            for _dir in list(subfolders):
-                sub_dirs, _file = run_fast_scandir(_dir, full=True)
-                subfolders.extend(sub_dirs)
-                files.extend(_file)
-    except (OSError, PermissionError, FileNotFoundError, ValueError):
-        return [], []
-
-    return subfolders, files
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                listing = expand(future.result())
+
+                if listing is not None:
+                    yield from listing[0]
+                    pending.update(pool.submit(read_dir, d) for d in listing[1])
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 def get_home_res_path(filename: str):
@@ -1,4 +1,8 @@
+import multiprocessing
+import os
+import sys
 import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
 
 def background(func):
@@ -32,3 +36,31 @@ class ThreadWithReturnValue(threading.Thread):
     def join(self, *args):
         threading.Thread.join(self, *args)
         return self._return
+
+
+def get_cpu_count():
+    """
+    Returns the number of CPUs on the machine.
+    """
+    cpu_count = os.cpu_count() or 0
+    return cpu_count // 2 if cpu_count > 2 else cpu_count
+
+
+def get_process_pool(max_workers: int | None = None) -> Executor:
+    """
+    Returns a process pool with forked workers.
+
+    Falls back to a thread pool where fork is not available or not safe
+    (Windows and macOS), as spawned workers re-run the app's startup code.
+    """
+    max_workers = max_workers or get_cpu_count() or 1
+
+    if (
+        sys.platform == "darwin"
+        or "fork" not in multiprocessing.get_all_start_methods()
+    ):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("fork")
+    )
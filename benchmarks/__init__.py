@@ -0,0 +1,7 @@
+"""
+Micro-benchmarks for the in-memory stores and libraries.
+
+Run them from the project root, eg:
+
+    python -m benchmarks.trackstore
+"""
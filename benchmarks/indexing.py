@@ -0,0 +1,106 @@
+"""
+Measures how many files per second `IndexTracks.tag_untagged` indexes.
+
+A synthetic corpus of small tagged WAV files is written to a temporary
+directory and indexed into a temporary database. The "sequential" run
+reads and inserts one file at a time (the old behaviour).
+
+    python -m benchmarks.indexing [file count]
+"""
+
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from app.config import UserConfig
+from app.db import create_all_tables
+from app.db.engine import DbEngine
+from app.db.libdata import TrackTable
+from app.lib import tagger
+from app.lib.taglib import get_tags
+from app.settings import Paths
+
+
+def info_chunk(tags: dict[bytes, str]) -> bytes:
+    body = b"INFO"
+
+    for key, value in tags.items():
+        data = value.encode() + b"\x00"
+        data += b"\x00" * (len(data) % 2)
+        body += key + struct.pack("<I", len(data)) + data
+
+    return b"LIST" + struct.pack("<I", len(body)) + body
+
+
+def write_wav(path: str, title: str, artist: str, album: str):
+    """
+    Writes a one second, 8kHz mono WAV file with RIFF INFO tags.
+    """
+    samples = b"\x80" * 8000
+    fmt = struct.pack("<HHIIHH", 1, 1, 8000, 8000, 1, 8)
+    chunks = (
+        b"fmt " + struct.pack("<I", len(fmt)) + fmt,
+        info_chunk({b"INAM": title, b"IART": artist, b"IPRD": album}),
+        b"data" + struct.pack("<I", len(samples)) + samples,
+    )
+    body = b"WAVE" + b"".join(chunks)
+
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def make_corpus(root: str, count: int) -> set[str]:
+    files = set()
+
+    for i in range(count):
+        folder = os.path.join(root, f"artist {i // 120}", f"album {i // 12}")
+        os.makedirs(folder, exist_ok=True)
+
+        path = os.path.join(folder, f"{i}.wav")
+        write_wav(path, f"track {i}", f"artist {i // 120}", f"album {i // 12}")
+        files.add(path)
+
+    return files
+
+
+def setup_db(root: str, name: str):
+    DbEngine.engine = create_engine(f"sqlite+pysqlite:///{root}/{name}.db")
+    create_all_tables()
+
+
+def sequential(files: set[str]):
+    config = UserConfig()
+
+    for file in files:
+        tags = get_tags(file, config=config)
+
+        if tags is not None:
+            TrackTable.insert_one(tags)
+
+
+def pipelined(files: set[str]):
+    tagger.POPULATE_KEY = 1
+    indexer = tagger.IndexTracks.__new__(tagger.IndexTracks)
+    indexer.tag_untagged(files, 1)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with tempfile.TemporaryDirectory() as root:
+        Paths.set_config_dir(root)
+        files = make_corpus(os.path.join(root, "music"), count)
+
+        for name, func in (("sequential", sequential), ("pipelined", pipelined)):
+            setup_db(root, name)
+
+            start = time.perf_counter()
+            func(files)
+            elapsed = time.perf_counter() - start
+
+            assert TrackTable.count() == count
+            print(f"{name}: {count / elapsed:.0f} files/s ({elapsed:.2f}s)")
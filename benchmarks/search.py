@@ -0,0 +1,118 @@
+"""
+Measures the latency of track, album and artist searches.
+
+The "rebuild" columns normalize every title on each query (the old
+behaviour), the "index" columns search the prebuilt SearchStore.
+
+    python -m benchmarks.search [size ...]
+"""
+
+import sys
+import time
+
+from rapidfuzz import process, utils
+from tabulate import tabulate
+from unidecode import unidecode
+
+from app.lib.searchlib import Cutoff, Limit, SearchAlbums, SearchArtists, SearchTracks
+from app.store.albums import AlbumStore
+from app.store.artists import ArtistStore
+from app.store.search import SearchStore
+from app.store.tracks import TrackStore
+from benchmarks.utils import make_tracks, timeit
+
+SIZES = [50_000, 200_000]
+
+
+def load_stores(size: int):
+    TrackStore.trackhashmap = dict()
+    TrackStore.clear_indexes()
+    TrackStore.add_tracks(make_tracks(size))
+    AlbumStore.load_albums("benchmark")
+    ArtistStore.load_artists("benchmark")
+
+    start = time.perf_counter()
+    SearchStore.load_index("benchmark")
+    return (time.perf_counter() - start) * 1000
+
+
+def rebuild_search(items: list, texts: list[str], query: str, cutoff: int, limit: int):
+    choices = [unidecode(text).lower() for text in texts]
+    results = process.extract(
+        query,
+        choices,
+        score_cutoff=cutoff,
+        limit=limit,
+        processor=utils.default_process,
+    )
+    return [items[i[2]] for i in results]
+
+
+def old_tracks(query: str):
+    tracks = TrackStore.get_flat_list()
+    texts = [t.og_title for t in tracks]
+    return rebuild_search(tracks, texts, query, Cutoff.tracks, Limit.tracks)
+
+
+def old_albums(query: str):
+    albums = AlbumStore.get_flat_list()
+    texts = [a.og_title for a in albums]
+    return rebuild_search(albums, texts, query, Cutoff.albums, Limit.albums)
+
+
+def old_artists(query: str):
+    artists = ArtistStore.get_flat_list()
+    texts = [a.name for a in artists]
+    return rebuild_search(artists, texts, query, Cutoff.artists, Limit.artists)
+
+
+def run(size: int):
+    build_time = load_stores(size)
+    sample = TrackStore.get_flat_list()[size // 2]
+    queries = ["lo", "love", sample.og_title[:12], sample.og_title]
+
+    rows = []
+    for query in queries:
+        rows.append(
+            [
+                size,
+                query,
+                timeit(lambda: old_tracks(query), runs=5),
+                timeit(lambda: SearchTracks(query)(), runs=5),
+                timeit(lambda: old_albums(query), runs=5),
+                timeit(lambda: SearchAlbums(query)(), runs=5),
+                timeit(lambda: old_artists(query), runs=5),
+                timeit(lambda: SearchArtists(query)(), runs=5),
+            ]
+        )
+
+    return build_time, rows
+
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or SIZES
+    rows = []
+
+    for size in sizes:
+        build_time, size_rows = run(size)
+        print(f"{size} tracks: search index built in {build_time:.0f} ms")
+        rows.extend(size_rows)
+
+    print()
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "tracks",
+                "query",
+                "tracks rebuild",
+                "tracks index",
+                "albums rebuild",
+                "albums index",
+                "artists rebuild",
+                "artists index",
+            ],
+            floatfmt=".1f",
+        )
+    )
+    print("\nAll times are milliseconds per query.")
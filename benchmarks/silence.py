@@ -0,0 +1,172 @@
+"""
+Measures silence detection and the NumPy audioop backend.
+
+The "loop" column slices the segment once per seek step and computes the
+rms of each slice (the old behaviour), the "vectorized" column computes
+the rms of all windows in one pass. Both must find the same silence.
+
+The audioop table compares the NumPy backend with the stdlib module,
+where it is still available (Python < 3.13).
+
+    python -m benchmarks.silence [seconds ...]
+"""
+
+import sys
+import warnings
+
+import numpy as np
+from tabulate import tabulate
+
+from app.lib.pydub.pydub import AudioSegment, npaudioop
+from app.lib.pydub.pydub.silence import detect_leading_silence, detect_silence
+from app.lib.pydub.pydub.utils import db_to_float
+from benchmarks.utils import timeit
+
+SECONDS = [30, 300]
+SAMPLE_RATE = 44100
+
+
+def make_segment(seconds: int, seed: int = 0) -> AudioSegment:
+    """
+    Returns a stereo 16-bit segment of noise with 3s of silence
+    at both ends and a 2s gap in the middle.
+    """
+    rng = np.random.default_rng(seed)
+    frames = seconds * SAMPLE_RATE
+    samples = rng.integers(-8000, 8000, size=(frames, 2), dtype=np.int16)
+
+    silence = 3 * SAMPLE_RATE
+    samples[:silence] = 0
+    samples[-silence:] = 0
+
+    middle = frames // 2
+    samples[middle : middle + 2 * SAMPLE_RATE] = 0
+
+    return AudioSegment(
+        data=samples.tobytes(), sample_width=2, frame_rate=SAMPLE_RATE, channels=2
+    )
+
+
+def loop_detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    seg_len = len(audio_segment)
+
+    if seg_len < min_silence_len:
+        return []
+
+    silence_thresh = db_to_float(silence_thresh) * audio_segment.max_possible_amplitude
+    last_slice_start = seg_len - min_silence_len
+    slice_starts = list(range(0, last_slice_start + 1, seek_step))
+
+    if last_slice_start % seek_step:
+        slice_starts.append(last_slice_start)
+
+    silence_starts = [
+        i
+        for i in slice_starts
+        if audio_segment[i : i + min_silence_len].rms <= silence_thresh
+    ]
+
+    if not silence_starts:
+        return []
+
+    silent_ranges = []
+    prev_i = silence_starts.pop(0)
+    current_range_start = prev_i
+
+    for silence_start_i in silence_starts:
+        continuous = silence_start_i == prev_i + seek_step
+        silence_has_gap = silence_start_i > (prev_i + min_silence_len)
+
+        if not continuous and silence_has_gap:
+            silent_ranges.append([current_range_start, prev_i + min_silence_len])
+            current_range_start = silence_start_i
+        prev_i = silence_start_i
+
+    silent_ranges.append([current_range_start, prev_i + min_silence_len])
+    return silent_ranges
+
+
+def loop_detect_leading_silence(sound, silence_threshold=-50.0, chunk_size=10):
+    trim_ms = 0
+
+    while (
+        sound[trim_ms : trim_ms + chunk_size].dBFS < silence_threshold
+        and trim_ms < len(sound)
+    ):
+        trim_ms += chunk_size
+
+    return min(trim_ms, len(sound))
+
+
+def bench_silence(seconds: int):
+    audio = make_segment(seconds)
+    rows = []
+
+    cases = [
+        (
+            "detect_silence",
+            lambda: loop_detect_silence(audio, silence_thresh=-40.0, seek_step=10),
+            lambda: detect_silence(audio, silence_thresh=-40.0, seek_step=10),
+        ),
+        (
+            "detect_leading_silence",
+            lambda: loop_detect_leading_silence(audio, -40.0, 10),
+            lambda: detect_leading_silence(audio, -40.0, 10),
+        ),
+    ]
+
+    for name, old, new in cases:
+        assert old() == new(), name
+        old_ms = timeit(old, runs=3)
+        new_ms = timeit(new, runs=3)
+        rows.append([f"{name} ({seconds}s)", old_ms, new_ms, old_ms / new_ms])
+
+    return rows
+
+
+def bench_audioop():
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            import audioop
+    except ImportError:
+        print("The stdlib audioop module is not available, skipping.")
+        return
+
+    data = make_segment(30).raw_data
+    cases = {
+        "rms": (data, 2),
+        "max": (data, 2),
+        "mul": (data, 2, 0.5),
+        "bias": (data, 2, 100),
+        "add": (data, data, 2),
+        "tomono": (data, 2, 0.5, 0.5),
+        "lin2lin": (data, 2, 4),
+        "ratecv": (data, 2, 2, 44100, 48000, None),
+    }
+
+    rows = []
+
+    for name, args in cases.items():
+        stdlib = getattr(audioop, name)
+        numpy = getattr(npaudioop, name)
+
+        assert stdlib(*args) == numpy(*args), name
+        rows.append(
+            [name, timeit(lambda: stdlib(*args), runs=5), timeit(lambda: numpy(*args), runs=5)]
+        )
+
+    print(tabulate(rows, headers=["audioop (30s)", "stdlib ms", "numpy ms"], floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SECONDS
+    rows = [row for seconds in sizes for row in bench_silence(seconds)]
+
+    print(
+        tabulate(
+            rows, headers=["", "loop ms", "vectorized ms", "speedup"], floatfmt=".1f"
+        )
+    )
+    print()
+    bench_audioop()
@@ -0,0 +1,100 @@
+"""
+Measures thumbnail generation from album art.
+
+The "full" column resizes the fully decoded cover to every size (the old
+behaviour), the "cascaded" column is `save_thumb`, which decodes JPEGs at
+a reduced scale and resizes each size from the one before it.
+
+The pool run saves the thumbnails of a set of covers in the process pool
+used by `ProcessTrackThumbnails`.
+
+    python -m benchmarks.thumbnails [cover count]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+from tabulate import tabulate
+
+from app.lib.imagepack import get_image_dir
+from app.lib.taglib import get_thumb_sizes, save_thumb
+from app.settings import Paths
+from app.setup.files import create_config_dir
+from app.utils import chunk
+from app.utils.threading import get_process_pool
+from benchmarks.utils import timeit
+
+COVERS = [("jpeg", 3000), ("jpeg", 1400), ("png", 1400), ("jpeg", 600)]
+
+
+def make_cover(format: str, size: int) -> bytes:
+    """
+    Returns a cover with some detail, so that encoding is not trivial.
+    """
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    img.paste((200, 40, 90), (size // 4, size // 4, size // 2, size // 2))
+
+    buffer = BytesIO()
+    img.save(buffer, format)
+    return buffer.getvalue()
+
+
+def save_full(album_art: bytes, webp_path: str):
+    img = Image.open(BytesIO(album_art))
+    ratio = img.width / img.height
+
+    for size, width in get_thumb_sizes():
+        path = os.path.join(get_image_dir(size), webp_path)
+        img.resize((width, int(width / ratio)), Image.LANCZOS).save(path, "webp")
+
+
+def save_covers(covers: list[tuple[bytes, str]]):
+    for album_art, webp_path in covers:
+        save_thumb(album_art, webp_path)
+
+    return len(covers)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as root:
+        Paths.set_config_dir(root)
+        create_config_dir()
+
+        rows = []
+
+        for format, size in COVERS:
+            cover = make_cover(format, size)
+            full_ms = timeit(lambda: save_full(cover, "full.webp"), runs=5)
+            cascaded_ms = timeit(lambda: save_thumb(cover, "cascaded.webp"), runs=5)
+            rows.append(
+                [f"{format} {size}px", full_ms, cascaded_ms, full_ms / cascaded_ms]
+            )
+
+        print(
+            tabulate(
+                rows, headers=["cover", "full ms", "cascaded ms", "speedup"], floatfmt=".1f"
+            )
+        )
+        print()
+
+        cover = make_cover("jpeg", 1400)
+        covers = [(cover, f"{i}.webp") for i in range(count)]
+
+        start = time.perf_counter()
+        save_covers(covers)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with get_process_pool() as executor:
+            sum(executor.map(save_covers, chunk(covers, 16)))
+        pooled = time.perf_counter() - start
+
+        assert len(os.listdir(Paths.get_sm_thumb_path())) >= count
+        print(f"sequential: {count / sequential:.0f} covers/s")
+        print(f"process pool: {count / pooled:.0f} covers/s")
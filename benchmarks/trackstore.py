@@ -0,0 +1,82 @@
+"""
+Measures the per-call latency of the TrackStore lookups against library size.
+
+The "scan" columns use `TrackStore.find_tracks_by` which walks every track
+group, the "index" columns use the secondary indexes.
+
+    python -m benchmarks.trackstore [size ...]
+"""
+
+import random
+import sys
+
+from tabulate import tabulate
+
+from app.store.tracks import TrackStore
+from benchmarks.utils import make_tracks, timeit
+
+SIZES = [10_000, 50_000, 100_000, 200_000]
+
+
+def load_store(size: int):
+    TrackStore.trackhashmap = dict()
+    TrackStore.clear_indexes()
+    TrackStore.add_tracks(make_tracks(size))
+
+
+def run(size: int):
+    load_store(size)
+
+    tracks = TrackStore.get_flat_list()
+    rng = random.Random(size)
+    sample = rng.choice(tracks)
+
+    albumhash = sample.albumhash
+    artisthash = sample.artisthashes[0]
+    folder = sample.folder.rsplit("/", 2)[0] + "/"
+    filepaths = [t.filepath for t in rng.sample(tracks, 20)]
+
+    in_folder = lambda track_folder, path: track_folder.startswith(path)
+    by_artist = lambda artisthashes, artisthash: artisthash in artisthashes
+
+    return [
+        size,
+        timeit(lambda: TrackStore.find_tracks_by("albumhash", albumhash)),
+        timeit(lambda: TrackStore.get_tracks_by_albumhash(albumhash)),
+        timeit(
+            lambda: TrackStore.find_tracks_by("artisthashes", artisthash, by_artist)
+        ),
+        timeit(lambda: TrackStore.get_tracks_by_artisthash(artisthash)),
+        timeit(lambda: TrackStore.find_tracks_by("folder", folder, in_folder, True)),
+        timeit(lambda: TrackStore.get_tracks_in_path(folder)),
+        timeit(
+            lambda: TrackStore.find_tracks_by(
+                "filepath", filepaths, lambda p, v: p in v, True
+            )
+        ),
+        timeit(lambda: TrackStore.get_tracks_by_filepaths(filepaths)),
+    ]
+
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or SIZES
+    rows = [run(size) for size in sizes]
+
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "tracks",
+                "album scan",
+                "album index",
+                "artist scan",
+                "artist index",
+                "folder scan",
+                "folder index",
+                "filepaths scan",
+                "filepaths index",
+            ],
+            floatfmt=".3f",
+        )
+    )
+    print("\nAll times are milliseconds per call.")
@@ -0,0 +1,84 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import random
+import string
+import time
+from typing import Any, Callable
+
+from app.config import UserConfig
+from app.models import Track
+from app.utils.hashing import create_hash
+
+
+def random_words(rng: random.Random, count: int) -> str:
+    """
+    Returns a string of `count` random lowercase words.
+    """
+    return " ".join(
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+        for _ in range(count)
+    )
+
+
+def make_tracks(count: int, seed: int = 0) -> list[Track]:
+    """
+    Creates a synthetic library of `count` tracks.
+
+    Tracks are spread over ~count/12 albums by ~count/60 artists,
+    with one folder per album.
+    """
+    rng = random.Random(seed)
+    config = UserConfig()
+
+    artists = [random_words(rng, 2) for _ in range(max(1, count // 60))]
+    albums = [
+        (random_words(rng, 3), rng.choice(artists)) for _ in range(max(1, count // 12))
+    ]
+
+    tracks: list[Track] = []
+
+    for i in range(count):
+        album, albumartist = rng.choice(albums)
+        folder = f"/music/{albumartist}/{album}"
+
+        track = Track(
+            id=i,
+            album=album,
+            albumartists=albumartist,
+            albumhash=create_hash(album, albumartist),
+            artists=albumartist,
+            bitrate=rng.choice([128, 256, 320, 1411]),
+            copyright="",
+            date=rng.randint(0, 1_700_000_000),
+            disc=1,
+            duration=rng.randint(60, 600),
+            filepath=f"{folder}/{i}.mp3",
+            folder=folder,
+            genres="",
+            last_mod=rng.randint(0, 1_700_000_000),
+            title=random_words(rng, rng.randint(1, 5)),
+            track=i % 12 + 1,
+            trackhash="",
+            extra={},
+            lastplayed=0,
+            playcount=0,
+            playduration=0,
+            config=config,
+        )
+        tracks.append(track)
+
+    return tracks
+
+
+def timeit(func: Callable[[], Any], runs: int = 20) -> float:
+    """
+    Returns the mean time per call of `func` in milliseconds.
+    """
+    start = time.perf_counter()
+
+    for _ in range(runs):
+        func()
+
+    return (time.perf_counter() - start) / runs * 1000
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.lib.imagepack import ImagePack, encode_record, get_image_dir, read_image
+from app.settings import Paths
+from app.setup.files import create_config_dir
+
+
+class TestImagePack(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        Paths.set_config_dir(self.dir.name)
+        create_config_dir()
+
+        self.path = Paths.get_image_pack_path()
+        self.enabled = True
+        patch = mock.patch.object(ImagePack, "enabled", lambda: self.enabled)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        ImagePack.load()
+
+    def tearDown(self):
+        ImagePack.close()
+        self.dir.cleanup()
+
+    def write_file(self, kind: str, hash: str, data: bytes):
+        with open(os.path.join(get_image_dir(kind), hash + ".webp"), "wb") as f:
+            f.write(data)
+
+    def test_append_and_get(self):
+        ImagePack.append("a", {"sm": b"small", "lg": b"large"})
+
+        self.assertEqual(ImagePack.get("sm", "a")[0], b"small")
+        self.assertEqual(ImagePack.get("lg", "a")[0], b"large")
+        self.assertIsNone(ImagePack.get("md", "a"))
+        self.assertEqual(ImagePack.get_hashes("sm"), {"a"})
+
+    def test_replaced_image_gets_a_new_etag(self):
+        ImagePack.append("a", {"sm": b"old"})
+        _, old_etag = ImagePack.get("sm", "a")
+        ImagePack.append("a", {"sm": b"new"})
+
+        data, etag = ImagePack.get("sm", "a")
+        self.assertEqual(data, b"new")
+        self.assertNotEqual(etag, old_etag)
+
+    def test_load_indexes_existing_pack(self):
+        ImagePack.append("a", {"sm": b"one"})
+        ImagePack.append("b", {"sm": b"two"})
+        ImagePack.append("a", {"sm": b""})
+
+        ImagePack.load()
+
+        self.assertIsNone(ImagePack.get("sm", "a"))
+        self.assertEqual(ImagePack.get("sm", "b")[0], b"two")
+
+    def test_load_truncates_incomplete_record(self):
+        ImagePack.append("a", {"sm": b"image"})
+        size = os.path.getsize(self.path)
+
+        with open(self.path, "ab") as f:
+            f.write(encode_record("sm", "b", b"cut off")[:-3])
+
+        ImagePack.load()
+        self.assertEqual(os.path.getsize(self.path), size)
+
+        # INFO: Records appended after the truncation are found
+        ImagePack.append("c", {"sm": b"after"})
+        self.assertEqual(ImagePack.get("sm", "c")[0], b"after")
+        self.assertEqual(ImagePack.get("sm", "a")[0], b"image")
+
+    def test_compact_drops_replaced_records_and_packs_files(self):
+        ImagePack.append("a", {"sm": b"x" * 1000})
+        ImagePack.append("a", {"sm": b"kept"})
+        ImagePack.append("b", {"sm": b"removed"})
+        ImagePack.append("b", {"sm": b""})
+        self.write_file("xsm", "c", b"loose")
+        # INFO: The packed copy of "a" was saved after this file
+        self.write_file("sm", "a", b"stale")
+
+        before, after, files = ImagePack.compact()
+
+        self.assertLess(after, before)
+        self.assertEqual(files, 2)
+        self.assertEqual(os.listdir(get_image_dir("xsm")), [])
+        self.assertEqual(os.listdir(get_image_dir("sm")), [])
+
+        ImagePack.load()
+        self.assertEqual(ImagePack.get("sm", "a")[0], b"kept")
+        self.assertIsNone(ImagePack.get("sm", "b"))
+        self.assertEqual(ImagePack.get("xsm", "c")[0], b"loose")
+
+    def test_saved_file_is_not_shadowed_after_disabling(self):
+        ImagePack.append("a", {"sm": b"packed"})
+        self.enabled = False
+
+        self.write_file("sm", "a", b"file")
+        ImagePack.remove("a", ["sm", "md"])
+
+        self.assertEqual(read_image("sm", "a"), b"file")
+
+        # INFO: Compacting keeps the file, as packing is disabled
+        ImagePack.compact()
+        self.assertEqual(read_image("sm", "a"), b"file")
+
+        self.enabled = True
+        ImagePack.compact()
+        self.assertEqual(ImagePack.get("sm", "a")[0], b"file")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from flask_openapi3 import OpenAPI
+
+from app.api import imgserver
+from app.api.imgserver import BATCH_HEADER, BATCH_LENGTH, BATCH_MAGIC, ImageCache
+from app.lib.imagepack import ImagePack, get_image_dir
+from app.settings import Paths
+from app.setup.files import create_config_dir
+from app.store.thumbnails import ThumbnailStore
+
+
+def parse_batch(data: bytes):
+    """
+    Returns the thumbnails of a batch response, with None for missing ones.
+    """
+    magic, count = BATCH_HEADER.unpack_from(data)
+    offset = BATCH_HEADER.size
+    thumbnails = []
+
+    assert magic == BATCH_MAGIC
+
+    for _ in range(count):
+        (length,) = BATCH_LENGTH.unpack_from(data, offset)
+        offset += BATCH_LENGTH.size
+        thumbnails.append(data[offset : offset + length] if length else None)
+        offset += length
+
+    assert offset == len(data)
+    return thumbnails
+
+
+class TestThumbnailBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        Paths.set_config_dir(self.dir.name)
+        create_config_dir()
+        ImagePack.load()
+
+        ThumbnailStore.entries = {}
+        ImageCache.entries.clear()
+        ImageCache.size = 0
+
+        for hash in ("a", "b"):
+            for size in ("sm", "xsm"):
+                self.write_thumbnail(size, hash, f"{size}-{hash}".encode())
+
+            ThumbnailStore.entries[hash] = (["sm", "xsm"], 0)
+
+        app = OpenAPI(__name__)
+        app.register_api(imgserver.api)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        ImagePack.close()
+        self.dir.cleanup()
+
+    def write_thumbnail(self, size: str, hash: str, data: bytes):
+        with open(os.path.join(get_image_dir(size), hash + ".webp"), "wb") as f:
+            f.write(data)
+
+    def post(self, albumhashes: list[str], size: str | None = None):
+        body = {"albumhashes": albumhashes}
+
+        if size is not None:
+            body["size"] = size
+
+        return self.client.post("/img/thumbnail/batch", json=body)
+
+    def test_format(self):
+        response = self.post(["a", "b"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/octet-stream")
+        self.assertEqual(
+            response.data,
+            struct.pack("<4sI", b"SWIB", 2)
+            + struct.pack("<I", 4)
+            + b"sm-a"
+            + struct.pack("<I", 4)
+            + b"sm-b",
+        )
+
+    def test_order_size_and_missing(self):
+        # INFO: "c" is not in the manifest, "d" is but has no file
+        ThumbnailStore.entries["d"] = (["sm", "xsm"], 0)
+        thumbnails = parse_batch(self.post(["b", "c", "a", "d", "b"], "xsmall").data)
+
+        self.assertEqual(thumbnails, [b"xsm-b", None, b"xsm-a", None, b"xsm-b"])
+
+    def test_empty_and_limit(self):
+        self.assertEqual(parse_batch(self.post([]).data), [])
+
+        hashes = ["a"] * (imgserver.MAX_BATCH_SIZE + 10)
+        thumbnails = parse_batch(self.post(hashes).data)
+        self.assertEqual(len(thumbnails), imgserver.MAX_BATCH_SIZE)
+
+    def test_invalid_size(self):
+        self.assertEqual(self.post(["a"], "large").status_code, 422)
+
+    def test_replaced_thumbnail(self):
+        self.assertEqual(parse_batch(self.post(["a"]).data), [b"sm-a"])
+
+        self.write_thumbnail("sm", "a", b"new")
+        ThumbnailStore.entries["a"] = (["sm", "xsm"], 10)
+
+        self.assertEqual(parse_batch(self.post(["a"]).data), [b"new"])
+
+
+if __name__ == "__main__":
+    unittest.main()
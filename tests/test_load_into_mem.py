@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from app.db import DbEngine, create_all_tables
+from app.db.libdata import AnalysisTable, TrackTable
+from app.settings import Paths
+from app.setup import load_into_mem
+from app.setup.files import create_config_dir
+from app.store.tracks import TrackStore
+
+LOUDNESS = {"integrated": -9.5, "gain": -8.5, "peak": 0.98}
+
+
+def make_row(filepath: str, last_mod: int):
+    return {
+        "album": "Album",
+        "albumartists": "Artist",
+        "albumhash": "albumhash",
+        "artists": "Artist",
+        "bitrate": 320,
+        "copyright": "",
+        "date": 0,
+        "disc": 1,
+        "duration": 180,
+        "filepath": filepath,
+        "folder": "/music",
+        "genres": "",
+        "last_mod": last_mod,
+        "title": filepath,
+        "track": 1,
+        "trackhash": filepath,
+        "extra": {},
+    }
+
+
+class TestLoadIntoMem(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        Paths.set_config_dir(self.dir.name)
+        create_config_dir()
+
+        DbEngine.engine = create_engine(f"sqlite+pysqlite:///{self.dir.name}/t.db")
+        create_all_tables()
+
+    def tearDown(self):
+        DbEngine.engine.dispose()
+        self.dir.cleanup()
+
+    def test_loads_saved_loudness(self):
+        TrackTable.insert_many(
+            [make_row("/music/a.mp3", 100), make_row("/music/b.mp3", 200)]
+        )
+        AnalysisTable.set_results("/music/a.mp3", 100, {"loudness": LOUDNESS})
+        # INFO: Measured before the file was last modified
+        AnalysisTable.set_results("/music/b.mp3", 150, {"loudness": LOUDNESS})
+
+        load_into_mem()
+
+        self.assertEqual(TrackStore.filepathmap["/music/a.mp3"].loudness, LOUDNESS)
+        self.assertIsNone(TrackStore.filepathmap["/music/b.mp3"].loudness)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from app.lib.scanmanifest import ScanManifest
+
+
+class TestScanManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+
+        self.album = os.path.join(self.root, "album")
+        os.mkdir(self.album)
+        self.track = os.path.join(self.album, "track.mp3")
+
+        with open(self.track, "wb") as f:
+            f.write(b"audio")
+
+        os.utime(self.track, (1000, 1000))
+        self.scan()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def scan(self, verify: bool = False):
+        manifest = ScanManifest.load(self.manifest_path, verify=verify)
+        files = dict(manifest.scan(self.root))
+        manifest.save(self.manifest_path)
+
+        return files
+
+    def edit_in_place(self):
+        """
+        Rewrites the track without changing its directory's mtime.
+        """
+        album_mtime = os.stat(self.album).st_mtime
+
+        with open(self.track, "r+b") as f:
+            f.write(b"AUDIO!")
+
+        os.utime(self.track, (2000, 2000))
+        os.utime(self.album, (album_mtime, album_mtime))
+
+    def test_reuses_unchanged_directories(self):
+        self.edit_in_place()
+        self.assertEqual(self.scan()[self.track][:2], (5, 1000))
+
+    def test_verify_restats_files(self):
+        self.edit_in_place()
+        self.assertEqual(self.scan(verify=True)[self.track][:2], (6, 2000))
+
+        # INFO: The new stats are saved for the next scan
+        self.assertEqual(self.scan()[self.track][:2], (6, 2000))
+
+    def test_lists_changed_directories(self):
+        new_track = os.path.join(self.album, "new.flac")
+        open(new_track, "wb").close()
+        os.utime(self.album, (3000, 3000))
+
+        self.assertEqual(set(self.scan()), {self.track, new_track})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from app.api.stream import send_file_range, send_multiple_ranges
+
+DATA = bytes(range(256)) * 4
+
+
+def parse_parts(response):
+    """
+    Returns the (Content-Range, data) of each part of a multipart/byteranges response.
+    """
+    body = b"".join(response.response)
+    boundary = response.mimetype_params["boundary"].encode()
+    chunks = body.split(b"\r\n--" + boundary)
+
+    assert len(body) == response.content_length
+    assert chunks[0] == b"" and chunks[-1] == b"--\r\n"
+
+    parts = []
+
+    for chunk in chunks[1:-1]:
+        head, data = chunk.removeprefix(b"\r\n").split(b"\r\n\r\n", 1)
+        headers = dict(line.split(": ", 1) for line in head.decode().split("\r\n"))
+        parts.append((headers["Content-Range"], data))
+
+    return parts
+
+
+class TestSendMultipleRanges(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".mp3")
+
+        with os.fdopen(fd, "wb") as f:
+            f.write(DATA)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def send(self, ranges):
+        return send_multiple_ranges(self.path, "audio/mpeg", ranges)
+
+    def test_ranges(self):
+        response = self.send([(0, 10), (100, 120)])
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            parse_parts(response),
+            [
+                (f"bytes 0-9/{len(DATA)}", DATA[0:10]),
+                (f"bytes 100-119/{len(DATA)}", DATA[100:120]),
+            ],
+        )
+
+    def test_overlapping_ranges_are_sent_as_requested(self):
+        parts = parse_parts(self.send([(0, 50), (25, 75), (25, 75)]))
+
+        self.assertEqual(
+            [data for _, data in parts], [DATA[0:50], DATA[25:75], DATA[25:75]]
+        )
+        self.assertEqual(parts[1][0], f"bytes 25-74/{len(DATA)}")
+
+    def test_open_ended_and_suffix_ranges(self):
+        parts = parse_parts(self.send([(1000, None), (-10, None)]))
+
+        self.assertEqual(
+            parts,
+            [
+                (f"bytes 1000-1023/{len(DATA)}", DATA[1000:]),
+                (f"bytes 1014-1023/{len(DATA)}", DATA[-10:]),
+            ],
+        )
+
+    def test_ranges_past_the_end_are_clamped_or_dropped(self):
+        parts = parse_parts(self.send([(2000, 3000), (1020, 5000), (-5000, None)]))
+
+        self.assertEqual(
+            parts,
+            [
+                (f"bytes 1020-1023/{len(DATA)}", DATA[1020:]),
+                (f"bytes 0-1023/{len(DATA)}", DATA),
+            ],
+        )
+
+    def test_unsatisfiable_ranges(self):
+        response = self.send([(2000, 3000), (len(DATA), None)])
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers["Content-Range"], f"bytes */{len(DATA)}")
+
+    def test_range_header(self):
+        app = Flask(__name__)
+
+        with app.test_request_context(headers={"Range": "bytes=0-3,10-13"}):
+            response = send_file_range(self.path)
+            parts = parse_parts(response)
+
+        self.assertEqual([data for _, data in parts], [DATA[0:4], DATA[10:14]])
+
+        with app.test_request_context(headers={"Range": "bytes=4-7"}):
+            response = send_file_range(self.path)
+            response.direct_passthrough = False
+
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.get_data(), DATA[4:8])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+
+from app.config import UserConfig
+from app.db import DbEngine, create_all_tables
+from app.db.libdata import TrackTable
+from app.lib import tagger
+from app.lib.tagger import IndexTracks
+from app.settings import Paths
+from app.setup.files import create_config_dir
+from app.store.folder import FolderStore
+
+from test_load_into_mem import make_row
+
+
+class TestTagUntagged(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        Paths.set_config_dir(self.dir.name)
+        create_config_dir()
+
+        DbEngine.engine = create_engine(f"sqlite+pysqlite:///{self.dir.name}/t.db")
+        create_all_tables()
+        FolderStore.filepaths.clear()
+
+        config = UserConfig()
+        config.indexBatchSize = 100
+
+    def tearDown(self):
+        DbEngine.engine.dispose()
+        self.dir.cleanup()
+
+    def test_key_change_keeps_read_tracks(self):
+        paths = [f"/music/{i}.mp3" for i in range(5)]
+
+        def read_tags_in_pool(executor, files, config, modified):
+            for i, path in enumerate(files):
+                # INFO: Another scan starts after 3 files are read
+                if i == 3:
+                    tagger.POPULATE_KEY = 2
+
+                yield path, make_row(path, 0)
+
+        tagger.POPULATE_KEY = 1
+
+        with mock.patch.object(tagger, "read_tags_in_pool", read_tags_in_pool):
+            IndexTracks.__new__(IndexTracks).tag_untagged(paths, key=1)
+
+        indexed = {t.filepath for t in TrackTable.get_tracks_by_filepaths(paths)}
+
+        self.assertEqual(indexed, set(paths[:3]))
+        self.assertEqual(set(FolderStore.filepaths), indexed)
+
+
+if __name__ == "__main__":
+    unittest.main()
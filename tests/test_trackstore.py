@@ -0,0 +1,124 @@
+import unittest
+
+from app.config import UserConfig
+from app.models import Track
+from app.store.tracks import TrackStore
+
+
+def make_track(filepath: str, title: str, album: str, artists: str, bitrate=320):
+    folder = filepath.rsplit("/", 1)[0]
+
+    return Track(
+        id=0,
+        album=album,
+        albumartists=artists,
+        albumhash=album.lower(),
+        artists=artists,
+        bitrate=bitrate,
+        copyright="",
+        date=0,
+        disc=1,
+        duration=180,
+        filepath=filepath,
+        folder=folder,
+        genres="",
+        last_mod=0,
+        title=title,
+        track=1,
+        trackhash="",
+        extra={},
+        lastplayed=0,
+        playcount=0,
+        playduration=0,
+        config=UserConfig(),
+    )
+
+
+class TestTrackStoreIndexes(unittest.TestCase):
+    def setUp(self):
+        TrackStore.trackhashmap = {}
+        TrackStore.clear_indexes()
+
+        self.first = make_track("/music/a/1.mp3", "One", "Album A", "Artist X;Artist Y")
+        self.second = make_track("/music/a/2.mp3", "Two", "Album A", "Artist X")
+        # INFO: The same song in another folder, at a higher bitrate
+        self.copy = make_track(
+            "/music/b/1.flac", "One", "Album A", "Artist X;Artist Y", bitrate=1000
+        )
+
+        TrackStore.add_tracks([self.first, self.second, self.copy])
+
+    def assertIndexesMatch(self):
+        """
+        Checks that every secondary index holds exactly the stored tracks.
+        """
+        tracks = {t.filepath: t for t in TrackStore.get_flat_list()}
+
+        def flatten(index: dict[str, dict]):
+            return {path for entry in index.values() for path in entry}
+
+        self.assertEqual(set(TrackStore.filepathmap), set(tracks))
+        self.assertEqual(flatten(TrackStore.albumhashmap), set(tracks))
+        self.assertEqual(flatten(TrackStore.foldermap), set(tracks))
+        self.assertEqual(list(TrackStore.folders), sorted(TrackStore.foldermap))
+
+        for key, entry in TrackStore.albumhashmap.items():
+            self.assertTrue(entry)
+            self.assertTrue(all(t.albumhash == key for t in entry.values()))
+
+        for key, entry in TrackStore.artisthashmap.items():
+            self.assertTrue(entry)
+            self.assertTrue(all(key in t.artisthashes for t in entry.values()))
+
+    def test_add(self):
+        self.assertIndexesMatch()
+        self.assertEqual(len(TrackStore.trackhashmap), 2)
+        self.assertEqual(TrackStore.count_tracks_by_trackhash(self.first.trackhash), 2)
+
+    def test_remove_keeps_duplicates(self):
+        TrackStore.remove_tracks_by_filepaths([self.copy.filepath])
+
+        self.assertIndexesMatch()
+        self.assertNotIn("/music/b/", TrackStore.foldermap)
+        self.assertEqual(TrackStore.count_tracks_by_trackhash(self.first.trackhash), 1)
+
+    def test_remove_all(self):
+        TrackStore.remove_tracks_by_filepaths(
+            [self.first.filepath, self.second.filepath, self.copy.filepath]
+        )
+
+        self.assertIndexesMatch()
+        self.assertEqual(TrackStore.trackhashmap, {})
+        self.assertEqual(TrackStore.albumhashmap, {})
+        self.assertEqual(TrackStore.artisthashmap, {})
+        self.assertEqual(TrackStore.albumartisthashmap, {})
+
+    def test_remove_unknown_filepath(self):
+        TrackStore.remove_track_by_filepath("/music/missing.mp3")
+        self.assertIndexesMatch()
+
+    def test_readd_after_remove(self):
+        TrackStore.remove_track(self.second)
+        TrackStore.add_track(self.second)
+
+        self.assertIndexesMatch()
+        self.assertEqual(len(TrackStore.get_tracks_in_path("/music/a/")), 2)
+
+    def test_album_tracks_keep_best_copy(self):
+        tracks = TrackStore.get_tracks_by_albumhash(self.first.albumhash)
+        bitrates = {t.trackhash: t.bitrate for t in tracks}
+
+        self.assertEqual(len(tracks), 2)
+        self.assertEqual(bitrates[self.first.trackhash], 1000)
+
+    def test_artist_tracks(self):
+        artisthash = self.first.artisthashes[1]
+
+        self.assertEqual(
+            {t.filepath for t in TrackStore.get_tracks_by_artisthash(artisthash)},
+            {self.copy.filepath},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from app.lib.transcoder import (
+    PRIORITY_PLAYBACK,
+    TranscodeJobs,
+    TranscodeStream,
+)
+
+OUTPUT = b"x" * 1000
+
+
+def get_command(seconds: float):
+    """
+    Returns a command that stands in for FFmpeg: it waits, then writes OUTPUT.
+    """
+    script = f"import sys, time; time.sleep({seconds}); sys.stdout.buffer.write(b'x' * 1000)"
+    return lambda *args: [sys.executable, "-c", script]
+
+
+class TestTranscodeJobs(unittest.TestCase):
+    def setUp(self):
+        TranscodeJobs.jobs = {}
+        TranscodeJobs.queue = []
+        TranscodeJobs.running = 0
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.started = []
+        patches = [
+            mock.patch("app.lib.transcoder.get_ffmpeg_command", get_command(0.3)),
+            mock.patch(
+                "app.lib.transcoder.UserConfig",
+                lambda: SimpleNamespace(transcodeWorkers=1),
+            ),
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        for job in self.started:
+            job.kill()
+
+            with job.condition:
+                job.condition.wait_for(lambda: job.done, timeout=5)
+
+        self.dir.cleanup()
+
+    def start(self, key: str, attach: bool = False, part: str = ""):
+        output_path = os.path.join(self.dir.name, f"{key}{part}.part")
+        job = TranscodeJobs.get_or_start(
+            key, "input", output_path, "128k", "mp3", attach=attach
+        )
+
+        self.started.append(job)
+        return job
+
+    def test_reuses_running_job(self):
+        job = self.start("a", attach=True)
+        same = self.start("a", attach=True)
+
+        self.assertIs(job, same)
+        self.assertEqual(job.readers, 2)
+        self.assertEqual(job.state, "running")
+
+    def test_queues_beyond_workers(self):
+        first = self.start("a")
+        second = self.start("b")
+
+        self.assertEqual(first.state, "running")
+        self.assertEqual(second.state, "queued")
+
+        first.kill()
+
+        with second.condition:
+            second.condition.wait_for(lambda: second.done, timeout=5)
+
+        self.assertTrue(second.success)
+
+    def test_skips_cancelled_jobs(self):
+        running = self.start("a")
+        running.cancelled = True
+        self.assertIsNot(self.start("a", part="2"), running)
+
+        queued = self.start("b")
+        queued.state = "cancelled"
+        self.assertIsNot(self.start("b", part="2"), queued)
+        queued.finish(False)
+
+    def test_last_reader_leaving_cancels_job(self):
+        job = self.start("a", attach=True)
+        TranscodeStream(job).close()
+
+        # INFO: Marked under the scheduler lock, before FFmpeg is killed
+        self.assertTrue(job.cancelled)
+
+        retry = self.start("a", attach=True, part="2")
+        self.assertIsNot(retry, job)
+        self.assertEqual(b"".join(TranscodeStream(retry)), OUTPUT)
+
+    def test_kept_job_survives_reader_leaving(self):
+        job = self.start("a", attach=True)
+        job.keep = True
+        TranscodeStream(job).close()
+
+        self.assertFalse(job.cancelled)
+        self.assertEqual(b"".join(job.iter_chunks()), OUTPUT)
+        self.assertEqual(job.readers, 0)
+        self.assertEqual(job.priority, PRIORITY_PLAYBACK)
+
+
+if __name__ == "__main__":
+    unittest.main()